@@ -0,0 +1,172 @@
+# admin_jobs_module.py
+import itertools
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Finished jobs kept for status queries
+JOB_HISTORY = 50
+
+
+class AdminJob:
+    def __init__(self, job_id, kind, func, args, on_done, executor):
+        self.id = job_id
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._executor = executor
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Pause recognition for exactly the duration of the block (e.g. while
+        the gallery and locker files are being changed); the job fails if
+        recognition cannot be paused
+        """
+        try:
+            self._executor._pause()
+            yield
+        finally:
+            self._executor._resume()
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def __repr__(self):
+        return f"<AdminJob {self.id} {self.kind} {self.status}>"
+
+
+class AdminJobExecutor:
+    def __init__(self, master=None, pause_hook=None, resume_hook=None):
+        """
+        Single background worker for admin operations (enrollment, deletion)
+
+        :param master: Tk root used to marshal completion callbacks onto the Tk thread;
+                       if None, callbacks run on the worker thread
+        :param pause_hook: Called to pause recognition; must return once it is paused
+                           and raise if it could not be paused
+        :param resume_hook: Called to resume recognition
+        """
+        self.master = master
+        self.pause_hook = pause_hook
+        self.resume_hook = resume_hook
+
+        self._queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active = {}  # Job id -> queued or running job
+        self._history = deque(maxlen=JOB_HISTORY)
+        self._running = True
+
+        self._worker = threading.Thread(target=self._run, name="admin-jobs", daemon=True)
+        self._worker.start()
+
+    def submit(self, kind, func, *args, on_done=None):
+        """
+        Queue a job
+
+        :param kind: Job type (e.g. "enroll", "delete")
+        :param func: Callable run as func(job, *args); its return value becomes job.result
+        :param on_done: Called as on_done(job) on the Tk thread when the job finishes
+        :return: The queued AdminJob
+        """
+        job = AdminJob(next(self._ids), kind, func, args, on_done, self)
+        with self._lock:
+            self._active[job.id] = job
+        self._queue.put(job)
+        print(f"[AdminJobs] Queued job {job.id} ({kind})")
+        return job
+
+    def get(self, job_id):
+        """Look up a queued, running or recently finished job"""
+        with self._lock:
+            if job_id in self._active:
+                return self._active[job_id]
+            for job in self._history:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def pending(self, kind=None):
+        """Number of queued or running jobs, optionally of one kind"""
+        with self._lock:
+            return sum(1 for job in self._active.values() if kind is None or job.kind == kind)
+
+    def jobs(self):
+        """Snapshot of active jobs followed by recent history"""
+        with self._lock:
+            return list(self._active.values()) + list(self._history)
+
+    def shutdown(self, wait=False):
+        """Stop accepting work; queued jobs that have not started are dropped"""
+        self._running = False
+        self._queue.put(None)
+        if wait:
+            self._worker.join()
+
+    def _pause(self):
+        if self.pause_hook:
+            self.pause_hook()
+
+    def _resume(self):
+        if self.resume_hook:
+            self.resume_hook()
+
+    def _run(self):
+        while self._running:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            job.status = RUNNING
+            job.started_at = time.monotonic()
+            try:
+                job.result = job.func(job, *job.args)
+                job.status = SUCCEEDED
+            except Exception as e:
+                job.error = e
+                job.status = FAILED
+                print(f"[AdminJobs] Job {job.id} ({job.kind}) failed: {e}")
+                traceback.print_exc()
+            finally:
+                job.finished_at = time.monotonic()
+
+            with self._lock:
+                self._active.pop(job.id, None)
+                self._history.append(job)
+            print(f"[AdminJobs] Job {job.id} ({job.kind}) {job.status} in {job.duration:.2f}s")
+            self._dispatch(job)
+
+    def _dispatch(self, job):
+        """Run the completion callback on the Tk thread"""
+        if not job.on_done:
+            return
+        if self.master is not None:
+            self.master.after(0, lambda: self._call(job))
+        else:
+            self._call(job)
+
+    def _call(self, job):
+        try:
+            job.on_done(job)
+        except Exception as e:
+            print(f"[AdminJobs] Completion callback for job {job.id} failed: {e}")
+            traceback.print_exc()
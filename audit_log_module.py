@@ -0,0 +1,315 @@
+# audit_log_module.py
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import traceback
+from collections import Counter
+from datetime import datetime
+from config import (AUDIT_LOG_DIR, AUDIT_SEGMENT_BYTES, AUDIT_MAX_SEGMENTS, AUDIT_QUEUE,
+                    AUDIT_UNKNOWN_INTERVAL, AUDIT_CAMERA_ID)
+
+SEGMENT_PREFIX = "events-"
+SEGMENT_SUFFIX = ".ndjson"
+SEGMENT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+# Event types
+UNLOCK = "unlock"
+UNKNOWN = "unknown"
+
+# Latency histogram used by the query tool: 1 ms bins up to 10 s
+LATENCY_BIN = 0.001
+LATENCY_BINS = 10000
+
+
+class AuditLog:
+    def __init__(self, directory=AUDIT_LOG_DIR, segment_bytes=AUDIT_SEGMENT_BYTES,
+                 max_segments=AUDIT_MAX_SEGMENTS, queue_size=AUDIT_QUEUE, camera=AUDIT_CAMERA_ID):
+        """
+        Structured access-event log.
+
+        log() only puts a dict on a queue; a background thread serializes
+        events as NDJSON into segment files that rotate every hour or at
+        segment_bytes, whichever comes first. Segment names carry their
+        start time, so queries can skip segments outside a time range.
+
+        :param directory: Directory holding the segments
+        :param segment_bytes: Size at which a new segment is started
+        :param max_segments: Oldest segments are deleted beyond this
+        :param queue_size: Events waiting for the writer before new ones are dropped
+        :param camera: Camera name added to every event
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.camera = camera
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._segment_hour = None
+        self._unknown = None  # Pending unknown-face summary
+        self._unknown_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+
+    def log(self, event, **fields):
+        """
+        Queue an event (never blocks)
+
+        :param event: Event type, e.g. UNLOCK
+        :param fields: Event fields (identity, distance, locker, latency, ...)
+        """
+        fields.setdefault("ts", time.time())
+        fields["event"] = event
+        fields.setdefault("camera", self.camera)
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def log_unknown(self, distance=None):
+        """
+        Count an unknown face; the recognition loop sees them several times a
+        second, so they are summarized into one event per AUDIT_UNKNOWN_INTERVAL
+        (the writer thread flushes a summary once no more faces arrive)
+        """
+        now = time.time()
+        with self._unknown_lock:
+            pending = self._unknown
+            if pending is None:
+                pending = self._unknown = {"since": now, "last": now, "count": 0, "distance": None}
+            pending["last"] = now
+            pending["count"] += 1
+            if distance is not None and (pending["distance"] is None or distance < pending["distance"]):
+                pending["distance"] = distance
+        self._flush_unknown(now)
+
+    def _flush_unknown(self, now=None):
+        """
+        Log the pending unknown-face summary
+
+        :param now: Only flush once the summary is AUDIT_UNKNOWN_INTERVAL old (default: flush now)
+        """
+        with self._unknown_lock:
+            pending = self._unknown
+            if pending is None or (now is not None and now - pending["since"] < AUDIT_UNKNOWN_INTERVAL):
+                return
+            self._unknown = None
+        self.log(UNKNOWN, ts=pending["last"], count=pending["count"], distance=pending["distance"],
+                 period=round(pending["last"] - pending["since"], 3))
+
+    def _open_segment(self, now):
+        if self._file:
+            self._file.close()
+        stamp = datetime.fromtimestamp(now).strftime(SEGMENT_TIME_FORMAT)
+        # A counter keeps segments rotated within the same second apart
+        part = 0
+        while True:
+            path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{stamp}-{part:03d}{SEGMENT_SUFFIX}")
+            if not os.path.exists(path):
+                break
+            part += 1
+        self._file = open(path, "a", encoding="utf-8")
+        self._segment_hour = int(now // 3600)
+        self._prune()
+
+    def _prune(self):
+        segments = list_segments(self.directory)
+        for _, _, path in segments[:max(0, len(segments) - self.max_segments)]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"[AuditLog] Could not remove {path}: {e}")
+
+    def _write(self, events):
+        for event in events:
+            now = event["ts"]
+            if (self._file is None or int(now // 3600) != self._segment_hour or
+                    self._file.tell() >= self.segment_bytes):
+                self._open_segment(now)
+            self._file.write(json.dumps(event, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self.written += len(events)
+
+    def _run(self):
+        while True:
+            # Wake up at least once per interval to flush a pending summary
+            # after the last unknown face of a burst
+            self._flush_unknown(time.time())
+            try:
+                event = self._queue.get(timeout=AUDIT_UNKNOWN_INTERVAL)
+            except queue.Empty:
+                continue
+            if event is None:
+                break
+            # Write whatever else is already waiting in the same batch
+            events = [event]
+            while len(events) < 1000:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    self._queue.put(None)
+                    break
+                events.append(event)
+            try:
+                self._write(events)
+            except Exception as e:
+                print(f"[AuditLog] Failed to write {len(events)} event(s): {e}")
+                traceback.print_exc()
+        if self._file:
+            self._file.close()
+
+    def close(self, timeout=2.0):
+        self._flush_unknown()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+def list_segments(directory=AUDIT_LOG_DIR):
+    """
+    :return: Sorted list of (start time, part, path)
+    """
+    segments = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    for name in names:
+        if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+            continue
+        stamp, _, part = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)].rpartition("-")
+        try:
+            start = datetime.strptime(stamp, SEGMENT_TIME_FORMAT).timestamp()
+            part = int(part)
+        except ValueError:
+            continue
+        segments.append((start, part, os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def iter_events(directory=AUDIT_LOG_DIR, event=None, since=None, until=None):
+    """
+    Stream events from the segments overlapping [since, until), one line at a time
+
+    :param event: Only this event type (lines are pre-filtered before parsing)
+    :param since: Epoch seconds
+    :param until: Epoch seconds
+    """
+    segments = list_segments(directory)
+    marker = f'"event":"{event}"' if event else None
+    for i, (start, _, path) in enumerate(segments):
+        end = segments[i + 1][0] if i + 1 < len(segments) else float("inf")
+        if (since is not None and end <= since) or (until is not None and start >= until):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if marker and marker not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Partial last line of a segment being written
+                ts = record.get("ts", 0)
+                if (since is not None and ts < since) or (until is not None and ts >= until):
+                    continue
+                yield record
+
+
+def opens_per_hour(directory=AUDIT_LOG_DIR, since=None, until=None):
+    """:return: Sorted list of (hour, successful unlocks)"""
+    counts = Counter()
+    for record in iter_events(directory, UNLOCK, since, until):
+        if record.get("success"):
+            counts[datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:00")] += 1
+    return sorted(counts.items())
+
+
+def latency_percentile(percentile=95, directory=AUDIT_LOG_DIR, since=None, until=None):
+    """
+    Recognition-to-unlock latency percentile, computed from a fixed-size
+    histogram so memory does not grow with the log
+
+    :return: (latency in seconds, number of unlocks), or (None, 0)
+    """
+    histogram = [0] * (LATENCY_BINS + 1)
+    total = 0
+    for record in iter_events(directory, UNLOCK, since, until):
+        latency = record.get("latency")
+        if latency is None or not record.get("success"):
+            continue
+        histogram[min(LATENCY_BINS, int(latency / LATENCY_BIN))] += 1
+        total += 1
+    if not total:
+        return None, 0
+    target = total * percentile / 100.0
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= target:
+            return (i + 1) * LATENCY_BIN, total
+    return LATENCY_BINS * LATENCY_BIN, total
+
+
+def unknown_periods(top=10, bucket=300, directory=AUDIT_LOG_DIR, since=None, until=None):
+    """
+    Periods with the most unknown faces
+
+    :param bucket: Period length in seconds
+    :return: List of (period start as text, unknown face sightings)
+    """
+    counts = Counter()
+    for record in iter_events(directory, UNKNOWN, since, until):
+        counts[int(record["ts"] // bucket) * bucket] += record.get("count", 1)
+    return [(datetime.fromtimestamp(start).strftime("%Y-%m-%d %H:%M"), count)
+            for start, count in counts.most_common(top)]
+
+
+def _parse_time(text):
+    return datetime.fromisoformat(text).timestamp() if text else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the access-event audit log")
+    parser.add_argument("--dir", default=AUDIT_LOG_DIR, help="Audit log directory")
+    parser.add_argument("--since", help="Start time (ISO format, e.g. 2026-10-19T08:00)")
+    parser.add_argument("--until", help="End time (ISO format)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("opens", help="Successful unlocks per hour")
+    latency = commands.add_parser("latency", help="Recognition-to-unlock latency percentile")
+    latency.add_argument("--percentile", type=float, default=95)
+    unknown = commands.add_parser("unknown", help="Periods with the most unknown faces")
+    unknown.add_argument("--top", type=int, default=10)
+    unknown.add_argument("--bucket", type=int, default=300, help="Period length in seconds")
+    args = parser.parse_args(argv)
+    since, until = _parse_time(args.since), _parse_time(args.until)
+
+    if args.command == "opens":
+        rows = opens_per_hour(args.dir, since, until)
+        for hour, count in rows:
+            print(f"{hour}  {count:>5}")
+        if not rows:
+            print("No unlocks in range")
+    elif args.command == "latency":
+        value, total = latency_percentile(args.percentile, args.dir, since, until)
+        if value is None:
+            print("No unlocks with latency in range")
+        else:
+            print(f"p{args.percentile:g} recognition-to-unlock: {value * 1000:.0f} ms over {total} unlocks")
+    elif args.command == "unknown":
+        rows = unknown_periods(args.top, args.bucket, args.dir, since, until)
+        for start, count in rows:
+            print(f"{start}  {count:>6} unknown sightings")
+        if not rows:
+            print("No unknown faces in range")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
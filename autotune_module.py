@@ -0,0 +1,144 @@
+# autotune_module.py
+import os
+import time
+import threading
+from clock_module import SYSTEM_CLOCK
+from config import (AUTOTUNE_ENABLED, AUTOTUNE_LATENCY_BUDGET, AUTOTUNE_CPU_BUDGET, AUTOTUNE_WINDOW,
+                    RECOGNITION_RESIZE_FACTOR, RECOGNITION_INTERVAL,
+                    RESIZE_FACTOR_MIN, RESIZE_FACTOR_MAX, RESIZE_FACTOR_STEP,
+                    PROCESS_INTERVAL_MIN, PROCESS_INTERVAL_MAX)
+
+# Smoothing for the per-stage latency averages (higher = reacts faster)
+EWMA_ALPHA = 0.3
+# Budgets must be undershot by this margin before spending headroom
+HEADROOM = 0.75
+# Multiplier used when stretching or shrinking the cycle interval
+INTERVAL_STEP = 1.25
+
+
+class RecognitionAutotuner:
+    def __init__(self, latency_budget=AUTOTUNE_LATENCY_BUDGET, cpu_budget=AUTOTUNE_CPU_BUDGET,
+                 enabled=AUTOTUNE_ENABLED, window=AUTOTUNE_WINDOW, clock=SYSTEM_CLOCK):
+        """
+        Closed-loop controller for the recognition loop's detection
+        resolution and cycle interval
+
+        :param latency_budget: Max estimated capture-to-decision latency (seconds)
+        :param cpu_budget: Max share of total CPU this process may use (0-1)
+        :param enabled: If False, measurements are kept but settings never change
+        :param window: Seconds of measurements between adjustments
+        :param clock: Clock the measurement windows are timed with
+        """
+        self.latency_budget = latency_budget
+        self.cpu_budget = cpu_budget
+        self.enabled = enabled
+        self.window = window
+        self.clock = clock
+
+        self.resize_factor = RECOGNITION_RESIZE_FACTOR
+        self.process_interval = RECOGNITION_INTERVAL
+
+        self.stage_latency = {}  # Stage name -> smoothed latency (seconds)
+        self.cpu_load = 0.0
+        self.adjustments = 0
+        self.lock = threading.Lock()
+
+        self._cpu_count = os.cpu_count() or 1
+        self._window_start = self.clock.monotonic()
+        self._window_cpu = time.process_time()
+
+    @property
+    def estimated_latency(self):
+        """Sum of the smoothed stage latencies for a cycle that finds faces"""
+        with self.lock:
+            return sum(self.stage_latency.values())
+
+    def record_stage(self, stage, seconds):
+        """
+        Record the measured latency of one pipeline stage
+
+        :param stage: Stage name (e.g. "capture", "detect", "encode", "match")
+        :param seconds: Measured duration
+        """
+        with self.lock:
+            previous = self.stage_latency.get(stage)
+            if previous is None:
+                self.stage_latency[stage] = seconds
+            else:
+                self.stage_latency[stage] = previous + EWMA_ALPHA * (seconds - previous)
+
+    def end_cycle(self):
+        """
+        Close a recognition cycle and, once per window, adjust the settings
+
+        :return: True if the resize factor or interval changed
+        """
+        now = self.clock.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return False
+
+        cpu_now = time.process_time()
+        self.cpu_load = (cpu_now - self._window_cpu) / (elapsed * self._cpu_count)
+        self._window_start = now
+        self._window_cpu = cpu_now
+
+        if not self.enabled:
+            return False
+        return self._adjust(self.estimated_latency, self.cpu_load)
+
+    def restart_window(self):
+        """Discard the current measurement window (e.g. after the loop slept while idle)"""
+        self._window_start = self.clock.monotonic()
+        self._window_cpu = time.process_time()
+
+    def _adjust(self, latency, cpu_load):
+        """Apply one control step; returns True if anything changed"""
+        factor = self.resize_factor
+        interval = self.process_interval
+
+        over_budget = latency > self.latency_budget or cpu_load > self.cpu_budget
+        has_headroom = (latency < self.latency_budget * HEADROOM and
+                        cpu_load < self.cpu_budget * HEADROOM)
+
+        if over_budget:
+            # Keep the frame rate if possible: give up resolution first
+            if factor - RESIZE_FACTOR_STEP >= RESIZE_FACTOR_MIN - 1e-9:
+                factor -= RESIZE_FACTOR_STEP
+            else:
+                interval = min(PROCESS_INTERVAL_MAX, interval * INTERVAL_STEP)
+        elif has_headroom:
+            # Spend headroom on frame rate first, then on resolution
+            if interval > PROCESS_INTERVAL_MIN:
+                interval = max(PROCESS_INTERVAL_MIN, interval / INTERVAL_STEP)
+            elif factor + RESIZE_FACTOR_STEP <= RESIZE_FACTOR_MAX + 1e-9:
+                factor += RESIZE_FACTOR_STEP
+
+        factor = round(factor, 2)
+        interval = round(interval, 3)
+        if factor == self.resize_factor and interval == self.process_interval:
+            return False
+
+        if factor != self.resize_factor:
+            # Detection cost depends on resolution, so start its average afresh
+            with self.lock:
+                self.stage_latency.pop("detect", None)
+
+        self.resize_factor = factor
+        self.process_interval = interval
+        self.adjustments += 1
+        print(f"[Autotuner] latency={latency * 1000:.0f}ms cpu={cpu_load:.0%} -> "
+              f"resize_factor={factor} interval={interval}s")
+        return True
+
+    def stats(self):
+        """Snapshot of the current settings and measurements"""
+        with self.lock:
+            stages = dict(self.stage_latency)
+        return {
+            "resize_factor": self.resize_factor,
+            "process_interval": self.process_interval,
+            "cpu_load": self.cpu_load,
+            "stage_latency": stages,
+            "adjustments": self.adjustments,
+        }
@@ -1,21 +1,67 @@
 # camera_module.py
 import cv2
-import time
+import threading
 import traceback
 import numpy as np
+from clock_module import SYSTEM_CLOCK
+from config import (CAMERA_STALL_TIMEOUT, CAMERA_LATENCY_LIMIT, CAMERA_WATCHDOG_INTERVAL,
+                    CAMERA_RECOVERY_BACKOFF, CAMERA_RECOVERY_BACKOFF_MAX)
+
+# Camera health states reported by CameraManager.health()
+HEALTHY = "healthy"
+RECOVERING = "recovering"
+
+# Smoothing factor for the capture latency average
+LATENCY_EWMA_ALPHA = 0.2
 
 class CameraManager:
-    def __init__(self, width=800, height=480):
+    def __init__(self, width=800, height=480, clock=SYSTEM_CLOCK):
         """
         Initialize camera manager with retries
         
         :param width: Desired width of camera output
         :param height: Desired height of camera output
+        :param clock: Clock for retry sleeps, frame ages and the watchdog (sleeps on the
+                      stream and watchdog threads, so not a single-threaded VirtualClock)
         """
+        self.clock = clock
         self.picam2 = None
         self.width = width
         self.height = height
         
+        # Latest frame published by the background stream (see start_stream)
+        self._frame_lock = threading.Lock()
+        self._frame_available = threading.Condition(self._frame_lock)
+        self._latest_frame = None
+        self._frame_seq = 0
+        self._frame_time = 0.0
+        self._stream_thread = None
+        self._streaming = False
+        self._fake_frame_interval = 1.0 / 15
+        
+        # Watchdog: a stream thread only publishes frames for the camera
+        # generation it was started with, so a thread stuck in a hung capture
+        # is simply abandoned when the camera is reopened
+        self.Picamera2 = None
+        self._generation = 0
+        self._capture_started = None
+        self._stream_started = 0.0
+        self._frame_rate = None
+        self._watchdog_thread = None
+        self.state = HEALTHY
+        self.capture_latency = 0.0
+        self.stalls = 0
+        self.recoveries = 0
+        self.last_recovery_seconds = None
+        self.downtime_seconds = 0.0
+        
+        # Optional field recorder (see start_recording) and the last frame
+        # handed to capture_frame, which recognition results refer to
+        self.recorder = None
+        self._served = (0, 0.0, None)
+        # Called with the sequence number of every published frame (on the stream thread)
+        self._frame_listeners = []
+        
         # Try to import picamera2 module
         try:
             from picamera2 import Picamera2
@@ -31,42 +77,75 @@ class CameraManager:
         for attempt in range(5):
             try:
                 print(f"[CameraManager] Attempting camera init ({attempt + 1}/5)...")
-                self.picam2 = self.Picamera2()
-                time.sleep(1)  # Let system settle
-                
-                # Try to create a preview configuration
-                config = self.picam2.create_preview_configuration(
-                    main={"size": (640, 480), "format": "RGB888"}
-                )
-                
-                self.picam2.configure(config)
-                self.picam2.start(show_preview=False)
-                
-                # Take a test frame to confirm camera is working
-                test_frame = self.picam2.capture_array()
-                if test_frame is None or test_frame.size == 0:
-                    raise RuntimeError("Camera returned empty frame")
-                    
+                self.picam2 = self._open_camera()
                 print("[CameraManager] Camera initialized successfully")
                 break
                 
             except Exception as e:
                 print(f"[CameraManager] Attempt {attempt + 1} failed: {e}")
                 traceback.print_exc()
-                
-                # Close camera if it was opened
-                if self.picam2:
-                    try:
-                        self.picam2.stop()
-                    except:
-                        pass
-                    self.picam2 = None
-                    
-                time.sleep(2)  # Wait before retrying
+                self.clock.sleep(self._backoff_delay(attempt))  # Wait before retrying
         else:  # This executes if the loop completes without a break
             print("[CameraManager] Failed to initialize camera after 5 attempts")
             # Provide a fake camera for development/testing if real one isn't available
             self._use_fake_camera = True
+    
+    @staticmethod
+    def _backoff_delay(attempt):
+        """Exponential backoff between (re)initialization attempts"""
+        return min(CAMERA_RECOVERY_BACKOFF_MAX, CAMERA_RECOVERY_BACKOFF * (2 ** attempt))
+    
+    def _open_camera(self):
+        """
+        Create, configure and start a camera, and check that it delivers a frame
+        
+        :return: Running Picamera2 instance
+        :raises Exception: If any step fails (the camera is closed again)
+        """
+        camera = self.Picamera2()
+        try:
+            self.clock.sleep(1)  # Let system settle
+            
+            # Try to create a preview configuration
+            config = camera.create_preview_configuration(
+                main={"size": (640, 480), "format": "RGB888"}
+            )
+            
+            camera.configure(config)
+            camera.start(show_preview=False)
+            
+            # Take a test frame to confirm camera is working
+            test_frame = camera.capture_array()
+            if test_frame is None or test_frame.size == 0:
+                raise RuntimeError("Camera returned empty frame")
+            
+            # Restore the frame rate chosen before a reinit
+            if self._frame_rate:
+                frame_duration = int(1_000_000 / self._frame_rate)
+                camera.set_controls({"FrameDurationLimits": (frame_duration, frame_duration)})
+            return camera
+        except Exception:
+            self._close_camera(camera)
+            raise
+    
+    @staticmethod
+    def _close_camera(camera, timeout=2.0):
+        """
+        Stop and close a camera without risking a hang: a wedged driver can
+        block these calls, so they run on a helper thread that is abandoned
+        after the timeout
+        """
+        def close():
+            for method in ("stop", "close"):
+                try:
+                    getattr(camera, method)()
+                except Exception:
+                    pass
+        closer = threading.Thread(target=close, name="camera-close", daemon=True)
+        closer.start()
+        closer.join(timeout)
+        if closer.is_alive():
+            print("[CameraManager] Camera did not close in time; abandoning it")
             
     def _get_fake_frame(self):
         """Generate a fake frame with a placeholder message"""
@@ -75,16 +154,199 @@ class CameraManager:
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
         return frame
         
-    def capture_frame(self, resize_factor=1.0):
+    def start_stream(self):
+        """
+        Start a background thread that captures continuously and publishes
+        the latest frame, so several consumers can share one capture
+        """
+        if self._streaming:
+            return
+        self._streaming = True
+        self._start_stream_thread()
+        print("[CameraManager] Frame stream started")
+        
+        # Only a real camera can stall; the fake camera needs no watchdog
+        if self.Picamera2 is not None:
+            self._watchdog_thread = threading.Thread(target=self._watchdog_loop, name="camera-watchdog",
+                                                     daemon=True)
+            self._watchdog_thread.start()
+
+    def _start_stream_thread(self):
+        self._stream_started = self.clock.monotonic()
+        self._stream_thread = threading.Thread(target=self._stream_loop, args=(self._generation,),
+                                               name="camera-stream", daemon=True)
+        self._stream_thread.start()
+
+    def _stream_loop(self, generation):
+        """Capture frames until stop() is called or the camera is replaced"""
+        while self._streaming and generation == self._generation:
+            started = self.clock.monotonic()
+            self._capture_started = started
+            try:
+                frame = self._capture_raw()
+            except Exception as e:
+                print(f"[CameraManager] Stream capture failed: {e}")
+                frame = None
+            latency = self.clock.monotonic() - started
+            if generation != self._generation:
+                # The watchdog replaced the camera while this capture was blocked
+                break
+            self._capture_started = None
+            if frame is None or frame.size == 0:
+                self.clock.sleep(0.05)
+                continue
+            self.capture_latency += LATENCY_EWMA_ALPHA * (latency - self.capture_latency)
+            with self._frame_available:
+                self._latest_frame = frame
+                self._frame_seq += 1
+                self._frame_time = self.clock.monotonic()
+                self._frame_available.notify_all()
+                seq, frame_time = self._frame_seq, self._frame_time
+            for callback in self._frame_listeners:
+                callback(seq)
+            recorder = self.recorder
+            if recorder:
+                recorder.record_frame(seq, frame_time, frame)
+            if not self.picam2:
+                # The fake camera does not block, so pace it
+                self.clock.sleep(self._fake_frame_interval)
+
+    def _stall_reason(self):
+        """
+        Describe why the camera counts as stalled, or return None if it is healthy
+        """
+        now = self.clock.monotonic()
+        if not self.picam2:
+            return "camera is not open"
+        
+        started = self._capture_started
+        if started is not None and now - started > CAMERA_LATENCY_LIMIT:
+            return f"capture blocked for {now - started:.1f}s"
+        
+        # Allow a few frame periods at low frame rates
+        timeout = max(CAMERA_STALL_TIMEOUT, 3.0 / self._frame_rate if self._frame_rate else 0)
+        last_frame = max(self._frame_time, self._stream_started)
+        if now - last_frame > timeout:
+            return f"no new frame for {now - last_frame:.1f}s"
+        return None
+
+    def _watchdog_loop(self):
+        """Check camera health and reinitialize it in place when it stalls"""
+        while self._streaming:
+            self.clock.sleep(CAMERA_WATCHDOG_INTERVAL)
+            reason = self._stall_reason()
+            if reason and self._streaming:
+                self._recover(reason)
+
+    def _recover(self, reason):
+        """
+        Tear down and reopen the camera with exponential backoff; the last good
+        frame keeps being served meanwhile
+        
+        :param reason: Why the camera was considered stalled
+        """
+        self.stalls += 1
+        self.state = RECOVERING
+        stalled_since = max(self._frame_time, self._stream_started)
+        start = self.clock.monotonic()
+        print(f"[CameraManager] Camera stalled ({reason}); reinitializing (stall #{self.stalls})")
+        
+        # Abandon the current stream thread and release the camera
+        self._generation += 1
+        self._capture_started = None
+        if self.picam2:
+            self._close_camera(self.picam2)
+        
+        attempt = 0
+        while self._streaming:
+            try:
+                camera = self._open_camera()
+            except Exception as e:
+                delay = self._backoff_delay(attempt)
+                attempt += 1
+                print(f"[CameraManager] Reinit attempt {attempt} failed: {e}; retrying in {delay:.1f}s")
+                self.clock.sleep(delay)
+                continue
+            
+            self.picam2 = camera
+            self._start_stream_thread()
+            self.recoveries += 1
+            self.last_recovery_seconds = self.clock.monotonic() - start
+            self.downtime_seconds += self.clock.monotonic() - stalled_since
+            self.state = HEALTHY
+            print(f"[CameraManager] Camera recovered in {self.last_recovery_seconds:.1f}s "
+                  f"after {attempt + 1} attempt(s)")
+            return
+
+    def health(self):
+        """Camera health and stall/recovery counters"""
+        _, frame_time, _ = self.get_latest_frame()
+        return {
+            "state": self.state,
+            "frame_age": self.clock.monotonic() - frame_time if frame_time else None,
+            "capture_latency": self.capture_latency,
+            "stalls": self.stalls,
+            "recoveries": self.recoveries,
+            "last_recovery_seconds": self.last_recovery_seconds,
+            "downtime_seconds": self.downtime_seconds,
+        }
+
+    def add_frame_listener(self, callback):
+        """
+        Register a frame-available callback
+
+        :param callback: Called as callback(seq) on the stream thread; must not block
+        """
+        self._frame_listeners.append(callback)
+
+    def get_latest_frame(self):
+        """
+        Latest frame from the stream
+
+        :return: (sequence number, monotonic capture time, frame); frame is None before the
+                 first capture. Treat the frame as read-only, it is shared between consumers.
+        """
+        with self._frame_lock:
+            return self._frame_seq, self._frame_time, self._latest_frame
+
+    def wait_for_frame(self, after_seq, timeout=1.0):
+        """
+        Block until a frame newer than after_seq is published
+
+        :param after_seq: Sequence number already seen
+        :param timeout: Max seconds to wait
+        :return: Same as get_latest_frame()
+        """
+        with self._frame_available:
+            self._frame_available.wait_for(lambda: self._frame_seq > after_seq, timeout=timeout)
+            return self._frame_seq, self._frame_time, self._latest_frame
+
+    def _capture_raw(self):
+        """Capture directly from the camera (or the fake camera)"""
+        if not self.picam2:
+            if hasattr(self, '_use_fake_camera') and self._use_fake_camera:
+                return self._get_fake_frame()
+            return None
+        return self.picam2.capture_array()
+
+    def capture_frame(self, resize_factor=1.0, max_age=None):
         """
         Capture a frame from the camera
         
         :param resize_factor: Factor to resize the frame (1.0 = no resize)
+        :param max_age: While streaming, return None instead of a frame older than this
+                        (seconds); a stalled camera keeps serving its last good frame otherwise
         :return: Frame as NumPy array or None if failed
         """
         try:
+            # Share the streamed frame instead of capturing a second time
+            if self._streaming:
+                seq, frame_time, frame = self.get_latest_frame()
+                if max_age is not None and frame is not None and self.clock.monotonic() - frame_time > max_age:
+                    return None
+                self._served = (seq, frame_time, frame)
             # If camera failed to initialize, return a fake frame
-            if not self.picam2:
+            elif not self.picam2:
                 if hasattr(self, '_use_fake_camera') and self._use_fake_camera:
                     frame = self._get_fake_frame()
                 else:
@@ -112,8 +374,63 @@ class CameraManager:
             traceback.print_exc()
             return None
             
+    def start_recording(self, path=None):
+        """
+        Record the frame stream (and recognition results) to a ring file
+
+        :param path: Ring file (default RECORDER_FILE)
+        """
+        # Imported here so the recorder is only loaded when used
+        from frame_recorder_module import FrameRecorder
+        if self.recorder:
+            return self.recorder
+        self.recorder = FrameRecorder(path) if path else FrameRecorder()
+        return self.recorder
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+            print(f"[CameraManager] Recording stopped: {recorder.stats()}")
+
+    def record_results(self, faces, resize_factor=None):
+        """
+        Record recognition results for the frame last returned by capture_frame
+
+        :param faces: List of (name, (top, right, bottom, left))
+        :param resize_factor: Factor the frame was resized by for detection
+        """
+        recorder = self.recorder
+        seq, frame_time, frame = self._served
+        if recorder and frame is not None:
+            recorder.record_results(seq, frame_time, frame, faces, resize_factor)
+
+    def set_frame_rate(self, fps):
+        """
+        Change the sensor frame rate (used to save power while idle)
+
+        :param fps: Target frames per second
+        :return: True if the camera accepted the new rate
+        """
+        self._frame_rate = fps
+        if not self.picam2:
+            return False
+        try:
+            frame_duration = int(1_000_000 / fps)
+            self.picam2.set_controls({"FrameDurationLimits": (frame_duration, frame_duration)})
+            print(f"[CameraManager] Frame rate set to {fps} fps")
+            return True
+        except Exception as e:
+            print(f"[CameraManager] Failed to set frame rate: {e}")
+            return False
+
     def stop(self):
         """Stop the camera and release resources"""
+        self._streaming = False
+        self.stop_recording()
+        for thread in (self._stream_thread, self._watchdog_thread):
+            if thread and thread is not threading.current_thread():
+                thread.join(timeout=1.0)
         if self.picam2:
             try:
                 self.picam2.stop()
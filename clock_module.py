@@ -0,0 +1,125 @@
+# clock_module.py
+import time
+import heapq
+import threading
+from datetime import datetime
+
+
+class SystemClock:
+    """Real time: time.monotonic()/time.time(), real sleeps and threading.Timer callbacks"""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def call_later(self, delay, callback, *args):
+        """
+        Run callback(*args) on a timer thread after delay seconds
+
+        :return: Handle; cancel() before it fires to drop it
+        """
+        timer = threading.Timer(delay, callback, args=args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+class VirtualTimer:
+    def __init__(self, due, callback, args):
+        """Pending callback of a VirtualClock"""
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    def __init__(self, start=0.0, epoch=None):
+        """
+        Simulated time that only moves when advanced.
+
+        Drop-in for SystemClock in single-threaded simulations: sleep()
+        advances the clock instead of blocking, and timers scheduled with
+        call_later fire in order as time passes them, so hours of hold
+        times, intervals and timeouts run in as long as their callbacks take.
+        Components that sleep on threads of their own (CameraManager's stream
+        and watchdog) must keep the SystemClock: the simulator replaces them
+        with stand-ins that run on the simulation's thread instead.
+
+        :param start: Initial monotonic() reading (seconds)
+        :param epoch: Wall-clock time at start (default: now)
+        """
+        self._now = start
+        self._start = start
+        self._epoch = time.time() if epoch is None else epoch
+        self._timers = []
+        self._sequence = 0  # Keeps timers due at the same time in scheduling order
+        self._lock = threading.Lock()
+        self.fired = 0
+
+    def monotonic(self):
+        return self._now
+
+    def time(self):
+        return self._epoch + (self._now - self._start)
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def call_later(self, delay, callback, *args):
+        """
+        Run callback(*args) once the clock has advanced by delay seconds
+
+        :return: VirtualTimer; cancel() before it fires to drop it
+        """
+        timer = VirtualTimer(self._now + max(0.0, delay), callback, args)
+        with self._lock:
+            self._sequence += 1
+            heapq.heappush(self._timers, (timer.due, self._sequence, timer))
+        return timer
+
+    @property
+    def next_due(self):
+        """Time of the earliest pending timer, or None"""
+        with self._lock:
+            while self._timers and self._timers[0][2].cancelled:
+                heapq.heappop(self._timers)
+            return self._timers[0][0] if self._timers else None
+
+    def advance(self, seconds):
+        """Move the clock forward, firing every timer due on the way"""
+        self.run_until(self._now + max(0.0, seconds))
+
+    def run_until(self, deadline):
+        """
+        Fire the timers due up to deadline in order (the clock reads each
+        timer's due time while it runs), then set the clock to deadline
+        """
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0][0] > deadline:
+                    break
+                _, _, timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            self._now = max(self._now, timer.due)
+            self.fired += 1
+            timer.callback(*timer.args)
+        self._now = max(self._now, deadline)
+
+
+SYSTEM_CLOCK = SystemClock()
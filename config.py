@@ -22,3 +22,151 @@ os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
 
 # Available GPIO pins
 AVAILABLE_GPIO_PINS = [3, 5, 17]
+
+# Recognition loop tuning
+RECOGNITION_RESIZE_FACTOR = 0.2  # Starting detection resolution (fraction of camera frame)
+RECOGNITION_INTERVAL = 0.3  # Starting time between recognition cycles (seconds)
+AUTOTUNE_ENABLED = True  # Adjust resolution and interval at runtime
+AUTOTUNE_LATENCY_BUDGET = 0.25  # Max capture-to-decision latency per cycle (seconds)
+AUTOTUNE_CPU_BUDGET = 0.6  # Max share of total CPU used by this process (0-1)
+AUTOTUNE_WINDOW = 2.0  # Seconds of measurements between adjustments
+RESIZE_FACTOR_MIN = 0.15
+RESIZE_FACTOR_MAX = 0.5
+RESIZE_FACTOR_STEP = 0.05
+PROCESS_INTERVAL_MIN = 0.1
+PROCESS_INTERVAL_MAX = 1.0
+
+# Idle power management (IDLE_TIMEOUT above starts the idle state)
+DEEP_IDLE_TIMEOUT = 600  # Seconds without faces before entering deep idle
+IDLE_CHECK_INTERVAL = 1.0  # Seconds between motion checks while idle
+DEEP_IDLE_CHECK_INTERVAL = 2.5  # Seconds between motion checks in deep idle
+IDLE_DISPLAY_INTERVAL = 500  # Milliseconds between display ticks while the preview is paused
+MOTION_RESIZE_FACTOR = 0.1  # Resolution used for the idle motion check
+MOTION_PIXEL_DELTA = 25  # Grey-level change that counts a pixel as moving
+MOTION_AREA_FRACTION = 0.02  # Share of moving pixels that counts as activity
+CAMERA_ACTIVE_FPS = 30
+CAMERA_IDLE_FPS = 10
+CAMERA_DEEP_IDLE_FPS = 2
+
+# Display frame pacing
+DISPLAY_TARGET_FPS = 20  # Preview frame rate while recognition is running
+DISPLAY_KEYBOARD_FPS = 10  # Preview frame rate while the on-screen keyboard is open
+DISPLAY_MAX_RENDER_SHARE = 0.5  # Max share of Tk thread time spent rendering the preview
+
+# Burst enrollment
+ENROLL_BURST_FRAMES = 8  # Frames captured from the stream per enrollment
+ENROLL_BURST_DURATION = 0.6  # Max seconds spent collecting the burst
+ENROLL_TEMPLATES = 3  # Best frames encoded and stored per identity
+ENROLL_DETECT_SCALE = 0.5  # Resolution used to find the face in each burst frame
+ENROLL_MIN_SCORE = 0.35  # Frames scoring below this (0-1) are never enrolled
+
+# Gallery matching
+MAX_TEMPLATES_PER_IDENTITY = 5  # Oldest templates are dropped beyond this
+CENTROID_SHORTLIST = 5  # Identities whose templates are compared exactly after centroid screening
+GALLERY_STORAGE_MODE = "float64"  # "float64" (full precision), "float16", "int8" or "pq"
+PQ_SUBSPACES = 32  # Bytes per encoding in "pq" mode (must divide 128)
+COLLISION_MARGIN = 0.75  # Recommended per-identity threshold = margin * distance to the nearest other identity
+PAIRWISE_BLOCK = 2048  # Rows per block in gallery-wide distance scans (bounds memory)
+
+# Face encoder; every stored encoding is tagged with a version built from the
+# model, the enrollment profile's landmarks and jitters, and the detector
+ENCODER_MODEL = "dlib_resnet_v1"  # Embedding network
+ENCODER_DETECTOR = "hog"  # Face detector: "hog" or "cnn"
+
+# Encoder profiles: detector upsampling, face alignment ("small" = 5-point,
+# "large" = 68-point landmarks) and re-sampled encodings averaged per face.
+# Pick per hardware tier with: python encoder_profiles_module.py
+ENCODER_PROFILES = {
+    "fast": {"upsample": 0, "landmarks": "small", "jitters": 1},
+    "balanced": {"upsample": 1, "landmarks": "small", "jitters": 1},
+    "accurate": {"upsample": 2, "landmarks": "large", "jitters": 5},
+}
+LIVE_ENCODER_PROFILE = "balanced"  # Recognition loop
+ENROLL_ENCODER_PROFILE = "balanced"  # Enrollment and background re-encoding
+
+# Enrollment face crops (content-addressed, under KNOWN_FACES_DIR)
+FACE_CROP_MARGIN = 0.3  # Extra border around the face box, relative to its size
+FACE_CROP_JPEG_QUALITY = 90
+REENCODE_THROTTLE = 0.2  # Seconds slept between templates while re-encoding in the background
+
+# Micro-batched matching when several people are in view
+BATCH_MIN_FACES = 2  # With this many faces in view frames skip the interval so the match stage batches them
+
+# Camera watchdog
+CAMERA_STALL_TIMEOUT = 2.0  # Seconds without a new frame that count as a stall (stretched at low fps)
+CAMERA_LATENCY_LIMIT = 1.5  # A single capture blocked for longer than this counts as a stall
+CAMERA_WATCHDOG_INTERVAL = 0.5  # Seconds between health checks
+CAMERA_RECOVERY_BACKOFF = 0.5  # First delay between reinit attempts; doubles per failure
+CAMERA_RECOVERY_BACKOFF_MAX = 30.0
+
+# Field frame recorder (memory-mapped ring file, oldest frames overwritten)
+RECORDER_ENABLED = False  # Record the camera stream and recognition results
+RECORDER_FILE = "frames.ring"
+RECORDER_SIZE_MB = 256  # Preallocated size of the ring file
+RECORDER_CODEC = "jpeg"  # "jpeg" (small, lossy) or "zlib" (lossless, larger)
+RECORDER_JPEG_QUALITY = 80
+RECORDER_MAX_FPS = 10  # Frames recorded per second at most
+RECORDER_QUEUE = 8  # Frames waiting for the writer; further frames are dropped
+REPLAY_FILE = None  # Run the kiosk from a recording instead of the camera
+
+# Access-event audit log (NDJSON segments written by a background thread)
+AUDIT_LOG_DIR = "audit"
+AUDIT_SEGMENT_BYTES = 8 * 1024 * 1024  # Start a new segment beyond this size (and every hour)
+AUDIT_MAX_SEGMENTS = 200  # Oldest segments are deleted beyond this
+AUDIT_QUEUE = 10000  # Events waiting for the writer; further events are dropped and counted
+AUDIT_UNKNOWN_INTERVAL = 1.0  # Unknown faces are summarized into one event per interval
+AUDIT_CAMERA_ID = "kiosk"  # Camera name recorded with every event
+
+# Central matching server (kiosks send encodings, the server holds the gallery)
+MATCH_SERVER_ADDRESS = None  # e.g. "unix:/run/face_match.sock" or "10.0.0.5:7700"; None matches locally
+MATCH_SERVER_TIMEOUT = 0.25  # Seconds to wait for a response before matching locally
+MATCH_SERVER_RETRY = 5.0  # Seconds of local matching after a connection failure before reconnecting
+MATCH_SERVER_MAX_BATCH = 64  # Max probes the server matches in one call
+MATCH_SERVER_RELOAD_INTERVAL = 2.0  # Seconds between checks of the server's gallery file
+
+# Sharded gallery (matching spread across worker processes)
+GALLERY_SHARDS = 0  # Worker processes each owning part of the gallery; 0 matches in-process
+SHARD_DIR = "gallery_shards"  # Scratch shard files of galleries without a gallery file (benchmarks)
+SHARD_IMBALANCE = 1.25  # Rebalance when the largest shard exceeds the average by this factor
+SHARD_MIN_REBALANCE = 1000  # Templates per shard below which shards are never rebalanced
+
+# Gallery partitions by locker bank
+LOCKER_BANK = "main"  # Bank served by this kiosk; new lockers are assigned in it
+PARTITION_MATCHING = True  # Match against users with a locker in this bank first
+PARTITION_GLOBAL_FALLBACK = True  # Faces unknown to the bank are then searched in the whole gallery
+
+# Cache of recently recognized identities (checked before the full search)
+RECENT_CACHE_SIZE = 64  # Identities kept
+RECENT_CACHE_TTL = 8 * 3600  # Seconds an identity stays cached after it was last recognized
+RECENT_CACHE_ACCEPT = 0.35  # Max distance answered from the cache (below THRESHOLD)
+RECENT_CACHE_MARGIN = 0.08  # Required gap between the two closest cached identities
+MATCH_STATS_INTERVAL = 300  # Seconds between matching metrics written to the audit log
+
+# Event-driven runtime core
+CORE_IO_WORKERS = 2  # Threads for GPIO and timer callbacks
+LOCKER_HOLD_SECONDS = 5  # Seconds a locker stays unlocked before it closes again
+
+# Staged recognition pipeline (capture -> detect -> encode -> match -> decide -> actuate)
+# Per stage: worker count, "thread" or "process" (detect and encode only), size of its
+# drop-oldest input queue, and for match the max frames matched together
+# Threads of one process share face_recognition's dlib models behind a lock
+# per model (encoder_profiles_module), so detect and encode get one thread
+# each; for parallel detection or encoding give the stage several workers
+# in "process" mode (each process loads its own models)
+PIPELINE_STAGES = {
+    "capture": {"workers": 1, "mode": "thread", "queue": 1},
+    "detect": {"workers": 1, "mode": "thread", "queue": 2},
+    "encode": {"workers": 1, "mode": "thread", "queue": 4},
+    "match": {"workers": 1, "mode": "thread", "queue": 8, "batch": 8},
+    "decide": {"workers": 1, "mode": "thread", "queue": 8},
+    "actuate": {"workers": 1, "mode": "thread", "queue": 16},
+}
+PIPELINE_DRAIN_TIMEOUT = 5.0  # Seconds a pause waits for frames already in the pipeline
+RECOGNITION_PAUSE_TIMEOUT = 2 * PIPELINE_DRAIN_TIMEOUT + 2.0  # Seconds an admin job waits for recognition to pause before failing
+
+# On-demand sampling profiler (collapsed stacks for flame graphs)
+PROFILER_SIGNAL = "SIGUSR1"  # Signal that starts a profile of PROFILER_SECONDS; None disables
+PROFILER_SOCKET = "/tmp/face-kiosk-profiler.sock"  # Local control socket (see profiler_module.py); None disables
+PROFILER_SECONDS = 10  # Default sampling duration
+PROFILER_RATE = 100  # Default samples per second
+PROFILER_DIR = "profiles"  # Output directory
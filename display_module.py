@@ -0,0 +1,257 @@
+# display_module.py
+import time
+import traceback
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+from config import DISPLAY_TARGET_FPS, DISPLAY_MAX_RENDER_SHARE
+
+# Smoothing for the measured render time
+EWMA_ALPHA = 0.2
+# Tick callback result: nothing new to show, park until frame_ready()
+WAIT_FOR_FRAME = -1
+
+
+class FrameRenderer:
+    def __init__(self, label):
+        """
+        Renders camera frames into a Tk label without per-frame allocations.
+
+        All intermediate images live in buffers that are only reallocated
+        when the display size changes, and a single PhotoImage is updated
+        in place with paste().
+
+        :param label: Tk label that shows the video
+        """
+        self.label = label
+        self.size = None
+        self.frames_rendered = 0
+
+        self._resized = None   # BGR, display size
+        self._flipped = None   # BGR, mirrored, overlay drawn on top
+        self._rgba = None      # RGBA, shared with the PIL image below
+        self._image = None
+        self._photo = None
+
+        self._overlay_key = None
+        self._overlay = None
+        self._overlay_mask = None
+        self._overlay_region = None
+
+    def _allocate(self, width, height):
+        """(Re)allocate all buffers for a new display size"""
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+        self._flipped = np.empty((height, width, 3), dtype=np.uint8)
+        self._rgba = np.empty((height, width, 4), dtype=np.uint8)
+        # RGBA images can wrap the NumPy buffer directly without a copy
+        self._image = Image.frombuffer("RGBA", (width, height), self._rgba, "raw", "RGBA", 0, 1)
+        self._photo = ImageTk.PhotoImage(image=self._image)
+        self._overlay = np.zeros((height, width, 3), dtype=np.uint8)
+        self._overlay_mask = np.zeros((height, width, 1), dtype=bool)
+        self._overlay_key = None
+        self._overlay_region = None
+        self.size = (width, height)
+
+    def render(self, frame, width, height, faces=()):
+        """
+        Draw a camera frame (and optional face boxes) into the label
+
+        :param frame: BGR camera frame at camera resolution
+        :param width: Display width
+        :param height: Display height
+        :param faces: Sequence of (name, (top, right, bottom, left)) in camera coordinates
+        """
+        if self.size != (width, height):
+            self._allocate(width, height)
+
+        cv2.resize(frame, (width, height), dst=self._resized, interpolation=cv2.INTER_LINEAR)
+        # Mirror horizontally so the preview behaves like a mirror
+        cv2.flip(self._resized, 1, dst=self._flipped)
+
+        if faces:
+            self._apply_overlay(faces, frame.shape[:2])
+
+        cv2.cvtColor(self._flipped, cv2.COLOR_BGR2RGBA, dst=self._rgba)
+        self._photo.paste(self._image)
+
+        # Re-attach if something else (placeholder, idle screen) replaced our image
+        if self.label.cget("image") != str(self._photo):
+            self.label.configure(image=self._photo)
+            self.label.imgtk = self._photo
+        self.frames_rendered += 1
+
+    def _apply_overlay(self, faces, frame_shape):
+        """Composite the cached face overlay, rebuilding it only when the faces change"""
+        key = (tuple(faces), frame_shape)
+        if key != self._overlay_key:
+            self._build_overlay(faces, frame_shape)
+            self._overlay_key = key
+
+        if self._overlay_region is None:
+            return
+        rows, cols = self._overlay_region
+        np.copyto(self._flipped[rows, cols], self._overlay[rows, cols],
+                  where=self._overlay_mask[rows, cols])
+
+    def _build_overlay(self, faces, frame_shape):
+        """Draw boxes and names into the overlay buffer (display coordinates, mirrored)"""
+        width, height = self.size
+        frame_height, frame_width = frame_shape
+        scale_x = width / frame_width
+        scale_y = height / frame_height
+
+        self._overlay.fill(0)
+        for name, (top, right, bottom, left) in faces:
+            # Scale the coordinates according to the resized frame
+            scaled_top = int(top * scale_y)
+            scaled_bottom = int(bottom * scale_y)
+            scaled_left = int(left * scale_x)
+            scaled_right = int(right * scale_x)
+
+            # Flip horizontal positions to match the frame flip
+            flipped_left = width - scaled_right
+            flipped_right = width - scaled_left
+
+            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+            cv2.rectangle(self._overlay, (flipped_left, scaled_top), (flipped_right, scaled_bottom), color, 2)
+            cv2.putText(self._overlay, name, (flipped_left, scaled_top - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+
+        mask = self._overlay_mask[..., 0]
+        np.any(self._overlay, axis=2, out=mask)
+
+        # Only composite the bounding region that actually has overlay pixels
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if rows.size == 0:
+            self._overlay_region = None
+        else:
+            self._overlay_region = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+
+
+class FramePacer:
+    def __init__(self, master, tick_callback, target_fps=DISPLAY_TARGET_FPS,
+                 max_render_share=DISPLAY_MAX_RENDER_SHARE):
+        """
+        Vsync-style scheduler for display ticks on the Tk thread.
+
+        Only one tick is ever pending. Ticks are aligned to a fixed period
+        derived from the target FPS and the measured render time; if a tick
+        runs late the missed slots are dropped instead of being caught up.
+
+        :param master: Tk root used for after()
+        :param tick_callback: Called once per tick; may return a minimum delay (ms) before the
+                              next tick, None to keep the normal pace, or WAIT_FOR_FRAME to
+                              park the pacer until frame_ready() is called
+        :param target_fps: Desired display frame rate
+        :param max_render_share: Max share of Tk thread time the callback may use
+        """
+        self.master = master
+        self.tick_callback = tick_callback
+        self.target_fps = target_fps
+        self.max_render_share = max_render_share
+
+        self.render_time = 0.0  # Smoothed callback duration (seconds)
+        self.ticks = 0
+        self.dropped = 0
+
+        self._after_id = None
+        self._next_due = None
+        self._running = False
+        self.waiting_for_frame = False
+
+    @property
+    def period(self):
+        """Current tick period: the target rate, slowed down if rendering is too expensive"""
+        return max(1.0 / self.target_fps, self.render_time / self.max_render_share)
+
+    def set_target_fps(self, fps):
+        self.target_fps = fps
+
+    def start(self):
+        self._running = True
+        self.wake()
+
+    def stop(self):
+        self._running = False
+        self._cancel()
+
+    def wake(self):
+        """Run a tick as soon as possible (e.g. when the preview resumes)"""
+        if not self._running:
+            return
+        self._next_due = None
+        self.waiting_for_frame = False
+        self._schedule(0)
+
+    def frame_ready(self):
+        """A new frame arrived: resume a parked pacer at its next slot (Tk thread)"""
+        if not self._running or not self.waiting_for_frame:
+            return
+        self.waiting_for_frame = False
+        now = time.perf_counter()
+        if self._next_due is None or self._next_due < now:
+            self._next_due = now
+        self._schedule((self._next_due - now) * 1000)
+
+    def _cancel(self):
+        if self._after_id is not None:
+            try:
+                self.master.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _schedule(self, delay_ms):
+        self._cancel()
+        self._after_id = self.master.after(max(0, int(delay_ms)), self._tick)
+
+    def _tick(self):
+        self._after_id = None
+        if not self._running:
+            return
+
+        start = time.perf_counter()
+        period = self.period
+        if self._next_due is None:
+            self._next_due = start
+        elif start - self._next_due > period:
+            # Late by at least one slot: drop the missed frames and re-align
+            self.dropped += int((start - self._next_due) / period)
+            self._next_due = start
+
+        min_delay = None
+        try:
+            min_delay = self.tick_callback()
+        except Exception as e:
+            print(f"[FramePacer] Tick error: {e}")
+            traceback.print_exc()
+            min_delay = 1000
+        finally:
+            elapsed = time.perf_counter() - start
+            self.render_time += EWMA_ALPHA * (elapsed - self.render_time)
+            self.ticks += 1
+
+        if not self._running:
+            return
+
+        self._next_due += self.period
+        if min_delay == WAIT_FOR_FRAME:
+            # No timer until the next frame arrives
+            self.waiting_for_frame = True
+            return
+        now = time.perf_counter()
+        delay_ms = (self._next_due - now) * 1000
+        if min_delay is not None and min_delay > delay_ms:
+            delay_ms = min_delay
+            self._next_due = now + min_delay / 1000.0
+        self._schedule(delay_ms)
+
+    def stats(self):
+        return {
+            "target_fps": self.target_fps,
+            "effective_fps": 1.0 / self.period,
+            "render_ms": self.render_time * 1000,
+            "ticks": self.ticks,
+            "dropped": self.dropped,
+        }
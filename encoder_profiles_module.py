@@ -0,0 +1,255 @@
+# encoder_profiles_module.py
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+import face_recognition
+from face_store_module import encoder_version
+from gallery_module import _block_distances
+from config import (ENCODER_PROFILES, ENCODER_DETECTOR, LIVE_ENCODER_PROFILE,
+                    ENROLL_ENCODER_PROFILE, ENCODINGS_FILE, THRESHOLD, AUTOTUNE_LATENCY_BUDGET, PAIRWISE_BLOCK)
+
+# Share of genuine pairs allowed above THRESHOLD before a profile is considered too lossy
+MAX_FALSE_REJECT = 0.05
+# Impostor distances are counted in bins of this width up to IMPOSTOR_RANGE
+# (their number grows with the square of the dataset)
+IMPOSTOR_BIN = 0.001
+IMPOSTOR_RANGE = 2.0
+
+# face_recognition keeps one dlib face detector, landmark predictor and
+# encoder network per process, and dlib does not document them as safe for
+# concurrent use. Every thread goes through these locks: one for the
+# detectors, one for the landmark predictors and the encoder, so detection
+# and encoding of different frames can still overlap. Stages in process
+# mode load their own models.
+DETECTOR_LOCK = threading.Lock()
+ENCODER_LOCK = threading.Lock()
+
+
+class EncoderProfile:
+    def __init__(self, name, upsample, landmarks, jitters, detector=ENCODER_DETECTOR):
+        """
+        One detector/encoder configuration
+
+        :param name: Profile name
+        :param upsample: Times the image is upsampled before detection (finds smaller faces, slower)
+        :param landmarks: "small" (5-point) or "large" (68-point) face alignment
+        :param jitters: Re-sampled encodings averaged per face (more stable, linearly slower)
+        :param detector: "hog" or "cnn"
+        """
+        self.name = name
+        self.upsample = upsample
+        self.landmarks = landmarks
+        self.jitters = jitters
+        self.detector = detector
+
+    @property
+    def version(self):
+        """Version tag of encodings produced with this profile"""
+        return encoder_version(landmarks=self.landmarks, jitters=self.jitters, detector=self.detector)
+
+    def locate(self, rgb):
+        with DETECTOR_LOCK:
+            return face_recognition.face_locations(rgb, number_of_times_to_upsample=self.upsample,
+                                                   model=self.detector)
+
+    def encode(self, rgb, locations):
+        with ENCODER_LOCK:
+            return face_recognition.face_encodings(rgb, locations, num_jitters=self.jitters,
+                                                   model=self.landmarks)
+
+    def __repr__(self):
+        return (f"<EncoderProfile {self.name} upsample={self.upsample} landmarks={self.landmarks} "
+                f"jitters={self.jitters}>")
+
+
+def get_profile(name):
+    """
+    :param name: Key of ENCODER_PROFILES
+    :raises ValueError: For an unknown profile
+    """
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile: {name} (choose from {', '.join(ENCODER_PROFILES)})")
+    return EncoderProfile(name, **ENCODER_PROFILES[name])
+
+
+def live_profile():
+    return get_profile(LIVE_ENCODER_PROFILE)
+
+
+def enroll_profile():
+    return get_profile(ENROLL_ENCODER_PROFILE)
+
+
+def load_dataset(encodings_file=ENCODINGS_FILE, limit=None):
+    """
+    Labelled face crops kept by enrollment (the replay set for calibration)
+
+    :return: List of (name, RGB crop)
+    """
+    # Imported here so profiles can be used without the gallery stack
+    from face_recognition_module import FaceRecognitionManager
+    manager = FaceRecognitionManager(encodings_file, shards=0)
+    dataset = []
+    seen = set()
+    for name, record in zip(manager.known_names, manager.known_meta):
+        if record["crop"] is None or record["crop"] in seen:
+            continue
+        rgb = manager.face_store.load(record["crop"])
+        if rgb is not None:
+            seen.add(record["crop"])
+            dataset.append((name, rgb))
+        if limit and len(dataset) >= limit:
+            break
+    return dataset
+
+
+def calibrate(profile, dataset, threshold=THRESHOLD, block_size=PAIRWISE_BLOCK):
+    """
+    Run one profile over a labelled dataset
+
+    :param profile: EncoderProfile
+    :param dataset: List of (name, RGB image)
+    :param threshold: Match threshold used for the error rates
+    :param block_size: Encodings per block of the pairwise distance scan
+    :return: Dict with latency percentiles, detection rate and distance statistics
+             (impostor_p5 to within IMPOSTOR_BIN)
+    """
+    detect_times, encode_times = [], []
+    names, encodings = [], []
+    for name, rgb in dataset:
+        start = time.perf_counter()
+        locations = profile.locate(rgb)
+        detect_times.append(time.perf_counter() - start)
+        if not locations:
+            continue
+        location = max(locations, key=lambda l: (l[2] - l[0]) * (l[1] - l[3]))
+        start = time.perf_counter()
+        encoded = profile.encode(rgb, [location])
+        encode_times.append(time.perf_counter() - start)
+        if encoded:
+            names.append(name)
+            encodings.append(encoded[0])
+
+    report = {
+        "profile": profile.name,
+        "images": len(dataset),
+        "detected": len(encodings) / max(1, len(dataset)),
+        "detect_p50": float(np.percentile(detect_times, 50)) if detect_times else 0.0,
+        "detect_p95": float(np.percentile(detect_times, 95)) if detect_times else 0.0,
+        "encode_p50": float(np.percentile(encode_times, 50)) if encode_times else 0.0,
+        "encode_p95": float(np.percentile(encode_times, 95)) if encode_times else 0.0,
+    }
+
+    genuine, impostor_bins, false_accepts = _pair_distances(encodings, names, threshold, block_size)
+    impostors = int(impostor_bins.sum())
+    impostor_p5 = None
+    if impostors:
+        bin_index = int(np.searchsorted(np.cumsum(impostor_bins), 0.05 * impostors))
+        impostor_p5 = (bin_index + 0.5) * IMPOSTOR_BIN
+
+    report.update({
+        "genuine_mean": float(genuine.mean()) if len(genuine) else None,
+        "genuine_p95": float(np.percentile(genuine, 95)) if len(genuine) else None,
+        "impostor_p5": impostor_p5,
+        "false_reject": float((genuine > threshold).mean()) if len(genuine) else None,
+        "false_accept": false_accepts / impostors if impostors else None,
+    })
+    return report
+
+
+def _pair_distances(encodings, names, threshold, block_size):
+    """
+    Blocked scan over every pair of encodings (memory bounded by block_size^2)
+
+    :return: (genuine distances, impostor distance counts per IMPOSTOR_BIN,
+              impostor pairs within threshold)
+    """
+    matrix = np.asarray(encodings, dtype=np.float64).reshape(len(encodings), -1)
+    labels = np.asarray(names)
+    count = len(matrix)
+    genuine = []
+    impostor_bins = np.zeros(int(round(IMPOSTOR_RANGE / IMPOSTOR_BIN)), dtype=np.int64)
+    false_accepts = 0
+    for i0 in range(0, count, block_size):
+        i1 = min(i0 + block_size, count)
+        for j0 in range(i0, count, block_size):
+            j1 = min(j0 + block_size, count)
+            distances = _block_distances(matrix[i0:i1], matrix[j0:j1])
+            same = labels[i0:i1, None] == labels[None, j0:j1]
+            # Each pair once: only the upper triangle of diagonal blocks
+            upper = np.arange(i0, i1)[:, None] < np.arange(j0, j1)[None, :]
+            genuine.append(distances[same & upper])
+            impostor = distances[~same & upper]
+            false_accepts += int((impostor <= threshold).sum())
+            bins = np.minimum((impostor / IMPOSTOR_BIN).astype(np.int64), len(impostor_bins) - 1)
+            impostor_bins += np.bincount(bins, minlength=len(impostor_bins))
+    genuine = np.concatenate(genuine) if genuine else np.empty(0)
+    return genuine, impostor_bins, false_accepts
+
+
+def recommend(reports, budget=AUTOTUNE_LATENCY_BUDGET):
+    """
+    Fastest profile that fits the latency budget without losing accuracy
+
+    :param reports: Output of calibrate() for each profile
+    :param budget: Max p95 detect + encode latency per face (seconds)
+    :return: Profile name, or None if none fits
+    """
+    def acceptable(report):
+        within_budget = report["detect_p95"] + report["encode_p95"] <= budget
+        accurate = (report["false_reject"] is None or report["false_reject"] <= MAX_FALSE_REJECT) and \
+                   not report["false_accept"]
+        return within_budget and accurate
+
+    candidates = [r for r in reports if acceptable(r)]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda r: r["detect_p95"] + r["encode_p95"])["profile"]
+
+
+def _fmt(value, spec=".3f"):
+    return "-" if value is None else format(value, spec)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure latency and match distances of each encoder profile")
+    parser.add_argument("--file", default=ENCODINGS_FILE, help="Gallery whose enrollment crops are replayed")
+    parser.add_argument("--profile", choices=sorted(ENCODER_PROFILES), action="append",
+                        help="Profile(s) to measure (default: all)")
+    parser.add_argument("--limit", type=int, help="Use at most this many crops")
+    parser.add_argument("--budget", type=float, default=AUTOTUNE_LATENCY_BUDGET,
+                        help="Per-face latency budget for the recommendation (seconds)")
+    args = parser.parse_args(argv)
+
+    dataset = load_dataset(args.file, args.limit)
+    identities = len({name for name, _ in dataset})
+    if not dataset:
+        print("No stored face crops to replay; enroll some users first")
+        return 1
+    print(f"Replaying {len(dataset)} crop(s) of {identities} people\n")
+
+    reports = []
+    for name in args.profile or list(ENCODER_PROFILES):
+        report = calibrate(get_profile(name), dataset)
+        reports.append(report)
+        print(f"{name:<9} detect p50/p95 {report['detect_p50'] * 1000:6.1f}/{report['detect_p95'] * 1000:6.1f} ms  "
+              f"encode p50/p95 {report['encode_p50'] * 1000:6.1f}/{report['encode_p95'] * 1000:6.1f} ms  "
+              f"found {report['detected']:.0%}")
+        print(f"{'':<9} genuine mean {_fmt(report['genuine_mean'])} p95 {_fmt(report['genuine_p95'])}  "
+              f"impostor p5 {_fmt(report['impostor_p5'])}  "
+              f"FRR {_fmt(report['false_reject'], '.1%')}  FAR {_fmt(report['false_accept'], '.1%')}")
+
+    choice = recommend(reports, args.budget)
+    print()
+    if choice:
+        print(f"Recommended profile for this hardware: {choice} "
+              f"(set LIVE_ENCODER_PROFILE / ENROLL_ENCODER_PROFILE in config.py)")
+    else:
+        print(f"No profile fits a {args.budget * 1000:.0f} ms budget without losing accuracy")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
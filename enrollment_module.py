@@ -0,0 +1,193 @@
+# enrollment_module.py
+import math
+import time
+import traceback
+import cv2
+import numpy as np
+import face_recognition
+from config import (ENROLL_BURST_FRAMES, ENROLL_BURST_DURATION, ENROLL_TEMPLATES, ENROLL_DETECT_SCALE,
+                    ENROLL_MIN_SCORE)
+from encoder_profiles_module import enroll_profile, ENCODER_LOCK
+
+# Laplacian variance treated as "fully sharp"
+SHARPNESS_REFERENCE = 150.0
+# Face area (share of the frame) treated as "close enough"
+TARGET_FACE_FRACTION = 0.08
+# Pose limits beyond which a frame scores zero for pose
+MAX_YAW = 0.5  # Nose offset from the eye midpoint, relative to eye distance
+MAX_ROLL_DEGREES = 30.0
+# Weights of the individual quality measures
+SCORE_WEIGHTS = {"sharpness": 0.4, "size": 0.3, "pose": 0.3}
+
+
+class EnrollmentError(Exception):
+    """Raised when a burst does not contain a usable face"""
+
+
+class FrameScore:
+    def __init__(self, index, rgb, location, sharpness, size, pose):
+        self.index = index
+        self.rgb = rgb
+        self.location = location
+        self.sharpness = sharpness
+        self.size = size
+        self.pose = pose
+        self.score = (SCORE_WEIGHTS["sharpness"] * sharpness +
+                      SCORE_WEIGHTS["size"] * size +
+                      SCORE_WEIGHTS["pose"] * pose)
+        if pose == 0.0:
+            # A profile or strongly tilted face never makes a good template
+            self.score = 0.0
+
+    def __repr__(self):
+        return (f"<FrameScore #{self.index} score={self.score:.2f} sharp={self.sharpness:.2f} "
+                f"size={self.size:.2f} pose={self.pose:.2f}>")
+
+
+class BurstEnroller:
+    def __init__(self, camera_manager, burst_frames=ENROLL_BURST_FRAMES, burst_duration=ENROLL_BURST_DURATION,
+                 templates=ENROLL_TEMPLATES, profile=None):
+        """
+        Enrollment from a short burst of frames instead of a single capture.
+
+        Frames are scored and encoded one after another on the calling
+        thread: the dlib models are shared with the live recognition stages
+        (see encoder_profiles_module), so more threads would only queue on them.
+
+        :param camera_manager: CameraManager with a running frame stream
+        :param burst_frames: Number of distinct frames to collect
+        :param burst_duration: Max seconds spent collecting
+        :param templates: Number of best frames to encode
+        :param profile: EncoderProfile (default: ENROLL_ENCODER_PROFILE)
+        """
+        self.camera_manager = camera_manager
+        self.burst_frames = burst_frames
+        self.burst_duration = burst_duration
+        self.templates = templates
+        self.profile = profile or enroll_profile()
+
+    def capture_burst(self):
+        """
+        Collect distinct frames from the camera stream
+
+        :return: List of BGR frames
+        """
+        frames = []
+        seq, _, frame = self.camera_manager.get_latest_frame()
+        if frame is not None:
+            frames.append(frame)
+
+        deadline = time.monotonic() + self.burst_duration
+        while len(frames) < self.burst_frames:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            new_seq, _, frame = self.camera_manager.wait_for_frame(seq, timeout=remaining)
+            if new_seq == seq or frame is None:
+                continue
+            seq = new_seq
+            frames.append(frame)
+        return frames
+
+    def score_frame(self, index, frame):
+        """
+        Find the largest face in a frame and rate it
+
+        :param index: Position of the frame in the burst
+        :param frame: BGR frame
+        :return: FrameScore, or None if no face was found
+        """
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+        # Detect on a reduced copy, then map back to full resolution
+        small = cv2.resize(rgb, None, fx=ENROLL_DETECT_SCALE, fy=ENROLL_DETECT_SCALE,
+                           interpolation=cv2.INTER_AREA)
+        locations = self.profile.locate(small)
+        if not locations:
+            return None
+
+        scale = 1.0 / ENROLL_DETECT_SCALE
+        height, width = rgb.shape[:2]
+        top, right, bottom, left = max(locations, key=lambda l: (l[2] - l[0]) * (l[1] - l[3]))
+        location = (max(0, int(top * scale)), min(width, int(right * scale)),
+                    min(height, int(bottom * scale)), max(0, int(left * scale)))
+        top, right, bottom, left = location
+
+        face_area = (bottom - top) * (right - left)
+        size = min(1.0, face_area / (height * width * TARGET_FACE_FRACTION))
+
+        gray = cv2.cvtColor(rgb[top:bottom, left:right], cv2.COLOR_RGB2GRAY)
+        sharpness = min(1.0, cv2.Laplacian(gray, cv2.CV_64F).var() / SHARPNESS_REFERENCE)
+
+        with ENCODER_LOCK:
+            landmarks = face_recognition.face_landmarks(rgb, [location], model="small")
+        pose = self._pose_score(landmarks[0]) if landmarks else 0.0
+
+        return FrameScore(index, rgb, location, sharpness, size, pose)
+
+    @staticmethod
+    def _pose_score(landmarks):
+        """
+        Rate how frontal a face is from the 5-point landmarks
+
+        :param landmarks: Dict from face_recognition.face_landmarks(model="small")
+        :return: 1.0 for a frontal, level face, down to 0.0 at the pose limits
+        """
+        try:
+            left_eye = np.mean(landmarks["left_eye"], axis=0)
+            right_eye = np.mean(landmarks["right_eye"], axis=0)
+            nose = np.asarray(landmarks["nose_tip"][0], dtype=float)
+        except (KeyError, IndexError):
+            return 0.0
+
+        eye_vector = right_eye - left_eye
+        eye_distance = np.linalg.norm(eye_vector)
+        if eye_distance < 1:
+            return 0.0
+
+        roll = abs(math.degrees(math.atan2(eye_vector[1], eye_vector[0])))
+        roll = min(roll, 180 - roll)  # Eye order does not matter
+        yaw = abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance
+
+        return max(0.0, 1 - yaw / MAX_YAW) * max(0.0, 1 - roll / MAX_ROLL_DEGREES)
+
+    def enroll(self):
+        """
+        Capture a burst, score all frames and encode the best ones
+
+        :return: (list of face encodings, list of the FrameScores that were encoded)
+        :raises EnrollmentError: If no frame is good enough
+        """
+        start = time.monotonic()
+        frames = self.capture_burst()
+        if not frames:
+            raise EnrollmentError("Failed to capture image. Please try again.")
+
+        scores = [self._safe_score(index, frame) for index, frame in enumerate(frames)]
+        candidates = [s for s in scores if s is not None]
+        if not candidates:
+            raise EnrollmentError("No face detected. Try again.")
+
+        best = sorted((s for s in candidates if s.score >= ENROLL_MIN_SCORE),
+                      key=lambda s: s.score, reverse=True)[:self.templates]
+        if not best:
+            raise EnrollmentError("Face not clear enough. Look at the camera and hold still.")
+
+        encodings = [self.profile.encode(s.rgb, [s.location]) for s in best]
+
+        selected = [(e[0], s) for e, s in zip(encodings, best) if e]
+        if not selected:
+            raise EnrollmentError("Could not encode face. Try again with better lighting.")
+
+        print(f"[BurstEnroller] {len(frames)} frames, {len(candidates)} with a face, "
+              f"{len(selected)} encoded in {time.monotonic() - start:.2f}s: "
+              f"{[round(s.score, 2) for _, s in selected]}")
+        return [e for e, _ in selected], [s for _, s in selected]
+
+    def _safe_score(self, index, frame):
+        try:
+            return self.score_frame(index, frame)
+        except Exception as e:
+            print(f"[BurstEnroller] Failed to score frame {index}: {e}")
+            traceback.print_exc()
+            return None
@@ -0,0 +1,251 @@
+# event_core_module.py
+import asyncio
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from config import CORE_IO_WORKERS
+
+
+class TimerHandle:
+    def __init__(self, loop):
+        """Cancellable handle of a timer scheduled from any thread"""
+        self._loop = loop
+        self._handle = None
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+        if self._handle is not None:
+            self._loop.call_soon_threadsafe(self._handle.cancel)
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+
+class AsyncFlag:
+    def __init__(self, loop, value=False):
+        """
+        Boolean state that any thread can set or clear and coroutines can await.
+
+        set/clear/is_set match threading.Event, so it can replace one.
+
+        :param loop: Event loop the waiting coroutines run on
+        :param value: Initial state
+        """
+        self._loop = loop
+        self._value = value
+        self._set = asyncio.Event()
+        self._clear = asyncio.Event()
+        self._sync()
+
+    def _sync(self):
+        if self._value:
+            self._clear.clear()
+            self._set.set()
+        else:
+            self._set.clear()
+            self._clear.set()
+
+    def _update(self, value):
+        self._value = value
+        if self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._sync()
+        else:
+            self._loop.call_soon_threadsafe(self._sync)
+
+    def set(self):
+        self._update(True)
+
+    def clear(self):
+        self._update(False)
+
+    def is_set(self):
+        return self._value
+
+    async def wait_set(self, timeout=None):
+        """:return: True once set, False on timeout"""
+        return await _wait_event(self._set, timeout)
+
+    async def wait_clear(self, timeout=None):
+        """:return: True once cleared, False on timeout"""
+        return await _wait_event(self._clear, timeout)
+
+
+async def _wait_event(event, timeout):
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def _wait_any(events, timeout):
+    """Wait until any of the asyncio events is set, or timeout"""
+    waiters = [asyncio.ensure_future(event.wait()) for event in events]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+class FrameSignal:
+    def __init__(self, loop):
+        """
+        Frame-available events from the camera thread, awaitable by sequence number
+
+        :param loop: Event loop the waiting coroutines run on
+        """
+        self._loop = loop
+        self.seq = 0
+        self._next = asyncio.Event()
+
+    def notify(self, seq):
+        """Called by the camera thread after publishing frame seq"""
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._publish, seq)
+
+    def _publish(self, seq):
+        if seq > self.seq:
+            self.seq = seq
+            # Wake everyone waiting on the previous frame; later waiters get a fresh event
+            self._next.set()
+            self._next = asyncio.Event()
+
+    async def wait_after(self, seq, timeout=None, interrupt=None):
+        """
+        Wait for a frame newer than seq
+
+        :param interrupt: Optional AsyncFlag that ends the wait once set
+        :return: The newest sequence number, or None on timeout or interrupt
+        """
+        loop_time = self._loop.time
+        deadline = None if timeout is None else loop_time() + timeout
+        while self.seq <= seq:
+            if interrupt is not None and interrupt.is_set():
+                return None
+            remaining = None if deadline is None else deadline - loop_time()
+            if remaining is not None and remaining <= 0:
+                return None
+            if interrupt is None:
+                await _wait_event(self._next, remaining)
+            else:
+                await _wait_any((self._next, interrupt._set), remaining)
+        return self.seq
+
+
+class AsyncCore:
+    def __init__(self, io_workers=CORE_IO_WORKERS):
+        """
+        asyncio event loop on its own thread that drives the kiosk runtime.
+
+        Coroutines wait on events (new frames, pause state, timers) instead
+        of polling. GPIO and other short blocking calls are offloaded to the
+        I/O executor; detection, encoding and matching run on the workers of
+        the recognition pipeline (pipeline_module.py).
+
+        :param io_workers: Threads for GPIO and timer callbacks
+        """
+        self.loop = asyncio.new_event_loop()
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="core-io")
+        self._thread = threading.Thread(target=self._run, name="core-loop", daemon=True)
+        self._started = threading.Event()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def submit(self, coro):
+        """
+        Run a coroutine on the loop (from any thread)
+
+        :return: concurrent.futures.Future of its result
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(_report_failure)
+        return future
+
+    def call_later(self, delay, callback, *args):
+        """
+        Run callback(*args) on the I/O executor after delay seconds (from any thread)
+
+        :return: TimerHandle; cancel() before it fires to drop it
+        """
+        timer = TimerHandle(self.loop)
+
+        def schedule():
+            if not timer.cancelled:
+                timer._handle = self.loop.call_later(delay, fire)
+
+        def fire():
+            if not timer.cancelled:
+                self.loop.run_in_executor(self.io_executor, callback, *args).add_done_callback(_report_failure)
+
+        self.loop.call_soon_threadsafe(schedule)
+        return timer
+
+    async def io(self, func, *args):
+        """Await a blocking I/O call (GPIO, files) on the I/O executor"""
+        return await self.loop.run_in_executor(self.io_executor, func, *args)
+
+    def flag(self, value=False):
+        return AsyncFlag(self.loop, value)
+
+    def frame_signal(self):
+        return FrameSignal(self.loop)
+
+    def stop(self, timeout=2.0):
+        """Cancel all tasks and stop the loop"""
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.running:
+            try:
+                asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout)
+            except Exception as e:
+                print(f"[AsyncCore] Shutdown did not finish cleanly: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+        self.io_executor.shutdown(wait=False)
+
+
+def _report_failure(future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        print(f"[AsyncCore] Task failed: {error}")
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+
+class TkBridge:
+    def __init__(self, master):
+        """
+        Hands work from the asyncio core and worker threads to the Tk main loop
+
+        :param master: Tk root; Tk calls must happen on its thread
+        """
+        self.master = master
+
+    def call(self, func, *args):
+        """Run func(*args) on the Tk thread (from any thread, without waiting)"""
+        self.master.after(0, func, *args)
@@ -1,20 +1,278 @@
 # face_recognition_module.py
-import face_recognition
 import numpy as np
 import pickle
 import os
 import cv2
 import traceback
-from config import ENCODINGS_FILE, THRESHOLD, KNOWN_FACES_DIR
+from config import (ENCODINGS_FILE, THRESHOLD, KNOWN_FACES_DIR, MAX_TEMPLATES_PER_IDENTITY, GALLERY_STORAGE_MODE,
+                    MATCH_SERVER_ADDRESS, GALLERY_SHARDS, LOCKER_BANK, PARTITION_GLOBAL_FALLBACK)
+from gallery_module import GalleryIndex
+from quantization_module import EncodingStore, create_codec, codec_from_state
+from user_index_module import write_user_index
+from face_store_module import FaceCropStore, template_record, encoder_version, UNVERSIONED
+from recent_cache_module import RecentIdentityCache
+from clock_module import SYSTEM_CLOCK
+
+# Directory of a sharded gallery's shard files, next to its gallery file
+SHARDS_SUFFIX = ".shards"
 
 class FaceRecognitionManager:
-    def __init__(self, encodings_file=ENCODINGS_FILE):
+    def __init__(self, encodings_file=ENCODINGS_FILE, storage_mode=GALLERY_STORAGE_MODE, clock=SYSTEM_CLOCK,
+                 match_server=MATCH_SERVER_ADDRESS, shards=GALLERY_SHARDS):
+        """
+        :param encodings_file: Gallery file
+        :param storage_mode: Template storage mode (see GALLERY_STORAGE_MODE; not used with shards)
+        :param clock: Clock for the recent-identity cache
+        :param match_server: Address of a central matching server; None matches locally
+                             (the server itself always does)
+        :param shards: Shard worker processes holding the gallery; 0 keeps it in this process.
+                       The shard files are then the stored gallery: they live in
+                       encodings_file + ".shards" and the gallery file lists them.
+        """
+        # One entry per template; an identity may have several entries.
+        # known_encodings is a list of arrays at full precision, or an
+        # EncodingStore (one compact code matrix) in the other storage modes;
+        # with shards it is None and the templates live in the shard files.
         self.known_encodings = []
         self.known_names = []
+        # Per-template metadata (crop digest, face location, encoder version)
+        self.known_meta = []
+        self.face_store = FaceCropStore(KNOWN_FACES_DIR)
+        self.storage_mode = storage_mode
+        self.codec = create_codec(storage_mode)
+        self.index = GalleryIndex([], [])
+        # With shards, matching and enrollment checks run in shard worker
+        # processes and the local index stays empty
+        self.shards = None
+        if shards:
+            # Imported here so single-process kiosks never start workers
+            from sharded_gallery_module import ShardedGallery
+            self.shards = ShardedGallery(shards, directory=encodings_file + SHARDS_SUFFIX)
+        # Local partition: the identities with a locker in this kiosk's bank,
+        # matched before (or instead of) the whole gallery
+        self.partition_names = None
+        self.partition = None
+        self.partition_hits = 0
+        self.global_hits = 0
+        # Recently recognized identities, answered without the full search
+        # (expiry follows the injected clock, so simulations can age it)
+        self.recent = RecentIdentityCache(clock=clock)
         self.encodings_file = encodings_file
         self.load_encodings(encodings_file)
         self.encodings_path = ENCODINGS_FILE  # <-- Add this line
+        # Matching is delegated to a central server when one is configured;
+        # the local gallery stays loaded as the fallback
+        self.remote = None
+        self.remote_fallbacks = 0
+        if match_server:
+            # Imported here so kiosks matching locally never open a socket
+            from matching_service_module import MatchClient
+            self.remote = MatchClient(match_server)
+
+    @property
+    def compact(self):
+        """True if the gallery is currently held in a compact storage mode"""
+        return isinstance(self.known_encodings, EncodingStore)
+
+    def _apply_storage_mode(self):
+        """Convert a full-precision gallery to the configured compact mode when possible"""
+        if self.codec is None or self.compact or self.shards is not None:
+            return
+        count = len(self.known_encodings)
+        if count and (self.codec.fitted or self.codec.can_fit(count)):
+            self.known_encodings = EncodingStore.from_encodings(self.codec, self.known_encodings)
+            print(f"Gallery stored as {self.storage_mode} ({self.known_encodings.nbytes} bytes of codes)")
+
+    def _take(self, indices):
+        """Encodings at the given positions, in the gallery's current storage form"""
+        if self.compact:
+            return self.known_encodings.take(indices)
+        return [self.known_encodings[i] for i in indices]
+
+    def _extend(self, encodings, new_encodings):
+        """Append encodings, keeping the storage form of the first argument"""
+        if isinstance(encodings, EncodingStore):
+            return encodings.extend(new_encodings)
+        return list(encodings) + list(new_encodings)
+
+    def _rebuild_index(self, changed=None):
+        """
+        Rebuild the search index after the gallery changed (swapped in atomically)
+        
+        :param changed: {name: new templates} of the identities that changed; only
+                        their shards are updated (default: repartition the whole gallery)
+        """
+        if self.shards is not None:
+            if changed is not None:
+                for name, templates in changed.items():
+                    self.shards.update(name, templates)
+            elif self.known_encodings is not None:
+                # (None when the workers already serve the stored shard files)
+                self.shards.build(self.known_names, self.known_encodings)
+            # The shard files hold the templates from now on
+            self.known_encodings = None
+        else:
+            self._apply_storage_mode()
+            codec = self.known_encodings.codec if self.compact else None
+            self.index = GalleryIndex(self.known_names, self.known_encodings, codec)
+        self.recent.invalidate(None if changed is None else list(changed))
+        self._rebuild_partition()
+
+    def _templates_of(self, name):
+        """Current templates of one identity (empty if it has none)"""
+        if self.shards is not None:
+            return self.shards.templates_of(name)
+        position = self.index.positions.get(name)
+        return [] if position is None else self.index.templates_of(position)
+
+    def _gallery_encodings(self):
+        """All templates parallel to known_names (read back from the shard files with shards)"""
+        if self.known_encodings is None:
+            return self.shards.gather(self.known_names)
+        return self.known_encodings
+
+    def _closest_other(self, templates, exclude):
+        """
+        Closest template of another identity to any of templates
+
+        :return: (distance, name), or (inf, None)
+        """
+        if self.shards is None:
+            return self.index.min_distance_to_others(templates, exclude=exclude)
+        best = (float("inf"), None)
+        # The closest identity may be the excluded one, so ask for two
+        for matches in self.shards.search_topk(templates, k=2):
+            for name, distance in matches:
+                if name != exclude and distance < best[0]:
+                    best = (distance, name)
+        return best
+    
+    def _rebuild_partition(self):
+        """Build the local partition's index from the current gallery (swapped in atomically)"""
+        if self.partition_names is None:
+            self.partition = None
+            return
+        names, encodings = [], []
+        for name in sorted(self.partition_names):
+            templates = self._templates_of(name)
+            if not len(templates):
+                continue  # Locker without a face (yet)
+            names.extend([name] * len(templates))
+            encodings.extend(templates)
+        self.partition = GalleryIndex(names, encodings)
+    
+    def set_partition(self, names):
+        """
+        Restrict first-pass matching to these identities
+        
+        :param names: Names in the local partition, or None to always match the whole gallery
+        """
+        self.partition_names = None if names is None else set(names)
+        self._rebuild_partition()
+        if self.partition is not None:
+            print(f"Local partition: {len(self.partition.names)} of {len(set(self.known_names))} identities")
+    
+    def attach_lockers(self, locker_manager, bank=LOCKER_BANK):
+        """
+        Derive the local partition from a bank's locker assignments and keep
+        it in step as lockers are assigned and released
+        
+        :param locker_manager: LockerManager holding the assignments
+        :param bank: Locker bank served by this kiosk
+        """
+        def on_change(name, assigned_bank):
+            names = set(self.partition_names or ())
+            if assigned_bank == bank:
+                names.add(name)
+            else:
+                names.discard(name)
+            self.recent.invalidate([name])
+            self.set_partition(names)
+        
+        self.set_partition(locker_manager.bank_members(bank))
+        locker_manager.add_listener(on_change)
+    
+    @property
+    def matcher(self):
+        """Index used for live matching: the shard workers if enabled, else the local index"""
+        return self.index if self.shards is None else self.shards
 
+    def find_best_match(self, face_encoding):
+        """
+        Find the closest identity to a face encoding
+        
+        :param face_encoding: Face encoding to match
+        :return: (name, distance); name is "Unknown" if nothing is within THRESHOLD
+        """
+        return self.find_best_matches([face_encoding])[0]
+        
+    def find_best_matches(self, face_encodings):
+        """
+        Match several face encodings in one vectorized pass
+        
+        Recently recognized identities are checked first; faces the cache
+        cannot answer confidently go to the local partition (if set) and
+        then, if still unplaced, to the whole gallery.
+        
+        :param face_encodings: List of face encodings
+        :return: List of (name, distance), parallel to the input
+        """
+        if not len(face_encodings):
+            return []
+        results = self.recent.lookup(face_encodings)
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            searched = self._search([face_encodings[i] for i in misses])
+            for i, (name, distance) in zip(misses, searched):
+                results[i] = (name, distance)
+                if name != "Unknown":
+                    self._remember(name)
+        return results
+    
+    def _remember(self, name):
+        """Cache a confirmed identity's templates for the next lookups"""
+        templates = self._templates_of(name)
+        if len(templates):
+            self.recent.confirm(name, templates)
+    
+    def match_stats(self):
+        """Counters of where matches were answered"""
+        stats = {"cache_" + key: value for key, value in self.recent.stats().items()}
+        stats.update(partition_hits=self.partition_hits, global_hits=self.global_hits,
+                     remote_fallbacks=self.remote_fallbacks)
+        return stats
+    
+    def _search(self, face_encodings):
+        """Full search: the local partition first, then the whole gallery for faces it cannot place"""
+        partition = self.partition
+        if partition is None:
+            return self._match_global(face_encodings)
+        
+        # Local partition first; only faces it cannot place go to the whole gallery
+        results = [("Unknown", distance) if name is None or distance > THRESHOLD else (name, distance)
+                   for name, distance in partition.search_batch(face_encodings)]
+        misses = [i for i, (name, _) in enumerate(results) if name == "Unknown"]
+        self.partition_hits += len(results) - len(misses)
+        if misses and PARTITION_GLOBAL_FALLBACK:
+            second = self._match_global([face_encodings[i] for i in misses])
+            for i, (name, distance) in zip(misses, second):
+                if name != "Unknown":
+                    self.global_hits += 1
+                    results[i] = (name, distance)
+        return results
+    
+    def _match_global(self, face_encodings):
+        """Match against the whole gallery (matching server, shards or local index)"""
+        if self.remote is not None:
+            try:
+                return self.remote.match(face_encodings)
+            except (TimeoutError, ConnectionError, OSError, RuntimeError) as e:
+                self.remote_fallbacks += 1
+                if self.remote_fallbacks == 1 or self.remote_fallbacks % 100 == 0:
+                    print(f"[Matching] Server unavailable ({e}), matching locally "
+                          f"({self.remote_fallbacks} fallback(s))")
+        return [("Unknown", distance) if name is None or distance > THRESHOLD else (name, distance)
+                for name, distance in self.matcher.search_batch(face_encodings)]
         
     def match_face(self, face_encoding):
         """
@@ -23,16 +281,8 @@ class FaceRecognitionManager:
         :param face_encoding: Face encoding to match
         :return: Name of the matched person or "Unknown"
         """
-        if not self.known_encodings:
-            return "Unknown"
-            
         try:
-            matches = face_recognition.compare_faces(self.known_encodings, face_encoding, tolerance=THRESHOLD)
-            name = "Unknown"
-            if True in matches:
-                first_match_index = matches.index(True)
-                name = self.known_names[first_match_index]
-            return name
+            return self.find_best_match(face_encoding)[0]
         except Exception as e:
             print(f"Error matching face: {e}")
             traceback.print_exc()
@@ -44,16 +294,29 @@ class FaceRecognitionManager:
         
         :param encodings_file: Path to encodings file
         """
+        stored_shards = False
         try:
             if os.path.exists(encodings_file):
                 with open(encodings_file, "rb") as f:
                     data = pickle.load(f)
                     # Handle both tuple format and dict format for backward compatibility
+                    meta = None
                     if isinstance(data, tuple) and len(data) == 2:
                         self.known_encodings, self.known_names = data
+                    elif isinstance(data, dict) and 'shards' in data:
+                        # Sharded gallery: the templates are in the shard files it lists
+                        self.known_names = data.get('names', [])
+                        meta = data.get('meta')
+                        stored_shards = self._load_shards(data['shards'], encodings_file)
+                    elif isinstance(data, dict) and 'codes' in data:
+                        # Compact storage written by a quantized gallery
+                        self.known_names = data.get('names', [])
+                        self.known_encodings = self._load_compact(data)
+                        meta = data.get('meta')
                     elif isinstance(data, dict):
                         self.known_encodings = data.get('encodings', [])
                         self.known_names = data.get('names', [])
+                        meta = data.get('meta')
                     else:
                         print("Warning: Unknown format in encodings file")
                         self.known_encodings, self.known_names = [], []
@@ -61,15 +324,59 @@ class FaceRecognitionManager:
                     # Ensure names are lowercase
                     self.known_names = [name.lower() for name in self.known_names]
                     
-                print(f"Loaded {len(self.known_names)} face(s): {', '.join(self.known_names)}")
+                    # Files written before versioning carry no metadata
+                    if meta is None or len(meta) != len(self.known_names):
+                        meta = [template_record(model=UNVERSIONED) for _ in self.known_names]
+                    self.known_meta = meta
+                    
+                names = sorted(set(self.known_names))
+                print(f"Loaded {len(self.known_names)} face template(s) for {len(names)} people: {', '.join(names)}")
             else:
-                self.known_encodings, self.known_names = [], []
+                self.known_encodings, self.known_names, self.known_meta = [], [], []
                 print("No encodings file found. Starting with empty database.")
         except Exception as e:
             print(f"Error loading encodings: {e}")
             traceback.print_exc()
-            self.known_encodings, self.known_names = [], []
+            self.known_encodings, self.known_names, self.known_meta = [], [], []
+            stored_shards = True  # Nothing to convert
+        self._rebuild_index()
+        if self.shards is not None and not stored_shards and self.known_names:
+            # Store the gallery as shard files from now on
+            print("Converting gallery to shard files")
+            self.save_encodings(encodings_file)
+
+    def _load_shards(self, manifest, encodings_file):
+        """
+        Serve the shard files of a sharded gallery, or read them in if this
+        kiosk keeps its gallery elsewhere (known_names must be set)
+
+        :param manifest: ShardedGallery.manifest() with the directory relative to the gallery file
+        :return: True if the shard workers serve the stored files as they are
+        """
+        manifest = dict(manifest, directory=os.path.join(os.path.dirname(os.path.abspath(encodings_file)),
+                                                         manifest['directory']))
+        if self.shards is not None and self.shards.adopt(manifest):
+            self.known_encodings = None
+            return True
+        # Imported here so galleries without shards never load the worker module
+        from sharded_gallery_module import read_manifest, gather_templates
+        names = [name.lower() for name in self.known_names]
+        self.known_encodings = gather_templates(read_manifest(manifest), names)
+        return False
     
+    def _load_compact(self, data):
+        """
+        Restore a compact gallery, converting it if the configured mode differs
+        
+        :param data: Dict with 'storage' (codec state) and 'codes'
+        """
+        store = EncodingStore(codec_from_state(data['storage']), data['codes'])
+        if store.codec.mode == self.storage_mode:
+            self.codec = store.codec
+            return store
+        print(f"Converting gallery from {store.codec.mode} to {self.storage_mode}")
+        return [np.asarray(e, dtype=np.float64) for e in store]
+
     def save_encodings(self, encodings_file=None):
         """
         Save face encodings to file with backup
@@ -90,10 +397,29 @@ class FaceRecognitionManager:
                     print(f"Error creating backup: {e}")
             
             # Now save the current data
-            data = {
-                'encodings': self.known_encodings,
-                'names': self.known_names
-            }
+            if self.compact:
+                data = {
+                    'names': self.known_names,
+                    'storage': self.known_encodings.codec.state(),
+                    'codes': self.known_encodings.codes,
+                    'meta': self.known_meta
+                }
+            elif self.shards is not None:
+                # The shard files hold the templates; only list them here
+                manifest = self.shards.manifest()
+                manifest['directory'] = os.path.relpath(
+                    manifest['directory'], os.path.dirname(os.path.abspath(encodings_file)))
+                data = {
+                    'names': self.known_names,
+                    'shards': manifest,
+                    'meta': self.known_meta
+                }
+            else:
+                data = {
+                    'encodings': self._gallery_encodings(),
+                    'names': self.known_names,
+                    'meta': self.known_meta
+                }
             
             # Use a temporary file for atomic write
             temp_file = encodings_file + '.tmp'
@@ -105,6 +431,12 @@ class FaceRecognitionManager:
                 if os.path.exists(encodings_file):
                     os.remove(encodings_file)
                 os.rename(temp_file, encodings_file)
+            
+            # Keep the name index used by the user-management CLI in step
+            write_user_index(self.known_names, encodings_file)
+            if self.shards is not None:
+                # Drop shard files neither this save nor the previous one refers to
+                self.shards.prune()
                 
             print(f"Successfully saved {len(self.known_names)} encodings")
             return True
@@ -113,38 +445,62 @@ class FaceRecognitionManager:
             traceback.print_exc()
             return False
     
-    def register_face(self, name, face_encoding):
+    def register_face(self, name, face_encoding, records=None):
         """
         Register a new face
         
         :param name: Name of the person
-        :param face_encoding: Face encoding to register
+        :param face_encoding: Face encoding to register, or a list of encodings
+                              (several templates of the same person)
+        :param records: Template records from FaceCropStore.put, parallel to the
+                        encodings; defaults to the current encoder version without a crop
         :return: Success status
+        
+        Templates are added to the person's existing ones; beyond
+        MAX_TEMPLATES_PER_IDENTITY the oldest are dropped.
         """
         try:
             name = name.lower().strip()
             if not name:
                 print("Error: Empty name provided")
                 return False
-                
-            # Check if this face is already registered
-            for existing_encoding in self.known_encodings:
-                if np.linalg.norm(existing_encoding - face_encoding) < THRESHOLD:
-                    print(f"Face similar to existing entry found")
-                    return False
+            
+            templates = [np.asarray(e) for e in np.atleast_2d(face_encoding)]
+            if records is None:
+                records = [template_record() for _ in templates]
+            
+            # Check if this face is already registered under another name
+            # (re-enrolling the same name is allowed and adds templates);
+            # one blocked, vectorized scan over the whole gallery
+            distance, other = self._closest_other(templates, exclude=name)
+            if distance < THRESHOLD:
+                print(f"Face similar to existing entry found ({other}, distance {distance:.3f})")
+                self._discard_crops(records)
+                return False
             
             # Check if name already exists
-            if name in self.known_names:
-                # Update the existing entry instead of adding a duplicate
-                index = self.known_names.index(name)
-                self.known_encodings[index] = face_encoding
+            existing = list(self._templates_of(name))
+            if existing:
                 print(f"Updated existing entry for {name}")
             else:
-                # Add new entry
-                self.known_encodings.append(face_encoding)
-                self.known_names.append(name)
                 print(f"Added new entry for {name}")
             
+            # Keep the newest templates up to the per-identity bound
+            existing_records = [m for n, m in zip(self.known_names, self.known_meta) if n == name]
+            records = existing_records + list(records)
+            dropped = records[:-MAX_TEMPLATES_PER_IDENTITY]
+            templates = (existing + templates)[-MAX_TEMPLATES_PER_IDENTITY:]
+            records = records[-MAX_TEMPLATES_PER_IDENTITY:]
+            
+            # Each template is stored as its own entry with the same name
+            keep = [i for i, n in enumerate(self.known_names) if n != name]
+            if self.known_encodings is not None:
+                self.known_encodings = self._extend(self._take(keep), templates)
+            self.known_names = [self.known_names[i] for i in keep] + [name] * len(templates)
+            self.known_meta = [self.known_meta[i] for i in keep] + records
+            self._rebuild_index(changed={name: templates})
+            self._discard_crops(dropped)
+            
             # Save to file
             success = self.save_encodings()
             return success
@@ -154,50 +510,87 @@ class FaceRecognitionManager:
             return False
 
     def delete_face(self, name, locker_manager=None):
+        """
+        Delete a face (and optionally its locker)
+        
+        :param name: Name of the person
+        :param locker_manager: LockerManager whose assignment should also be removed
+        :raises Exception: If no encoding is stored for the name
+        """
         name = name.strip().lower()
-        print(f"[DEBUG] Attempting to delete face: '{name}'")
-    
-        updated_encodings = []
-        updated_names = []
-        removed = False
-    
-        for encoding, stored_name in zip(self.known_encodings, self.known_names):
-            print(f"[DEBUG] Checking stored name: '{stored_name}'")
-            if stored_name.lower() != name:
-                updated_encodings.append(encoding)
-                updated_names.append(stored_name)
-            else:
-                print(f"[DEBUG] Match found: '{stored_name}', removing.")
-                removed = True
-    
-        if not removed:
+        
+        keep = [i for i, stored_name in enumerate(self.known_names) if stored_name != name]
+        if len(keep) == len(self.known_names):
             print(f"❌ No encoding found for '{name}'")
             raise Exception(f"No encoding found for '{name}'")
-    
-        # Save updated encodings
-        with open(self.encodings_path, "wb") as f:
-            pickle.dump({"encodings": updated_encodings, "names": updated_names}, f)
-    
-        self.known_encodings = updated_encodings
-        self.known_names = updated_names
+        
+        removed = [m for stored_name, m in zip(self.known_names, self.known_meta) if stored_name == name]
+        if self.known_encodings is not None:
+            self.known_encodings = self._take(keep)
+        self.known_names = [self.known_names[i] for i in keep]
+        self.known_meta = [self.known_meta[i] for i in keep]
+        self._rebuild_index(changed={name: []})
+        
+        # Save updated encodings (atomic write with backup)
+        if not self.save_encodings():
+            raise Exception(f"Failed to save encodings after deleting '{name}'")
+        self._discard_crops(removed)
         print(f"✅ Encoding for '{name}' deleted.")
-    
-        # Handle locker cleanup
+        
+        # Handle locker cleanup (locker keys are stored lowercase)
         if locker_manager:
-            found_key = None
-            for key in locker_manager.lockers.keys():
-                print(f"[DEBUG] Comparing locker key: '{key}'")
-                if key.lower() == name:
-                    found_key = key
-                    break
-    
-            if found_key:
-                print(f"[DEBUG] Removing locker for: '{found_key}'")
-                del locker_manager.lockers[found_key]
-                locker_manager.save_lockers()
-                print(f"🧹 Locker for '{found_key}' removed.")
+            if locker_manager.release_locker(name):
+                print(f"🧹 Locker for '{name}' removed.")
             else:
                 print(f"⚠️ No locker found for '{name}'")
 
-    
-        
+    def _discard_crops(self, records):
+        """Delete the face crops of records that no template refers to any more"""
+        referenced = {m["crop"] for m in self.known_meta}
+        self.face_store.discard((m["crop"] for m in records), referenced)
+
+    def stale_templates(self, version=None):
+        """
+        Template records whose encoding came from another encoder version and
+        that can be rebuilt from a stored crop
+
+        :param version: Target encoder version (default: current configuration)
+        """
+        version = version or encoder_version()
+        return [dict(m) for m in self.known_meta
+                if m["model"] != version and self.face_store.exists(m["crop"])]
+
+    def apply_reencoded(self, results, version):
+        """
+        Swap in re-encoded templates (runs on the admin worker)
+
+        Templates that changed or were removed since re-encoding started are
+        skipped by matching on the crop digest. A compact gallery gets a freshly
+        trained codec, since the encoding distribution may have changed.
+
+        :param results: Dict of crop digest -> new encoding
+        :param version: Encoder version the results were produced with
+        :return: Number of templates replaced
+        """
+        encodings = [np.asarray(e, dtype=np.float64) for e in self._gallery_encodings()]
+        meta = [dict(m) for m in self.known_meta]
+        replaced = 0
+        for i, m in enumerate(meta):
+            if m["model"] != version and m["crop"] in results:
+                encodings[i] = np.asarray(results[m["crop"]], dtype=np.float64)
+                m["model"] = version
+                replaced += 1
+        if not replaced:
+            return 0
+
+        if self.compact:
+            self.codec = create_codec(self.storage_mode)
+        self.known_encodings = encodings
+        self.known_meta = meta
+        self._rebuild_index()
+        self.save_encodings()
+
+        unversioned = sum(1 for m in meta if m["model"] != version)
+        print(f"Re-encoded {replaced} template(s) with {version}"
+              + (f"; {unversioned} without a usable crop keep their old encoding" if unversioned else ""))
+        return replaced
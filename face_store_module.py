@@ -0,0 +1,204 @@
+# face_store_module.py
+import os
+import time
+import hashlib
+import threading
+import traceback
+import cv2
+import numpy as np
+from config import (KNOWN_FACES_DIR, ENCODER_MODEL, ENCODER_DETECTOR, ENCODER_PROFILES, ENROLL_ENCODER_PROFILE,
+                    FACE_CROP_MARGIN, FACE_CROP_JPEG_QUALITY, REENCODE_THROTTLE)
+
+# Version tag of encodings stored before versioning existed
+UNVERSIONED = "unversioned"
+
+
+def encoder_version(model=ENCODER_MODEL, landmarks=None, jitters=None, detector=ENCODER_DETECTOR):
+    """
+    Version tag for encodings produced with the given encoder configuration
+    (landmarks and jitters default to the enrollment profile)
+    """
+    profile = ENCODER_PROFILES[ENROLL_ENCODER_PROFILE]
+    landmarks = profile["landmarks"] if landmarks is None else landmarks
+    jitters = profile["jitters"] if jitters is None else jitters
+    return f"{model}/{landmarks}/j{jitters}/{detector}"
+
+
+def template_record(crop=None, location=None, model=None):
+    """
+    Metadata stored with every gallery template
+
+    :param crop: Digest of the face crop in the FaceCropStore, or None
+    :param location: (top, right, bottom, left) of the face inside the crop
+    :param model: Encoder version tag
+    """
+    return {"crop": crop, "location": location, "model": model or encoder_version()}
+
+
+class FaceCropStore:
+    def __init__(self, root=KNOWN_FACES_DIR):
+        """
+        Content-addressed store of JPEG face crops: a crop is saved once under
+        the SHA-256 of its bytes, so identical crops are never duplicated and
+        a digest always refers to the same image
+
+        :param root: Directory holding the crops
+        """
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + ".jpg")
+
+    def exists(self, digest):
+        return digest is not None and os.path.exists(self.path(digest))
+
+    def put(self, rgb, location):
+        """
+        Crop a face (with margin) from a frame, compress and store it
+
+        :param rgb: RGB frame
+        :param location: (top, right, bottom, left) of the face in the frame
+        :return: Template record with the crop digest and the face location inside the crop
+        """
+        height, width = rgb.shape[:2]
+        top, right, bottom, left = location
+        margin_y = int((bottom - top) * FACE_CROP_MARGIN)
+        margin_x = int((right - left) * FACE_CROP_MARGIN)
+        y0, y1 = max(0, top - margin_y), min(height, bottom + margin_y)
+        x0, x1 = max(0, left - margin_x), min(width, right + margin_x)
+
+        crop = cv2.cvtColor(rgb[y0:y1, x0:x1], cv2.COLOR_RGB2BGR)
+        ok, buffer = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, FACE_CROP_JPEG_QUALITY])
+        if not ok:
+            raise RuntimeError("Could not compress face crop")
+        data = buffer.tobytes()
+        digest = hashlib.sha256(data).hexdigest()
+
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_file = path + ".tmp"
+            with open(temp_file, "wb") as f:
+                f.write(data)
+            os.replace(temp_file, path)
+
+        return template_record(digest, (top - y0, right - x0, bottom - y0, left - x0))
+
+    def load(self, digest):
+        """
+        :return: RGB crop, or None if it is missing or unreadable
+        """
+        image = cv2.imread(self.path(digest))
+        if image is None:
+            return None
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    def discard(self, digests, referenced):
+        """
+        Delete crops that are no longer referenced by the gallery
+
+        :param digests: Candidate digests
+        :param referenced: Set of digests still in use
+        """
+        for digest in set(digests) - set(referenced):
+            if digest is None:
+                continue
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[FaceCropStore] Could not remove crop {digest[:12]}: {e}")
+
+
+class GalleryReencoder:
+    def __init__(self, face_manager, submit, throttle=REENCODE_THROTTLE):
+        """
+        Re-encodes stored face crops whose encodings were produced by a
+        different encoder configuration than the current one.
+
+        Encoding runs on a low-priority thread, one template at a time with a
+        pause in between; the finished result is handed to the admin job queue
+        and swapped in as a whole, so recognition keeps using the old gallery
+        until then and is never paused.
+
+        :param face_manager: FaceRecognitionManager whose gallery is re-encoded
+        :param submit: AdminJobExecutor.submit, used to apply the result
+        :param throttle: Seconds slept between templates
+        """
+        self.face_manager = face_manager
+        self.submit = submit
+        self.throttle = throttle
+        self.version = encoder_version()
+        self.progress = (0, 0)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start re-encoding if any stored template is out of date"""
+        stale = self.face_manager.stale_templates(self.version)
+        if not stale:
+            return False
+        print(f"[Reencoder] {len(stale)} template(s) to re-encode for {self.version}")
+        self._thread = threading.Thread(target=self._run, args=(stale,), name="reencoder", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _lower_priority(self):
+        """Lower this thread's scheduling priority (Linux threads are scheduled individually)"""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+
+    def _run(self, stale):
+        # Imported here so the store is usable without the dlib stack
+        from encoder_profiles_module import enroll_profile
+
+        profile = enroll_profile()
+        self._lower_priority()
+        results = {}
+        start = time.monotonic()
+        for done, record in enumerate(stale):
+            if self._stop.is_set():
+                print("[Reencoder] Stopped")
+                return
+            try:
+                encoding = self._encode(profile, record)
+                if encoding is not None:
+                    results[record["crop"]] = encoding
+            except Exception as e:
+                print(f"[Reencoder] Failed on crop {record['crop'][:12]}: {e}")
+                traceback.print_exc()
+            self.progress = (done + 1, len(stale))
+            self._stop.wait(self.throttle)
+
+        print(f"[Reencoder] Encoded {len(results)}/{len(stale)} template(s) "
+              f"in {time.monotonic() - start:.1f}s")
+        if results:
+            self.submit("reencode", self._apply_job, results)
+
+    def _encode(self, profile, record):
+        rgb = self.face_manager.face_store.load(record["crop"])
+        if rgb is None:
+            return None
+        # The current detector decides where the face is; fall back to the
+        # location recorded at enrollment if it finds nothing
+        locations = profile.locate(rgb)
+        if locations:
+            location = max(locations, key=lambda l: (l[2] - l[0]) * (l[1] - l[3]))
+        else:
+            location = tuple(record["location"])
+        encodings = profile.encode(rgb, [location])
+        return np.asarray(encodings[0]) if encodings else None
+
+    def _apply_job(self, job, results):
+        """Admin job: swap the re-encoded templates into the gallery"""
+        return self.face_manager.apply_reencoded(results, self.version)
@@ -0,0 +1,509 @@
+# frame_recorder_module.py
+import os
+import sys
+import mmap
+import json
+import time
+import zlib
+import queue
+import struct
+import functools
+import argparse
+import threading
+import traceback
+import cv2
+import numpy as np
+from config import (RECORDER_FILE, RECORDER_SIZE_MB, RECORDER_CODEC, RECORDER_JPEG_QUALITY,
+                    RECORDER_MAX_FPS, RECORDER_QUEUE)
+
+# File header: magic, version, data capacity, head (next write offset),
+# tail (oldest record), record count, dropped frames
+FILE_MAGIC = b"LKRING01"
+FILE_HEADER = struct.Struct("<8sIQQQQQ")
+HEADER_SIZE = 4096  # Data area starts on its own page
+
+# Record header: magic, total length (header + payload, 8-byte aligned),
+# payload length, capture time, frame sequence number, record kind
+RECORD_MAGIC = 0x52454331
+RECORD_HEADER = struct.Struct("<IIIdQB3x")
+
+FRAME = 1
+RESULTS = 2
+WRAP = 3  # Marks the unused end of the data area; reading continues at offset 0
+
+# Frame payload prefix: codec, height, width, channels
+FRAME_HEADER = struct.Struct("<BHHH")
+CODEC_IDS = {"jpeg": 1, "zlib": 2}
+
+
+def _aligned(length):
+    return (length + 7) & ~7
+
+
+class RingFile:
+    def __init__(self, path, size):
+        """
+        Preallocated, memory-mapped ring of variable-length records.
+        Writing never grows the file; the oldest records are overwritten.
+
+        :param path: File to create (or reuse if it has the same size)
+        :param size: Total file size in bytes
+        """
+        self.path = path
+        self.capacity = size - HEADER_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.head = self.tail = self.records = self.dropped = 0
+        self._write_header()
+
+    def _write_header(self):
+        FILE_HEADER.pack_into(self.map, 0, FILE_MAGIC, 1, self.capacity, self.head, self.tail,
+                              self.records, self.dropped)
+
+    def _drop_oldest_until(self, limit):
+        """Forget old records that start inside [head, limit) - they are about to be overwritten"""
+        while self.records and self.head <= self.tail < limit:
+            _, length, _, _, _, kind = RECORD_HEADER.unpack_from(self.map, HEADER_SIZE + self.tail)
+            if kind == WRAP:
+                self.tail = 0
+                continue
+            self.tail += length
+            self.records -= 1
+            if self.tail + RECORD_HEADER.size > self.capacity:
+                # No room for another record before the end: the next one is at 0
+                self.tail = 0
+        if not self.records:
+            self.tail = self.head
+
+    def append(self, kind, seq, timestamp, payload):
+        """
+        Write one record
+
+        :return: False if the record is too large for the ring
+        """
+        length = _aligned(RECORD_HEADER.size + len(payload))
+        if length > self.capacity // 2:
+            return False
+
+        if self.head + length > self.capacity:
+            # Not enough room before the end: mark the rest unused and wrap
+            self._drop_oldest_until(self.capacity)
+            if self.capacity - self.head >= RECORD_HEADER.size:
+                RECORD_HEADER.pack_into(self.map, HEADER_SIZE + self.head, RECORD_MAGIC,
+                                        RECORD_HEADER.size, 0, 0.0, 0, WRAP)
+            self.head = 0
+            if not self.records:
+                self.tail = 0
+        self._drop_oldest_until(self.head + length)
+
+        offset = HEADER_SIZE + self.head
+        RECORD_HEADER.pack_into(self.map, offset, RECORD_MAGIC, length, len(payload), timestamp, seq, kind)
+        start = offset + RECORD_HEADER.size
+        self.map[start:start + len(payload)] = payload
+        self.head += length
+        self.records += 1
+        self._write_header()
+        return True
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+
+
+class FrameRecorder:
+    def __init__(self, path=RECORDER_FILE, size_mb=RECORDER_SIZE_MB, codec=RECORDER_CODEC,
+                 max_fps=RECORDER_MAX_FPS, queue_size=RECORDER_QUEUE):
+        """
+        Records frames and recognition results into a RingFile.
+
+        Callers only put references on a bounded queue; compression and
+        writing happen on the recorder's own thread. When the writer falls
+        behind, new frames are dropped (and counted) instead of blocking.
+
+        :param path: Ring file path
+        :param size_mb: Ring file size
+        :param codec: "jpeg" or "zlib"
+        :param max_fps: Frames recorded per second at most
+        :param queue_size: Frames that may wait for the writer
+        """
+        if codec not in CODEC_IDS:
+            raise ValueError(f"Unknown recorder codec: {codec}")
+        self.codec = codec
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.ring = RingFile(path, size_mb * 1024 * 1024)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last_frame_time = 0.0
+        self._last_frame_seq = None
+        self.written = 0
+        self.bytes_written = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="frame-recorder", daemon=True)
+        self._thread.start()
+        print(f"[FrameRecorder] Recording to {path} ({size_mb} MB ring, {codec})")
+
+    def record_frame(self, seq, timestamp, frame, force=False):
+        """
+        Queue a captured frame (never blocks; the frame must not be modified afterwards)
+
+        :param force: Record even if the frame rate cap would skip it
+        """
+        if seq == self._last_frame_seq:
+            return
+        if not force and timestamp - self._last_frame_time < self.min_interval:
+            return
+        self._last_frame_time = timestamp
+        self._last_frame_seq = seq
+        self._offer((FRAME, seq, timestamp, frame))
+
+    def record_results(self, seq, timestamp, frame, faces, resize_factor=None):
+        """
+        Queue the recognition results for a frame, recording the frame itself
+        too if the frame rate cap skipped it, so every result can be replayed
+
+        :param seq: Sequence number of the frame the results belong to
+        :param frame: That frame
+        :param faces: List of (name, (top, right, bottom, left))
+        :param resize_factor: Factor the frame was resized by for detection, so a
+                              replay detects at the same resolution
+        """
+        self.record_frame(seq, timestamp, frame, force=True)
+        self._offer((RESULTS, seq, timestamp, (faces, resize_factor)))
+
+    def _offer(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.ring.dropped += 1
+
+    def _encode_frame(self, frame):
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        if self.codec == "jpeg":
+            ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, RECORDER_JPEG_QUALITY])
+            if not ok:
+                raise RuntimeError("JPEG encoding failed")
+            data = data.tobytes()
+        else:
+            data = zlib.compress(np.ascontiguousarray(frame).tobytes(), 1)
+        return FRAME_HEADER.pack(CODEC_IDS[self.codec], height, width, channels) + data
+
+    def _run(self):
+        while self._running:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, seq, timestamp, content = item
+            try:
+                if kind == FRAME:
+                    payload = self._encode_frame(content)
+                else:
+                    faces, resize_factor = content
+                    payload = json.dumps({"faces": [[name, list(box)] for name, box in faces],
+                                          "resize_factor": resize_factor}).encode()
+                if self.ring.append(kind, seq, timestamp, payload):
+                    self.written += 1
+                    self.bytes_written += len(payload)
+            except Exception as e:
+                print(f"[FrameRecorder] Failed to write record: {e}")
+                traceback.print_exc()
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "bytes_written": self.bytes_written,
+            "dropped": self.ring.dropped,
+            "records_in_file": self.ring.records,
+        }
+
+    def close(self):
+        self._running = False
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=2.0)
+        self.ring.close()
+
+
+class Record:
+    def __init__(self, kind, seq, timestamp, payload):
+        self.kind = kind
+        self.seq = seq
+        self.timestamp = timestamp
+        self.payload = payload
+
+    def frame(self):
+        """Decoded frame (FRAME records)"""
+        codec, height, width, channels = FRAME_HEADER.unpack_from(self.payload)
+        data = self.payload[FRAME_HEADER.size:]
+        if codec == CODEC_IDS["jpeg"]:
+            return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        return np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape)
+
+    def faces(self):
+        """Recognition results (RESULTS records) as a list of (name, box)"""
+        return [(name, tuple(box)) for name, box in json.loads(self.payload)["faces"]]
+
+    def resize_factor(self):
+        """Detection resize factor of the results (RESULTS records; None in older recordings)"""
+        return json.loads(self.payload).get("resize_factor")
+
+
+def read_records(path):
+    """
+    Yield every record in a ring file, oldest first
+
+    :param path: Ring file written by FrameRecorder
+    """
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, _, capacity, _, tail, records, _ = FILE_HEADER.unpack_from(data, 0)
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a frame recording")
+        offset = tail
+        while records:
+            if offset + RECORD_HEADER.size > capacity:
+                offset = 0
+                continue
+            magic, length, payload_length, timestamp, seq, kind = RECORD_HEADER.unpack_from(
+                data, HEADER_SIZE + offset)
+            if magic != RECORD_MAGIC:
+                raise ValueError(f"Corrupt record at offset {offset}")
+            if kind == WRAP:
+                offset = 0
+                continue
+            start = HEADER_SIZE + offset + RECORD_HEADER.size
+            yield Record(kind, seq, timestamp, bytes(data[start:start + payload_length]))
+            offset += length
+            records -= 1
+    finally:
+        data.close()
+
+
+class ReplayCamera:
+    def __init__(self, path, realtime=True, loop=False):
+        """
+        Stand-in for CameraManager that streams the frames of a recording,
+        so the kiosk pipeline can run on a field recording at the bench
+
+        :param path: Ring file written by FrameRecorder
+        :param realtime: Keep the recorded frame timing (otherwise as fast as possible)
+        :param loop: Start over at the end of the recording
+        """
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.picam2 = True  # Consumers only check that a camera is present
+        self.recorder = None
+        self.finished = threading.Event()
+        self._frame_available = threading.Condition()
+        self._frame_listeners = []
+        self._latest_frame = None
+        self._frame_seq = 0
+        self._frame_time = 0.0
+        self._streaming = False
+        self._thread = None
+
+    def start_stream(self):
+        if self._streaming:
+            return
+        self._streaming = True
+        self._thread = threading.Thread(target=self._replay, name="replay", daemon=True)
+        self._thread.start()
+
+    def _replay(self):
+        while self._streaming:
+            first_recorded = first_played = None
+            for record in read_records(self.path):
+                if not self._streaming:
+                    return
+                if record.kind != FRAME:
+                    continue
+                if self.realtime:
+                    now = time.monotonic()
+                    if first_recorded is None:
+                        first_recorded, first_played = record.timestamp, now
+                    delay = (record.timestamp - first_recorded) - (now - first_played)
+                    if delay > 0:
+                        time.sleep(delay)
+                frame = record.frame()
+                with self._frame_available:
+                    self._latest_frame = frame
+                    self._frame_seq += 1
+                    self._frame_time = time.monotonic()
+                    self._frame_available.notify_all()
+                    seq = self._frame_seq
+                for callback in self._frame_listeners:
+                    callback(seq)
+            if not self.loop:
+                break
+        self.finished.set()
+
+    def add_frame_listener(self, callback):
+        self._frame_listeners.append(callback)
+
+    def get_latest_frame(self):
+        with self._frame_available:
+            return self._frame_seq, self._frame_time, self._latest_frame
+
+    def wait_for_frame(self, after_seq, timeout=1.0):
+        with self._frame_available:
+            self._frame_available.wait_for(lambda: self._frame_seq > after_seq, timeout=timeout)
+            return self._frame_seq, self._frame_time, self._latest_frame
+
+    def capture_frame(self, resize_factor=1.0, max_age=None):
+        _, _, frame = self.get_latest_frame()
+        if frame is None:
+            return None
+        if resize_factor != 1.0:
+            frame = cv2.resize(frame, None, fx=resize_factor, fy=resize_factor, interpolation=cv2.INTER_LINEAR)
+        return frame
+
+    def start_recording(self, path=None):
+        """Recordings are not re-recorded"""
+        return None
+
+    def stop_recording(self):
+        pass
+
+    def record_results(self, faces, resize_factor=None):
+        pass
+
+    def set_frame_rate(self, fps):
+        return False
+
+    def health(self):
+        return {"state": "replay", "frame_age": None}
+
+    def stop(self):
+        self._streaming = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+
+def describe(path):
+    """Summary of a recording"""
+    frames = results = 0
+    first = last = None
+    size = 0
+    for record in read_records(path):
+        first = record.timestamp if first is None else first
+        last = record.timestamp
+        size += len(record.payload)
+        frames += record.kind == FRAME
+        results += record.kind == RESULTS
+    with open(path, "rb") as f:
+        header = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    return {
+        "frames": frames,
+        "results": results,
+        "seconds": (last - first) if first is not None else 0.0,
+        "payload_bytes": size,
+        "dropped": header[6],
+    }
+
+
+def replay_pipeline(path, encodings_file=None):
+    """
+    Run every recorded frame through the kiosk's detect, encode and match
+    stages and compare the names with the recorded results.
+
+    Frames are detected at the resize factor recorded with their results;
+    frames without results use the factor of the results before them (the
+    autotuner moves it slowly), and RECOGNITION_RESIZE_FACTOR until the
+    first one or in recordings made before the factor was recorded.
+
+    :return: Dict with per-stage latency percentiles and the agreement rate
+    """
+    # Imported here so reading recordings needs no dlib
+    from encoder_profiles_module import live_profile
+    from face_recognition_module import FaceRecognitionManager
+    from pipeline_module import (Pipeline, Stage, FrameJob, stage_settings, detect_faces, encode_faces,
+                                 match_faces)
+    from power_module import ACTIVE
+    from config import ENCODINGS_FILE, RECOGNITION_RESIZE_FACTOR
+
+    recorded = {}
+    frames = []
+    for record in read_records(path):
+        if record.kind == RESULTS:
+            recorded[record.seq] = (sorted(name for name, _ in record.faces()), record.resize_factor())
+        elif record.kind == FRAME:
+            frames.append((record.seq, record.frame()))
+
+    timings = {"detect": [], "encode": [], "match": []}
+
+    def record_timing(stage, seconds):
+        timings[stage].append(seconds)
+
+    def capture(item):
+        job, frame = item
+        small = cv2.resize(frame, None, fx=job.resize_factor, fy=job.resize_factor)
+        job.set_frame(small, job.resize_factor)
+        return job
+
+    profile = live_profile()
+    manager = FaceRecognitionManager(encodings_file or ENCODINGS_FILE, shards=0)
+    # One item at a time through the same stage functions the kiosk runs
+    pipeline = Pipeline([
+        Stage("capture", capture),
+        Stage("detect", functools.partial(detect_faces, profile), timing=record_timing),
+        Stage("encode", functools.partial(encode_faces, profile), timing=record_timing),
+        Stage("match", functools.partial(match_faces, manager), timing=record_timing,
+              batch=stage_settings("match")["batch"]),
+    ])
+
+    compared = agreed = 0
+    resize_factor = RECOGNITION_RESIZE_FACTOR
+    for seq, frame in frames:
+        names, factor = recorded.get(seq, (None, None))
+        if factor:
+            resize_factor = factor
+        job = FrameJob(seq, ACTIVE)
+        job.resize_factor = resize_factor
+        for job in pipeline.process((job, frame)):
+            if names is not None:
+                compared += 1
+                agreed += sorted(name for name, _ in job.matches) == names
+
+    report = {"frames": len(frames), "compared": compared,
+              "agreement": agreed / compared if compared else None}
+    for stage, values in timings.items():
+        if values:
+            report[f"{stage}_p50"] = float(np.percentile(values, 50))
+            report[f"{stage}_p95"] = float(np.percentile(values, 95))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or replay a frame recording")
+    parser.add_argument("command", choices=["info", "replay"])
+    parser.add_argument("file", nargs="?", default=RECORDER_FILE, help="Ring file")
+    parser.add_argument("--encodings", help="Gallery to match against when replaying")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        info = describe(args.file)
+        print(f"{info['frames']} frames, {info['results']} result records over {info['seconds']:.1f}s; "
+              f"{info['payload_bytes'] / 1e6:.1f} MB of payload, {info['dropped']} frames dropped while recording")
+        return 0
+
+    report = replay_pipeline(args.file, args.encodings)
+    print(f"Replayed {report['frames']} frames")
+    for stage in ("detect", "encode", "match"):
+        if f"{stage}_p50" in report:
+            print(f"{stage:<7} p50 {report[stage + '_p50'] * 1000:7.1f} ms  p95 {report[stage + '_p95'] * 1000:7.1f} ms")
+    if report["agreement"] is not None:
+        print(f"Names match the recording on {report['agreement']:.1%} of {report['compared']} frames")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+# gallery_module.py
+import numpy as np
+from config import CENTROID_SHORTLIST, THRESHOLD, COLLISION_MARGIN, PAIRWISE_BLOCK
+
+
+class GalleryIndex:
+    def __init__(self, names, encodings, codec=None):
+        """
+        Read-only search structure over a multi-template gallery.
+
+        Templates are grouped by identity and each identity gets a centroid.
+        A search first ranks all centroids in one vectorized pass and then
+        compares the probe exactly against the templates of the closest few
+        identities only.
+
+        :param names: Name of each template (an identity may appear several times)
+        :param encodings: Encoding of each template, parallel to names
+                          (a list of arrays or an EncodingStore)
+        :param codec: Trained codec from quantization_module; if given, templates and
+                      centroids are held compactly and searched with asymmetric distances
+        """
+        self.codec = codec
+        self._decoded_centroids = None
+        order = {}
+        for i, name in enumerate(names):
+            order.setdefault(name, []).append(i)
+
+        self.names = list(order)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.template_count = len(names)
+
+        if not self.names:
+            self.templates = np.empty((0, 0), dtype=np.float32)
+            self.centroids = np.empty((0, 0), dtype=np.float32)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.owner = np.empty(0, dtype=np.int64)
+            return
+
+        grouped = np.array([i for indices in order.values() for i in indices])
+        if codec is not None and hasattr(encodings, "codes"):
+            # Already compact: reorder the codes without decoding them
+            self.templates = encodings.codes[grouped]
+            decoded = codec.decode(self.templates)
+        else:
+            decoded = np.asarray([encodings[i] for i in grouped], dtype=np.float32)
+            self.templates = codec.encode(decoded) if codec is not None else decoded
+
+        counts = np.array([len(indices) for indices in order.values()])
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.owner = np.repeat(np.arange(len(self.names)), counts)
+        centroids = (np.add.reduceat(decoded, self.offsets[:-1], axis=0) /
+                     counts[:, None]).astype(np.float32)
+        self.centroids = codec.encode(centroids) if codec is not None else centroids
+
+    @classmethod
+    def from_grouped(cls, names, counts, templates):
+        """
+        Index over templates that are already grouped by identity, without
+        copying them (templates may be a read-only memory map)
+
+        :param names: Identity names
+        :param counts: Templates per identity, parallel to names
+        :param templates: float32 matrix, the templates of each identity in consecutive rows
+        """
+        index = cls.__new__(cls)
+        index.codec = None
+        index._decoded_centroids = None
+        index.names = list(names)
+        index.positions = {name: i for i, name in enumerate(index.names)}
+        counts = np.asarray(counts, dtype=np.int64)
+        index.template_count = int(counts.sum())
+        index.templates = templates
+        index.offsets = np.concatenate(([0], np.cumsum(counts)))
+        index.owner = np.repeat(np.arange(len(index.names)), counts)
+        if index.names:
+            index.centroids = (np.add.reduceat(templates, index.offsets[:-1], axis=0) /
+                               counts[:, None]).astype(np.float32)
+        else:
+            index.centroids = np.empty((0, 0), dtype=np.float32)
+        return index
+
+    def appended(self, name, templates):
+        """
+        Index with one more identity, without copying the existing templates
+
+        :param name: New identity
+        :param templates: float32 matrix holding this index's templates followed by
+                          the new identity's (e.g. a memory map of a file that grew)
+        :return: New GalleryIndex (this one is left unchanged)
+        """
+        count = len(templates) - self.template_count
+        index = GalleryIndex.__new__(GalleryIndex)
+        index.codec = None
+        index._decoded_centroids = None
+        index.names = self.names + [name]
+        index.positions = dict(self.positions)
+        index.positions[name] = len(self.names)
+        index.template_count = len(templates)
+        index.templates = templates
+        index.offsets = np.append(self.offsets, len(templates))
+        index.owner = np.concatenate((self.owner, np.full(count, len(self.names), dtype=np.int64)))
+        centroid = np.asarray(templates[self.template_count:], dtype=np.float32).mean(axis=0, keepdims=True)
+        index.centroids = np.concatenate((self.centroids, centroid)) if self.names else centroid
+        return index
+
+    def _distances(self, matrix, probe):
+        """Distances from a full-precision probe to each row of a (possibly coded) matrix"""
+        if self.codec is not None:
+            return self.codec.distances(matrix, probe)
+        return np.linalg.norm(matrix - probe, axis=1)
+
+    @property
+    def nbytes(self):
+        """Memory held by the template and centroid matrices"""
+        return self.templates.nbytes + self.centroids.nbytes
+
+    def __len__(self):
+        return len(self.names)
+
+    def templates_of(self, identity):
+        """Templates of one identity (by position in self.names), decoded if compact"""
+        templates = self.templates[self.offsets[identity]:self.offsets[identity + 1]]
+        return self.codec.decode(templates) if self.codec is not None else templates
+
+    def shortlist(self, probe, size=CENTROID_SHORTLIST):
+        """
+        Identities whose centroids are closest to the probe
+
+        :return: Array of identity positions (unordered)
+        """
+        count = len(self.names)
+        if count <= size:
+            return np.arange(count)
+        distances = self._distances(self.centroids, probe)
+        return np.argpartition(distances, size - 1)[:size]
+
+    def search(self, probe, shortlist_size=CENTROID_SHORTLIST):
+        """
+        Find the closest identity to a probe encoding
+
+        :param probe: Face encoding
+        :param shortlist_size: Identities compared exactly after centroid screening
+        :return: (name, distance) of the closest template, or (None, inf) for an empty gallery
+        """
+        if not self.names:
+            return None, float("inf")
+
+        probe = np.asarray(probe, dtype=np.float32)
+        candidates = self.shortlist(probe, shortlist_size)
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in candidates])
+        distances = self._distances(self.templates[rows], probe)
+        best = int(np.argmin(distances))
+        return self.names[self.owner[rows[best]]], float(distances[best])
+
+    def search_batch(self, probes, shortlist_size=CENTROID_SHORTLIST):
+        """
+        Find the closest identity for several probes at once.
+
+        All probes are screened against the centroids in one matrix product;
+        the union of their shortlists is then compared exactly against all
+        probes in one more vectorized step. Each probe is thereby compared
+        with a superset of its own shortlist, so its result is at least as
+        close as what search() returns for it (and may be an identity outside
+        its own shortlist).
+
+        :param probes: Face encodings, one per row
+        :return: List of (name, distance), parallel to probes
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if not self.names or not len(probes):
+            return [(None, float("inf"))] * len(probes)
+
+        count = len(self.names)
+        if count <= shortlist_size:
+            candidates = np.arange(count)
+        else:
+            distances = _block_distances(probes, self.decoded_centroids)
+            shortlists = np.argpartition(distances, shortlist_size - 1, axis=1)[:, :shortlist_size]
+            candidates = np.unique(shortlists)
+
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in candidates])
+        templates = self.templates[rows]
+        if self.codec is not None:
+            # Distance to the decoded vector equals the codec's asymmetric distance
+            templates = self.codec.decode(templates).astype(np.float32)
+        distances = np.linalg.norm(probes[:, None, :] - templates[None, :, :], axis=2)
+        best = distances.argmin(axis=1)
+        return [(self.names[self.owner[rows[b]]], float(distances[i, b])) for i, b in enumerate(best)]
+
+    def search_topk(self, probes, k=1, shortlist_size=CENTROID_SHORTLIST):
+        """
+        The k closest identities for each probe (by their closest template)
+
+        :param probes: Face encodings, one per row
+        :return: List (parallel to probes) of up to k (name, distance), closest first
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if not self.names or not len(probes):
+            return [[] for _ in probes]
+
+        shortlist_size = max(shortlist_size, k)
+        count = len(self.names)
+        if count <= shortlist_size:
+            candidates = np.arange(count)
+        else:
+            distances = _block_distances(probes, self.decoded_centroids)
+            shortlists = np.argpartition(distances, shortlist_size - 1, axis=1)[:, :shortlist_size]
+            candidates = np.unique(shortlists)
+
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in candidates])
+        starts = np.concatenate(([0], np.cumsum(self.offsets[candidates + 1] - self.offsets[candidates])[:-1]))
+        templates = self.block_rows(rows)
+        distances = np.linalg.norm(probes[:, None, :] - templates[None, :, :], axis=2)
+        # Closest template per candidate identity
+        per_identity = np.minimum.reduceat(distances, starts, axis=1)
+        k = min(k, len(candidates))
+        results = []
+        for row in per_identity:
+            best = np.argpartition(row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            best = best[np.argsort(row[best])]
+            results.append([(self.names[candidates[b]], float(row[b])) for b in best])
+        return results
+
+    def block_rows(self, rows):
+        """Decoded float32 templates at the given rows"""
+        templates = self.templates[rows]
+        if self.codec is not None:
+            return self.codec.decode(templates).astype(np.float32)
+        return np.asarray(templates, dtype=np.float32)
+
+    @property
+    def decoded_centroids(self):
+        """Centroids as float32 (decoded once and cached for compact galleries)"""
+        if self.codec is None:
+            return self.centroids
+        if self._decoded_centroids is None:
+            self._decoded_centroids = self.codec.decode(self.centroids).astype(np.float32)
+        return self._decoded_centroids
+
+    def block(self, start, stop):
+        """Decoded float32 templates[start:stop]"""
+        templates = self.templates[start:stop]
+        if self.codec is not None:
+            return self.codec.decode(templates).astype(np.float32)
+        return templates
+
+    def min_distance_to_others(self, probes, exclude=None, block_size=PAIRWISE_BLOCK):
+        """
+        Smallest distance from any probe to any template of another identity,
+        computed block-wise over the whole gallery in one call
+
+        :param probes: One or more encodings
+        :param exclude: Name whose own templates are ignored
+        :return: (distance, name of the closest other identity), or (inf, None)
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        excluded = self.positions.get(exclude, -1)
+
+        best, best_owner = float("inf"), None
+        for start in range(0, self.template_count, block_size):
+            stop = min(start + block_size, self.template_count)
+            distances = _block_distances(probes, self.block(start, stop))
+            distances[:, self.owner[start:stop] == excluded] = np.inf
+            position = np.unravel_index(np.argmin(distances), distances.shape)
+            if distances[position] < best:
+                best = float(distances[position])
+                best_owner = self.owner[start + position[1]]
+        if best_owner is None:
+            return best, None
+        return best, self.names[best_owner]
+
+
+def _block_distances(a, b):
+    """Euclidean distances between the rows of a and b via one matrix product"""
+    squared = (np.einsum("ij,ij->i", a, a)[:, None] + np.einsum("ij,ij->i", b, b)[None, :] -
+               2.0 * (a @ b.T))
+    np.maximum(squared, 0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+
+class CollisionReport:
+    def __init__(self, names, nearest, nearest_names, pairs, threshold, margin):
+        """
+        Result of a gallery-wide collision scan
+
+        :param names: Identity names
+        :param nearest: Distance from each identity to its closest other identity
+        :param nearest_names: Name of that closest identity
+        :param pairs: List of (name_a, name_b, distance) below the near-collision distance
+        :param threshold: Global match threshold used for the scan
+        :param margin: Collision margin used for recommendations
+        """
+        self.names = names
+        self.nearest = nearest
+        self.nearest_names = nearest_names
+        self.pairs = pairs
+        self.threshold = threshold
+        self.margin = margin
+
+    def recommended_thresholds(self):
+        """Per-identity thresholds: never above the global one, lower for crowded identities"""
+        recommended = np.minimum(self.threshold, self.nearest * self.margin)
+        return dict(zip(self.names, recommended.tolist()))
+
+    def dangerous_pairs(self):
+        """Pairs that the global threshold can already confuse"""
+        return [pair for pair in self.pairs if pair[2] < self.threshold]
+
+
+def scan_collisions(index, threshold=THRESHOLD, margin=COLLISION_MARGIN, block_size=PAIRWISE_BLOCK):
+    """
+    Blocked all-pairs scan over a gallery's templates.
+
+    Memory is bounded by block_size^2 distances regardless of gallery size.
+    Each block pair is one matrix product plus in-place elementwise work on
+    squared distances; square roots are only taken for the results.
+
+    :param index: GalleryIndex to scan
+    :param threshold: Global match threshold
+    :param margin: Pairs closer than threshold / margin are reported as near-collisions
+    :param block_size: Templates per block
+    :return: CollisionReport
+    """
+    count = index.template_count
+    owner = index.owner
+    report_squared = (threshold / margin) ** 2
+
+    # Closest template of another identity (squared distance), per template
+    nearest = np.full(count, np.inf, dtype=np.float32)
+    nearest_owner = np.full(count, -1, dtype=np.int64)
+    pairs = {}
+    buffer = np.empty((min(block_size, count), min(block_size, count)), dtype=np.float32)
+
+    for i0 in range(0, count, block_size):
+        i1 = min(i0 + block_size, count)
+        rows = index.block(i0, i1)
+        row_norms = np.einsum("ij,ij->i", rows, rows)
+        for j0 in range(i0, count, block_size):
+            j1 = min(j0 + block_size, count)
+            cols = rows if j0 == i0 else index.block(j0, j1)
+            col_norms = row_norms if j0 == i0 else np.einsum("ij,ij->i", cols, cols)
+
+            squared = buffer[:i1 - i0, :j1 - j0]
+            np.matmul(rows, cols.T, out=squared)
+            squared *= -2.0
+            squared += row_norms[:, None]
+            squared += col_norms[None, :]
+            # Templates are grouped by identity, so only blocks whose identity
+            # ranges overlap can contain same-identity pairs
+            if owner[i1 - 1] >= owner[j0]:
+                squared[owner[i0:i1, None] == owner[None, j0:j1]] = np.inf
+
+            # Update both sides, since only the upper block triangle is visited
+            row_best = squared.argmin(axis=1)
+            row_min = squared[np.arange(i1 - i0), row_best]
+            better = row_min < nearest[i0:i1]
+            nearest[i0:i1][better] = row_min[better]
+            nearest_owner[i0:i1][better] = owner[j0 + row_best[better]]
+
+            col_best = squared.argmin(axis=0)
+            col_min = squared[col_best, np.arange(j1 - j0)]
+            better = col_min < nearest[j0:j1]
+            nearest[j0:j1][better] = col_min[better]
+            nearest_owner[j0:j1][better] = owner[i0 + col_best[better]]
+
+            close_rows, close_cols = np.nonzero(squared < report_squared)
+            for r, c, d in zip(owner[i0 + close_rows], owner[j0 + close_cols],
+                               squared[close_rows, close_cols]):
+                key = (min(r, c), max(r, c))
+                if d < pairs.get(key, np.inf):
+                    pairs[key] = d
+
+    nearest = np.sqrt(np.maximum(nearest, 0))
+
+    # Reduce per template to per identity (templates are grouped by identity)
+    identities = len(index.names)
+    identity_nearest = np.full(identities, np.inf)
+    identity_nearest_name = [None] * identities
+    if count:
+        identity_nearest = np.minimum.reduceat(nearest, index.offsets[:-1]).astype(np.float64)
+        for identity in range(identities):
+            segment = slice(index.offsets[identity], index.offsets[identity + 1])
+            other = nearest_owner[segment][np.argmin(nearest[segment])]
+            if other >= 0:
+                identity_nearest_name[identity] = index.names[other]
+
+    pair_list = sorted(((index.names[a], index.names[b], float(np.sqrt(max(d, 0))))
+                        for (a, b), d in pairs.items()),
+                       key=lambda pair: pair[2])
+    return CollisionReport(index.names, identity_nearest, identity_nearest_name, pair_list,
+                           threshold, margin)
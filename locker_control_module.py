@@ -1,24 +1,36 @@
 # locker_control_module.py
-import RPi.GPIO as GPIO
 import pickle
 import os
 import threading
-import time
-from config import LOCKERS_FILE, TOTAL_LOCKERS, AVAILABLE_GPIO_PINS
+from clock_module import SYSTEM_CLOCK
+from config import LOCKERS_FILE, TOTAL_LOCKERS, AVAILABLE_GPIO_PINS, LOCKER_BANK, LOCKER_HOLD_SECONDS
 
 class LockerManager:
-    def __init__(self, lockers_file=LOCKERS_FILE):
+    def __init__(self, lockers_file=LOCKERS_FILE, clock=SYSTEM_CLOCK, gpio=None):
         """
         Initialize locker management system
         
         :param lockers_file: Path to saved locker assignments
+        :param clock: Clock whose timers close lockers when no scheduler is set
+        :param gpio: RPi.GPIO-compatible module (default: RPi.GPIO; the simulator passes its own)
         """
+        if gpio is None:
+            # Imported here so the simulator can drive lockers without RPi.GPIO
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.clock = clock
+        
         # Set GPIO mode
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setwarnings(False)
         
         self.lockers = {}
-        self.active_timers = {}  # Track active timers for each locker
+        self.lockers_file = lockers_file
+        self.active_timers = {}  # Pending auto-close timer of each open locker
+        self._timer_lock = threading.Lock()  # Orders a reopen against a firing auto-close
+        self.scheduler = None  # AsyncCore used for auto-close timers (the clock's timers without one)
+        self.audit_log = None  # AuditLog receiving an event for every open attempt
+        self._listeners = []  # Called with (name, bank or None) when an assignment changes
         self.load_lockers(lockers_file)
         self._initialize_gpio_pins()
     
@@ -40,26 +52,51 @@ class LockerManager:
             print(f"Error loading lockers: {e}")
             self.lockers = {}
     
-    def save_lockers(self, lockers_file=LOCKERS_FILE):
+    def save_lockers(self, lockers_file=None):
         """
         Save current locker assignments
         
-        :param lockers_file: Path to save locker data
+        :param lockers_file: Path to save locker data (default: the file they were loaded from)
         """
+        if lockers_file is None:
+            lockers_file = self.lockers_file
         try:
             with open(lockers_file, "wb") as f:
                 pickle.dump(self.lockers, f)
         except Exception as e:
             print(f"Error saving lockers: {e}")
     
+    def add_listener(self, callback):
+        """
+        Register a callback for assignment changes
+        
+        :param callback: Called with (name, bank) after an assignment, (name, None) after a release
+        """
+        self._listeners.append(callback)
+    
+    def _notify(self, name, bank):
+        for callback in self._listeners:
+            try:
+                callback(name, bank)
+            except Exception as e:
+                print(f"Error in locker listener: {e}")
+    
+    def bank_members(self, bank=LOCKER_BANK):
+        """
+        Names with a locker in a bank (lockers assigned before banks existed belong to this kiosk's bank)
+        
+        :param bank: Locker bank
+        """
+        return {name for name, data in self.lockers.items() if data.get("bank", LOCKER_BANK) == bank}
+    
     def _initialize_gpio_pins(self):
         """
         Initialize GPIO pins for all assigned lockers
         """
         for locker_data in self.lockers.values():
             gpio_pin = locker_data['gpio']
-            GPIO.setup(gpio_pin, GPIO.OUT)
-            GPIO.output(gpio_pin, GPIO.LOW)  # Default all lockers to closed
+            self.gpio.setup(gpio_pin, self.gpio.OUT)
+            self.gpio.output(gpio_pin, self.gpio.LOW)  # Default all lockers to closed
     
     def assign_locker(self, name):
         """
@@ -82,56 +119,93 @@ class LockerManager:
             for pin in AVAILABLE_GPIO_PINS:
                 if i not in used_lockers and pin not in used_pins:
                     # Assign locker
-                    locker_details = {"locker": i, "gpio": pin}
+                    locker_details = {"locker": i, "gpio": pin, "bank": LOCKER_BANK}
                     self.lockers[name] = locker_details
                     
                     # Setup GPIO pin
-                    GPIO.setup(pin, GPIO.OUT)
-                    GPIO.output(pin, GPIO.LOW)
+                    self.gpio.setup(pin, self.gpio.OUT)
+                    self.gpio.output(pin, self.gpio.LOW)
                     
                     # Save updated lockers
                     self.save_lockers()
+                    self._notify(name, LOCKER_BANK)
                     
                     return locker_details
         
         return None
     
-    def _auto_close_locker(self, name, gpio_pin):
+    def release_locker(self, name):
+        """
+        Remove a user's locker assignment
+        
+        :param name: Name of the user
+        :return: True if the user had a locker
+        """
+        name = name.lower()
+        if name not in self.lockers:
+            return False
+        del self.lockers[name]
+        self.save_lockers()
+        self._notify(name, None)
+        return True
+    
+    def _schedule_close(self, name, gpio_pin):
         """
-        Automatically close locker after a delay
+        Start a cancellable auto-close timer
         
         :param name: Name of the user
         :param gpio_pin: GPIO pin to control
+        :return: Timer handle; the callback receives it to tell whether it is still current
+        """
+        def close():
+            self._auto_close_locker(name, gpio_pin, handle)
+
+        scheduler = self.scheduler if self.scheduler is not None else self.clock
+        handle = scheduler.call_later(LOCKER_HOLD_SECONDS, close)
+        return handle
+    
+    def _auto_close_locker(self, name, gpio_pin, handle):
+        """
+        Close a locker once its hold time is over (timer callback)
+        
+        :param name: Name of the user
+        :param gpio_pin: GPIO pin to control
+        :param handle: The firing timer; a timer replaced by a reopen (it may already
+                       be on its way to the executor when cancelled) does nothing
         """
         try:
-            # Wait for 5 seconds
-            time.sleep(5)
-            
-            # Close the locker
-            GPIO.output(gpio_pin, GPIO.LOW)
-            print(f"Auto-closed locker for {name}")
-            
-            # Remove from active timers
-            if name in self.active_timers:
+            with self._timer_lock:
+                if self.active_timers.get(name) is not handle:
+                    return
                 del self.active_timers[name]
+                # Close the locker
+                self.gpio.output(gpio_pin, self.gpio.LOW)
+            print(f"Auto-closed locker for {name}")
                 
         except Exception as e:
             print(f"Error auto-closing locker: {e}")
             # Force close in case of error
             try:
-                GPIO.output(gpio_pin, GPIO.LOW)
+                self.gpio.output(gpio_pin, self.gpio.LOW)
             except:
                 pass
     
-    def open_locker(self, name):
+    def open_locker(self, name, **audit_fields):
         """
         Open locker for a specific user
         
         :param name: Name of the user
+        :param audit_fields: Extra fields for the audit event (distance, latency, ...)
         :return: Success status and message
         """
-        name = name.lower()
-        
+        success, message = self._open_locker(name.lower())
+        if self.audit_log:
+            locker_info = self.lockers.get(name.lower(), {})
+            self.audit_log.log("unlock", identity=name.lower(), locker=locker_info.get("locker"),
+                               success=success, message=message, **audit_fields)
+        return success, message
+    
+    def _open_locker(self, name):
         if name not in self.lockers:
             return False, f"No locker assigned for {name}"
         
@@ -139,21 +213,20 @@ class LockerManager:
         gpio_pin = locker_info['gpio']
         
         try:
-            # Cancel any existing timer
-            if name in self.active_timers and self.active_timers[name].is_alive():
-                print(f"Cancelling existing timer for {name}")
-                # Don't need to actually cancel, just let it run and start a new one
-            
-            # Unlock the locker
-            GPIO.output(gpio_pin, GPIO.HIGH)
-            
-            # Create auto-close timer
-            timer = threading.Thread(target=self._auto_close_locker, 
-                                     args=(name, gpio_pin), daemon=True)
-            timer.start()
-            self.active_timers[name] = timer
+            with self._timer_lock:
+                # Reopening restarts the hold time instead of closing on the old timer
+                timer = self.active_timers.pop(name, None)
+                if timer is not None:
+                    print(f"Cancelling existing timer for {name}")
+                    timer.cancel()
+                
+                # Unlock the locker
+                self.gpio.output(gpio_pin, self.gpio.HIGH)
+                
+                # Create auto-close timer
+                self.active_timers[name] = self._schedule_close(name, gpio_pin)
             
-            return True, f"Locker {locker_info['locker']} opened (auto-close in 5s)"
+            return True, f"Locker {locker_info['locker']} opened (auto-close in {LOCKER_HOLD_SECONDS}s)"
         
         except Exception as e:
             return False, f"Error opening locker: {e}"
@@ -175,7 +248,7 @@ class LockerManager:
         
         try:
             # Lock the locker
-            GPIO.output(gpio_pin, GPIO.LOW)
+            self.gpio.output(gpio_pin, self.gpio.LOW)
             return True, f"Locker {locker_info['locker']} closed"
         
         except Exception as e:
@@ -185,12 +258,52 @@ class LockerManager:
         """
         Cleanup GPIO pins
         """
+        with self._timer_lock:
+            for timer in self.active_timers.values():
+                timer.cancel()
+            self.active_timers.clear()
+        
         # Ensure all lockers are closed before cleanup
         for name, locker_info in self.lockers.items():
             try:
-                GPIO.output(locker_info['gpio'], GPIO.LOW)
+                self.gpio.output(locker_info['gpio'], self.gpio.LOW)
             except:
                 pass
         
         # Then do cleanup
-        GPIO.cleanup()
+        self.gpio.cleanup()
+
+
+class ReopenGuard:
+    def __init__(self, min_reopen_time=10, clock=SYSTEM_CLOCK):
+        """
+        Suppresses repeated unlocks while a recognized person stays in view
+
+        :param min_reopen_time: Minimum seconds between opening the same locker
+        :param clock: Clock the reopen times are measured with
+        """
+        self.min_reopen_time = min_reopen_time
+        self.clock = clock
+        self.last_opened = {}  # Name -> clock.monotonic() of the last (or queued) unlock
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def claim(self, name):
+        """
+        Reserve an unlock for name unless their locker was opened within min_reopen_time
+
+        :return: True if the caller should open the locker
+        """
+        now = self.clock.monotonic()
+        with self._lock:
+            last = self.last_opened.get(name)
+            if last is not None and now - last <= self.min_reopen_time:
+                self.suppressed += 1
+                return False
+            self.last_opened[name] = now
+            return True
+
+    def release(self, name):
+        """Give up a claim after the unlock failed, so the next sighting tries again"""
+        with self._lock:
+            self.last_opened.pop(name, None)
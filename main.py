@@ -29,10 +29,17 @@ def main():
         from camera_module import CameraManager
         from face_recognition_module import FaceRecognitionManager
         from locker_control_module import LockerManager
-        from ui_module import LockerAccessUI
+        from startup_module import StartupCoordinator, StartupScreen, warm_up_models
+        from profiler_module import SamplingProfiler
+        from config import REPLAY_FILE
         
         log_message(log_file, "[main.py] Modules imported successfully")
         
+        # Stack sampling on demand (signal or control socket); idle until asked
+        profiler = SamplingProfiler()
+        profiler.install_signal()
+        profiler.serve()
+        
         # Initialize root window
         root = tk.Tk()
         root.configure(bg="black")
@@ -43,24 +50,43 @@ def main():
         root.after_idle(root.attributes, '-topmost', False)  # Let others be on top later
         root.attributes('-fullscreen', True)
         
-        log_message(log_file, "[main.py] Initializing camera...")
-        camera_manager = None
-        try:
-            camera_manager = CameraManager()
-            if not camera_manager.picam2:
+        def init_camera():
+            if REPLAY_FILE:
+                # Bench mode: feed the pipeline from a field recording
+                from frame_recorder_module import ReplayCamera
+                return ReplayCamera(REPLAY_FILE)
+            camera = CameraManager()
+            if not camera.picam2:
+                camera.stop()
                 raise RuntimeError("Camera failed to initialize properly")
-            log_message(log_file, "[main.py] Camera initialized successfully")
-        except Exception as e:
-            log_message(log_file, f"[main.py] Camera error: {e}")
-            if camera_manager:
-                camera_manager.stop()
-            raise
+            return camera
         
-        log_message(log_file, "[main.py] Initializing face recognition...")
-        face_recognizer = FaceRecognitionManager()
+        # Camera bring-up, gallery load, GPIO setup and model warmup are
+        # independent, so run them concurrently behind a progress screen
+        log_message(log_file, "[main.py] Starting parallel initialization...")
+        startup = StartupCoordinator(log=lambda message: log_message(log_file, message))
+        startup.add_phase("camera", init_camera, release=lambda camera: camera.stop())
+        startup.add_phase("gallery", FaceRecognitionManager)
+        startup.add_phase("lockers", LockerManager, release=lambda lockers: lockers.cleanup())
+        startup.add_phase("models", warm_up_models)
+        startup_screen = StartupScreen(root)
+        startup.start()
+        startup.wait(root, startup_screen)
         
-        log_message(log_file, "[main.py] Initializing locker manager...")
-        locker_manager = LockerManager()
+        # A failed phase re-raises its error here, after the phases that did
+        # start (camera, GPIO) were stopped again
+        startup.check()
+        locker_manager = startup.result("lockers")
+        face_recognizer = startup.result("gallery")
+        camera_manager = startup.result("camera")
+        startup.result("models")
+        
+        timings = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in startup.timings().items())
+        log_message(log_file, f"[main.py] Startup complete: {timings}")
+        startup_screen.close()
+        
+        # Imported after warmup so the models are already loaded
+        from ui_module import LockerAccessUI
         
         log_message(log_file, "[main.py] Starting UI...")
         app = LockerAccessUI(root, camera_manager, face_recognizer, locker_manager)
@@ -88,6 +114,9 @@ def main():
             except Exception as e:
                 log_message(log_file, f"[main.py] Error stopping camera: {e}")
         
+        if 'profiler' in locals():
+            profiler.close()
+        
         if 'locker_manager' in locals() and locker_manager:
             try:
                 locker_manager.cleanup()
@@ -0,0 +1,542 @@
+# matching_service_module.py
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import pickle
+import argparse
+import tempfile
+import threading
+import traceback
+import subprocess
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import numpy as np
+from config import (ENCODINGS_FILE, MATCH_SERVER_ADDRESS, MATCH_SERVER_TIMEOUT, MATCH_SERVER_MAX_BATCH,
+                    MATCH_SERVER_RELOAD_INTERVAL, MATCH_SERVER_RETRY)
+
+# Frame header: payload length, request id, message type
+HEADER = struct.Struct("<IIB")
+MATCH, RESULT, STATS, ERROR = 1, 2, 3, 4
+ENCODING_SIZE = 128
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+# Latencies kept for the server's percentile report
+LATENCY_WINDOW = 10000
+
+
+def parse_address(address):
+    """
+    :param address: "unix:/path/to/socket" or "host:port"
+    :return: (socket family, address)
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Connection closed")
+        received += count
+    return bytes(buffer)
+
+
+def read_message(sock):
+    """:return: (request id, message type, payload)"""
+    length, request_id, kind = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise ConnectionError(f"Payload of {length} bytes exceeds limit")
+    return request_id, kind, _recv_exact(sock, length) if length else b""
+
+
+def pack_message(request_id, kind, payload=b""):
+    return HEADER.pack(len(payload), request_id, kind) + payload
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(np.asarray(values), [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.open = True
+
+    def send(self, request_id, kind, payload=b""):
+        if not self.open:
+            return
+        try:
+            with self.send_lock:
+                self.sock.sendall(pack_message(request_id, kind, payload))
+        except OSError:
+            self.open = False
+
+
+class MatchServer:
+    def __init__(self, face_manager, address=MATCH_SERVER_ADDRESS, max_batch=MATCH_SERVER_MAX_BATCH,
+                 reload_interval=MATCH_SERVER_RELOAD_INTERVAL):
+        """
+        Serves gallery matching to kiosks over a TCP or Unix socket.
+
+        Every connection gets a reader thread; requests from all connections
+        go through one queue to the matching thread, which takes whatever is
+        waiting (up to max_batch probes) and matches it in one vectorized
+        call. Clients may pipeline several requests per connection; each
+        response carries its request id. The gallery file is reloaded when
+        it changes on disk.
+
+        :param face_manager: FaceRecognitionManager holding the gallery
+        :param address: "unix:/path" or "host:port"
+        :param max_batch: Max probes matched in one call
+        :param reload_interval: Seconds between checks of the gallery file
+        """
+        self.face_manager = face_manager
+        self.address = address
+        self.max_batch = max_batch
+        self.reload_interval = reload_interval
+        self._requests = queue.Queue()
+        self._running = False
+        self._listener = None
+        self._gallery_mtime = self._mtime()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._started = None
+        self.requests = 0
+        self.probes = 0
+        self.batches = 0
+        self.connections = 0
+
+    def _mtime(self):
+        try:
+            return os.path.getmtime(self.face_manager.encodings_file)
+        except OSError:
+            return None
+
+    def start(self):
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)
+        self._listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(address)
+        self._listener.listen(64)
+        self._running = True
+        self._started = time.monotonic()
+        threading.Thread(target=self._accept_loop, name="match-accept", daemon=True).start()
+        threading.Thread(target=self._match_loop, name="match-worker", daemon=True).start()
+        print(f"[MatchServer] Listening on {self.address} with {len(self.face_manager.known_names)} template(s)")
+
+    def stop(self):
+        self._running = False
+        self._requests.put(None)
+        if self._listener:
+            self._listener.close()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                break
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections += 1
+            threading.Thread(target=self._read_loop, args=(_Connection(sock),),
+                             name="match-conn", daemon=True).start()
+
+    def _read_loop(self, conn):
+        try:
+            while self._running:
+                request_id, kind, payload = read_message(conn.sock)
+                if kind == MATCH:
+                    if len(payload) % (ENCODING_SIZE * 4):
+                        conn.send(request_id, ERROR, b"Malformed encodings")
+                        continue
+                    probes = np.frombuffer(payload, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+                    self._requests.put((conn, request_id, probes, time.perf_counter()))
+                elif kind == STATS:
+                    conn.send(request_id, RESULT, json.dumps(self.stats()).encode())
+                else:
+                    conn.send(request_id, ERROR, b"Unknown message type")
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.open = False
+            conn.sock.close()
+
+    def _maybe_reload(self):
+        mtime = self._mtime()
+        if mtime != self._gallery_mtime:
+            self._gallery_mtime = mtime
+            print("[MatchServer] Gallery file changed, reloading")
+            self.face_manager.load_encodings(self.face_manager.encodings_file)
+
+    def _match_loop(self):
+        last_check = time.monotonic()
+        while self._running:
+            try:
+                request = self._requests.get(timeout=self.reload_interval)
+            except queue.Empty:
+                request = False
+            if request is None:
+                break
+            if time.monotonic() - last_check >= self.reload_interval:
+                last_check = time.monotonic()
+                self._maybe_reload()
+            if not request:
+                continue
+
+            # Take everything that is already waiting, up to max_batch probes
+            batch = [request]
+            count = len(request[2])
+            while count < self.max_batch:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._running = False
+                    break
+                batch.append(request)
+                count += len(request[2])
+
+            try:
+                probes = np.concatenate([probes for _, _, probes, _ in batch]).astype(np.float64)
+                matches = self.face_manager.find_best_matches(probes)
+            except Exception as e:
+                print(f"[MatchServer] Matching failed: {e}")
+                traceback.print_exc()
+                for conn, request_id, _, _ in batch:
+                    conn.send(request_id, ERROR, str(e).encode())
+                continue
+
+            offset = 0
+            done = time.perf_counter()
+            for conn, request_id, probes, received in batch:
+                result = [[name, float(distance)] for name, distance in matches[offset:offset + len(probes)]]
+                offset += len(probes)
+                conn.send(request_id, RESULT, json.dumps(result).encode())
+                self._latencies.append(done - received)
+            self.requests += len(batch)
+            self.probes += count
+            self.batches += 1
+
+    def stats(self):
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            "connections": self.connections,
+            "requests": self.requests,
+            "probes": self.probes,
+            "probes_per_batch": self.probes / self.batches if self.batches else 0.0,
+            "requests_per_second": self.requests / elapsed if elapsed else 0.0,
+            "latency": _percentiles(list(self._latencies)),
+        }
+
+
+class MatchClient:
+    def __init__(self, address=MATCH_SERVER_ADDRESS, timeout=MATCH_SERVER_TIMEOUT, retry=MATCH_SERVER_RETRY):
+        """
+        Persistent, pipelined connection to a MatchServer.
+
+        Any number of threads may have requests in flight on the one
+        connection; a reader thread resolves them by request id. After a
+        connection failure, requests fail immediately for retry seconds so
+        the caller falls back to local matching without waiting.
+
+        :param address: "unix:/path" or "host:port"
+        :param timeout: Seconds to wait for a response
+        :param retry: Seconds before reconnecting after a failure
+        """
+        self.address = address
+        self.timeout = timeout
+        self.retry = retry
+        self._sock = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._next_id = 0
+        self._retry_at = 0.0
+
+    def _connect(self):
+        if time.monotonic() < self._retry_at:
+            raise ConnectionError("Match server unavailable")
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            self._retry_at = time.monotonic() + self.retry
+            raise
+        sock.settimeout(None)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        threading.Thread(target=self._read_loop, args=(sock,), name="match-client", daemon=True).start()
+
+    def _read_loop(self, sock):
+        try:
+            while True:
+                request_id, kind, payload = read_message(sock)
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue  # Caller already gave up on it
+                if kind == RESULT:
+                    future.set_result(json.loads(payload))
+                else:
+                    future.set_exception(RuntimeError(payload.decode(errors="replace")))
+        except (ConnectionError, OSError) as e:
+            self._fail(sock, e)
+
+    def _fail(self, sock, error):
+        """Drop a broken connection and fail everything waiting on it"""
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+                self._retry_at = time.monotonic() + self.retry
+            pending, self._pending = self._pending, {}
+        # close() alone does not wake a reader blocked in recv on Linux
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(str(error)))
+
+    def submit(self, kind, payload=b""):
+        """
+        Send a request without waiting for the response
+
+        :return: (request id, Future resolving to the decoded response)
+        """
+        future = Future()
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            request_id = self._next_id
+            self._pending[request_id] = future
+            sock = self._sock
+        try:
+            sock.sendall(pack_message(request_id, kind, payload))
+        except OSError as e:
+            self._fail(sock, e)
+            raise ConnectionError(str(e))
+        return request_id, future
+
+    def _wait(self, request_id, future, timeout):
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            # Forget the request and match locally for the retry window
+            # instead of waiting out the timeout on every call to a hung server
+            with self._lock:
+                self._pending.pop(request_id, None)
+                self._retry_at = time.monotonic() + self.retry
+                sock, self._sock = self._sock, None
+            if sock is not None:
+                self._fail(sock, TimeoutError("Match server did not respond in time"))
+            raise TimeoutError("Match server did not respond in time")
+
+    def match(self, encodings, timeout=None):
+        """
+        Match encodings on the server
+
+        :param encodings: List of 128-d face encodings
+        :return: List of (name, distance), parallel to the input
+        :raises TimeoutError, ConnectionError: The caller should fall back to local matching
+        """
+        payload = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE).tobytes()
+        return [tuple(match) for match in self._wait(*self.submit(MATCH, payload), timeout)]
+
+    def stats(self, timeout=None):
+        return self._wait(*self.submit(STATS), timeout)
+
+    def close(self):
+        with self._lock:
+            sock = self._sock
+        if sock:
+            self._fail(sock, ConnectionError("Client closed"))
+
+
+def _synthetic_gallery(path, identities, templates=3, seed=0):
+    """Write a random gallery file for benchmarking"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(identities, ENCODING_SIZE))
+    centers *= 0.6 / np.linalg.norm(centers, axis=1, keepdims=True)
+    encodings, names = [], []
+    for i, center in enumerate(centers):
+        for _ in range(templates):
+            encodings.append(center + rng.normal(scale=0.03, size=ENCODING_SIZE))
+            names.append(f"user{i:06d}")
+    with open(path, "wb") as f:
+        pickle.dump({"encodings": encodings, "names": names}, f)
+    return centers
+
+
+def _wait_for_server(address, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        client = MatchClient(address, timeout=1.0, retry=0.0)
+        try:
+            client.stats()
+            return True
+        except (ConnectionError, OSError, TimeoutError):
+            time.sleep(0.2)
+        finally:
+            client.close()
+    return False
+
+
+def benchmark(address, clients=8, requests=500, batch=2, pipeline=4, probes=None):
+    """
+    Drive a server from several concurrent clients
+
+    :param clients: Concurrent connections (one thread each)
+    :param requests: Requests per client
+    :param batch: Encodings per request
+    :param pipeline: Requests each client keeps in flight
+    :param probes: Array of encodings to send (random if None)
+    :return: Dict with client-side throughput and latency percentiles
+    """
+    if probes is None:
+        probes = np.random.default_rng(1).normal(scale=0.05, size=(256, ENCODING_SIZE))
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+
+    def worker(slot):
+        worker_rng = np.random.default_rng(slot)
+
+        def _collect(item):
+            sent, future = item
+            try:
+                future.result(5.0)
+                latencies[slot].append(time.perf_counter() - sent)
+            except Exception:
+                errors[slot] += 1
+        client = MatchClient(address, timeout=5.0)
+        in_flight = deque()
+        try:
+            for _ in range(requests):
+                rows = worker_rng.integers(0, len(probes), size=batch)
+                payload = np.asarray(probes[rows], dtype=np.float32).tobytes()
+                in_flight.append((time.perf_counter(), client.submit(MATCH, payload)[1]))
+                if len(in_flight) >= pipeline:
+                    _collect(in_flight.popleft())
+            while in_flight:
+                _collect(in_flight.popleft())
+        finally:
+            client.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    completed = [value for values in latencies for value in values]
+    return {
+        "clients": clients,
+        "requests": len(completed),
+        "errors": sum(errors),
+        "seconds": elapsed,
+        "requests_per_second": len(completed) / elapsed,
+        "probes_per_second": len(completed) * batch / elapsed,
+        "latency": _percentiles(completed),
+    }
+
+
+def _format_latency(latency):
+    return ", ".join(f"{key}={value * 1000:.2f}ms" for key, value in latency.items() if value is not None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Central face matching server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run a matching server")
+    serve.add_argument("--address", default=MATCH_SERVER_ADDRESS or "127.0.0.1:7700")
+    serve.add_argument("--encodings", default=ENCODINGS_FILE, help="Gallery file")
+
+    bench = commands.add_parser("bench", help="Measure throughput and tail latency under concurrent clients")
+    bench.add_argument("--address", default=MATCH_SERVER_ADDRESS or "unix:/tmp/face_match.sock")
+    bench.add_argument("--spawn", type=int, metavar="IDENTITIES",
+                       help="Start a local server process with a synthetic gallery of this many identities")
+    bench.add_argument("--clients", type=int, default=8)
+    bench.add_argument("--requests", type=int, default=500, help="Requests per client")
+    bench.add_argument("--batch", type=int, default=2, help="Encodings per request")
+    bench.add_argument("--pipeline", type=int, default=4, help="Requests in flight per client")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        # Imported here so the client side does not need the gallery stack
+        from face_recognition_module import FaceRecognitionManager
+        # The server's own gallery always matches locally, even if this
+        # host's config points kiosks at a server
+        server = MatchServer(FaceRecognitionManager(args.encodings, match_server=None), args.address)
+        server.start()
+        try:
+            while True:
+                time.sleep(10)
+                stats = server.stats()
+                print(f"[MatchServer] {stats['requests']} requests, {stats['probes_per_batch']:.1f} probes/batch, "
+                      f"{stats['requests_per_second']:.0f} req/s, {_format_latency(stats['latency'])}")
+        except KeyboardInterrupt:
+            server.stop()
+        return 0
+
+    server_process = None
+    probes = None
+    gallery_file = None
+    try:
+        if args.spawn:
+            gallery_file = tempfile.NamedTemporaryFile(suffix=".pkl", delete=False).name
+            centers = _synthetic_gallery(gallery_file, args.spawn)
+            probes = centers + np.random.default_rng(2).normal(scale=0.03, size=centers.shape)
+            server_process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve",
+                                               "--address", args.address, "--encodings", gallery_file])
+            if not _wait_for_server(args.address):
+                print("Server did not come up")
+                return 1
+
+        result = benchmark(args.address, args.clients, args.requests, args.batch, args.pipeline, probes)
+        print(f"{result['clients']} clients: {result['requests']} requests ({result['errors']} errors) "
+              f"in {result['seconds']:.2f}s")
+        print(f"Throughput: {result['requests_per_second']:.0f} req/s, {result['probes_per_second']:.0f} probes/s")
+        print(f"Client latency: {_format_latency(result['latency'])}")
+
+        client = MatchClient(args.address, timeout=5.0)
+        stats = client.stats()
+        client.close()
+        print(f"Server: {stats['probes_per_batch']:.1f} probes/batch, "
+              f"latency {_format_latency(stats['latency'])}")
+    finally:
+        if server_process:
+            server_process.terminate()
+            server_process.wait()
+        if gallery_file:
+            os.remove(gallery_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
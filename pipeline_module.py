@@ -0,0 +1,374 @@
+# pipeline_module.py
+import cv2
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from clock_module import SYSTEM_CLOCK
+from config import PIPELINE_STAGES
+
+THREAD = "thread"
+PROCESS = "process"
+
+
+class DropOldestQueue:
+    def __init__(self, maxsize):
+        """
+        Bounded queue that makes room for a new item by dropping the oldest one,
+        so a slow consumer always works on the freshest input
+
+        :param maxsize: Items held at most
+        """
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """
+        :return: The item dropped to make room, or None
+        """
+        with self._cond:
+            dropped = None
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+            return dropped
+
+    def get_batch(self, max_items=1, timeout=None):
+        """
+        Wait for at least one item and take up to max_items of those waiting
+
+        :return: List of items (empty on timeout or after close)
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return []
+            count = min(max_items, len(self._items))
+            return [self._items.popleft() for _ in range(count)]
+
+    def close(self):
+        """Wake every waiting consumer; later gets return immediately"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1, mode=THREAD, queue=2, batch=1, timing=None, process_safe=True,
+                 on_drop=None, clock=SYSTEM_CLOCK):
+        """
+        One step of a Pipeline: workers take items from the stage's input
+        queue, call func and pass the result on to the next stage.
+
+        func returns the item for the next stage, None to drop it, or a list
+        of items. With batch > 1 it receives a list of up to batch items that
+        were waiting at once and returns a list.
+
+        :param name: Stage name used in stats
+        :param func: Callable applied to each item (picklable for process mode)
+        :param workers: Threads, or processes in process mode
+        :param mode: THREAD or PROCESS
+        :param queue: Size of the input queue (oldest items are dropped beyond it)
+        :param batch: Max items handed to func in one call
+        :param timing: Optional callback(name, seconds) for every call of func
+        :param process_safe: False for stages that touch shared state in this process
+        :param on_drop: Optional callback(item) for items dropped from the full input queue
+        :param clock: Clock the stage's latency and throughput are measured with
+        :raises ValueError: For an unknown mode, or process mode on a stage that is not process-safe
+        """
+        if mode not in (THREAD, PROCESS):
+            raise ValueError(f"Unknown stage mode for {name}: {mode}")
+        if mode == PROCESS and not process_safe:
+            raise ValueError(f"Stage {name} shares state with the kiosk and can only run in threads")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.mode = mode
+        self.batch = batch
+        self.timing = timing
+        self.on_drop = on_drop
+        self.clock = clock
+        self.queue = DropOldestQueue(queue)
+        self.pipeline = None
+        self.next = None
+        self._threads = []
+        self._pool = None
+        self._lock = threading.Lock()
+        self.busy = 0
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self._snapshot = (clock.monotonic(), 0, 0.0)
+
+    def start(self):
+        if self.mode == PROCESS:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"stage-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _call(self, payload):
+        if self._pool is not None:
+            return self._pool.submit(self.func, payload).result()
+        return self.func(payload)
+
+    def _work(self):
+        pipeline = self.pipeline
+        while pipeline.running:
+            items = self.queue.get_batch(self.batch, timeout=0.5)
+            if not items:
+                continue
+            outputs = self._process(items)
+            # Outputs enter the next queue before the inputs leave, so the
+            # pipeline never looks idle while an item is being handed over
+            if self.next is not None:
+                for output in outputs:
+                    pipeline._enter(self.next, output)
+            pipeline._leave(len(items))
+
+    def _process(self, items):
+        """
+        Call func on items (one call; batch stages get the list) and count it
+
+        :return: List of outputs for the next stage
+        """
+        with self._lock:
+            self.busy += 1
+        start = self.clock.monotonic()
+        try:
+            result = self._call(items if self.batch > 1 else items[0])
+        except Exception as e:
+            print(f"[Pipeline] Stage {self.name} failed: {e}")
+            traceback.print_exc()
+            result = None
+            with self._lock:
+                self.errors += 1
+        elapsed = self.clock.monotonic() - start
+        if self.timing is not None:
+            self.timing(self.name, elapsed)
+        with self._lock:
+            self.busy -= 1
+            self.processed += len(items)
+            self.busy_time += elapsed
+
+        if result is None:
+            return []
+        if isinstance(result, list):
+            return result
+        return [result]
+
+    def stats(self):
+        """
+        Counters since start and rates since the previous call
+
+        :return: Dict with depth, dropped, processed, throughput (items/s) and
+                 utilization (share of worker time spent in func)
+        """
+        now = self.clock.monotonic()
+        with self._lock:
+            processed, busy_time = self.processed, self.busy_time
+        since, last_processed, last_busy = self._snapshot
+        self._snapshot = (now, processed, busy_time)
+        elapsed = max(now - since, 1e-9)
+        done = processed - last_processed
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "depth": len(self.queue),
+            "capacity": self.queue.maxsize,
+            "dropped": self.queue.dropped,
+            "processed": processed,
+            "errors": self.errors,
+            "throughput": round(done / elapsed, 2),
+            "latency_ms": round((busy_time - last_busy) / done * 1000, 2) if done else None,
+            "utilization": round((busy_time - last_busy) / (elapsed * self.workers), 3),
+        }
+
+    def stop(self, timeout):
+        self.queue.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class Pipeline:
+    def __init__(self, stages):
+        """
+        Stages connected in order by bounded drop-oldest queues.
+
+        Each stage has its own workers, so a slow stage only drops its oldest
+        inputs instead of stalling the stages before it, and stats() shows
+        which stage is the bottleneck.
+
+        :param stages: Stage objects, first to last
+        """
+        self.stages = stages
+        self.by_name = {stage.name: stage for stage in stages}
+        for stage, following in zip(stages, stages[1:] + [None]):
+            stage.pipeline = self
+            stage.next = following
+        self.running = False
+        self._in_flight = 0  # Items queued in or being processed by any stage
+        self._idle = threading.Condition()
+
+    def start(self):
+        self.running = True
+        for stage in self.stages:
+            stage.start()
+        print("[Pipeline] Started " + " -> ".join(f"{s.name}({s.workers} {s.mode})" for s in self.stages))
+
+    def put(self, item):
+        """Feed an item to the first stage (drops its oldest waiting item when full)"""
+        self._enter(self.stages[0], item)
+
+    def _enter(self, stage, item):
+        with self._idle:
+            self._in_flight += 1
+        dropped = stage.queue.put(item)
+        if dropped is not None:
+            if stage.on_drop is not None:
+                stage.on_drop(dropped)
+            self._leave(1)
+
+    def _leave(self, count):
+        with self._idle:
+            self._in_flight -= count
+            if self._in_flight <= 0:
+                self._idle.notify_all()
+
+    @property
+    def idle(self):
+        return self._in_flight <= 0
+
+    def wait_idle(self, timeout=None):
+        """
+        Block until every queued item has passed through or been dropped
+
+        :return: True once idle, False on timeout
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight <= 0, timeout)
+
+    def process(self, item):
+        """
+        Pass an item through every stage in order on the calling thread,
+        without the workers and queues (for replays and simulations; do not
+        mix with start())
+
+        :return: List of outputs of the last stage
+        """
+        items = [item]
+        for stage in self.stages:
+            outputs = []
+            for i in range(0, len(items), stage.batch):
+                outputs.extend(stage._process(items[i:i + stage.batch]))
+            items = outputs
+        return items
+
+    def stats(self):
+        """:return: {stage name: Stage.stats()} in pipeline order"""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    @staticmethod
+    def bottleneck(stats):
+        """
+        :param stats: Result of stats()
+        :return: Name of the stage with the highest worker utilization
+        """
+        return max(stats, key=lambda name: stats[name]["utilization"])
+
+    def stop(self, timeout=2.0):
+        self.running = False
+        for stage in self.stages:
+            stage.stop(timeout)
+
+
+def stage_settings(name, stages=PIPELINE_STAGES):
+    """
+    Worker count, mode, queue size and batch size of a stage from config
+
+    :return: Keyword arguments for Stage
+    """
+    settings = dict(stages.get(name, {}))
+    return {
+        "workers": max(1, int(settings.get("workers", 1))),
+        "mode": settings.get("mode", THREAD),
+        "queue": max(1, int(settings.get("queue", 2))),
+        "batch": max(1, int(settings.get("batch", 1))),
+    }
+
+
+class FrameJob:
+    def __init__(self, seq, power_state):
+        """
+        One frame on its way through the recognition pipeline
+
+        :param seq: Camera frame sequence number
+        :param power_state: Power state when the frame was requested
+        """
+        self.seq = seq
+        self.power_state = power_state
+        self.captured_at = None
+        self.rgb = None
+        self.resize_factor = 1.0
+        self.scale = 1.0
+        self.locations = []
+        self.encodings = []
+        self.matches = []
+
+    def set_frame(self, frame, resize_factor):
+        """
+        Attach the captured frame for detection
+
+        :param frame: BGR frame, already resized
+        :param resize_factor: Factor it was resized by from the camera resolution
+        """
+        self.resize_factor = resize_factor
+        self.scale = 1.0 / resize_factor
+        self.rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def detect_faces(encoder, job):
+    """Detection stage (process-safe): fill in job.locations"""
+    job.locations = encoder.locate(job.rgb)
+    if not job.locations:
+        job.rgb = None
+    return job
+
+
+def encode_faces(encoder, job):
+    """Encoding stage (process-safe): fill in job.encodings and release the frame"""
+    if job.locations:
+        job.encodings = encoder.encode(job.rgb, job.locations)
+    job.rgb = None
+    return job
+
+
+def match_faces(recognizer, jobs):
+    """
+    Match stage: every face of the frames waiting together in one vectorized call
+
+    :param recognizer: FaceRecognitionManager (or anything with find_best_matches)
+    :param jobs: List of FrameJob (a single job when the stage does not batch)
+    """
+    if not isinstance(jobs, list):
+        jobs = [jobs]
+    encodings = [encoding for job in jobs for encoding in job.encodings]
+    if encodings:
+        matches = iter(recognizer.find_best_matches(encodings))
+        for job in jobs:
+            job.matches = [next(matches) for _ in job.encodings]
+    return jobs
@@ -0,0 +1,114 @@
+# power_module.py
+import threading
+import traceback
+import cv2
+from clock_module import SYSTEM_CLOCK
+from config import (IDLE_TIMEOUT, DEEP_IDLE_TIMEOUT, IDLE_CHECK_INTERVAL, DEEP_IDLE_CHECK_INTERVAL,
+                    MOTION_PIXEL_DELTA, MOTION_AREA_FRACTION,
+                    CAMERA_ACTIVE_FPS, CAMERA_IDLE_FPS, CAMERA_DEEP_IDLE_FPS)
+
+ACTIVE = "active"
+IDLE = "idle"
+DEEP_IDLE = "deep_idle"
+
+CHECK_INTERVALS = {IDLE: IDLE_CHECK_INTERVAL, DEEP_IDLE: DEEP_IDLE_CHECK_INTERVAL}
+CAMERA_FPS = {ACTIVE: CAMERA_ACTIVE_FPS, IDLE: CAMERA_IDLE_FPS, DEEP_IDLE: CAMERA_DEEP_IDLE_FPS}
+
+
+class PowerGovernor:
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, deep_idle_timeout=DEEP_IDLE_TIMEOUT, clock=SYSTEM_CLOCK):
+        """
+        Activity-driven power state machine (active -> idle -> deep idle)
+
+        :param idle_timeout: Seconds without activity before going idle
+        :param deep_idle_timeout: Seconds without activity before going to deep idle
+        :param clock: Clock the timeouts are measured with
+        """
+        self.idle_timeout = idle_timeout
+        self.deep_idle_timeout = deep_idle_timeout
+        self.clock = clock
+        self.state = ACTIVE
+        self.last_activity = clock.monotonic()
+        self.lock = threading.Lock()
+        self._listeners = []
+        self._previous_motion_frame = None
+
+    def add_listener(self, callback):
+        """
+        Register a callback for state changes
+
+        :param callback: Called as callback(old_state, new_state) on the thread that caused the change
+        """
+        self._listeners.append(callback)
+
+    @property
+    def preview_paused(self):
+        """The video preview only runs in the active state"""
+        return self.state != ACTIVE
+
+    def check_interval(self, active_interval):
+        """
+        Time between recognition cycles for the current state
+
+        :param active_interval: Interval to use while active
+        """
+        return CHECK_INTERVALS.get(self.state, active_interval)
+
+    def notify_activity(self):
+        """Record activity (face, motion or touch) and return to the active state"""
+        with self.lock:
+            self.last_activity = self.clock.monotonic()
+            self._previous_motion_frame = None
+        self._set_state(ACTIVE)
+
+    def update(self):
+        """
+        Apply timeouts; call once per recognition cycle
+
+        :return: The current state
+        """
+        inactive_for = self.clock.monotonic() - self.last_activity
+        if inactive_for >= self.deep_idle_timeout:
+            self._set_state(DEEP_IDLE)
+        elif inactive_for >= self.idle_timeout:
+            self._set_state(IDLE)
+        return self.state
+
+    def detect_motion(self, frame):
+        """
+        Cheap motion check against the previous idle frame
+
+        :param frame: Small BGR frame
+        :return: True if enough pixels changed
+        """
+        try:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            with self.lock:
+                previous = self._previous_motion_frame
+                self._previous_motion_frame = gray
+            if previous is None or previous.shape != gray.shape:
+                return False
+
+            diff = cv2.absdiff(gray, previous)
+            moving = cv2.countNonZero(cv2.threshold(diff, MOTION_PIXEL_DELTA, 255, cv2.THRESH_BINARY)[1])
+            return moving > gray.size * MOTION_AREA_FRACTION
+        except Exception as e:
+            print(f"[PowerGovernor] Motion check failed: {e}")
+            traceback.print_exc()
+            # Fail towards full recognition rather than staying asleep
+            return True
+
+    def _set_state(self, new_state):
+        with self.lock:
+            old_state = self.state
+            if old_state == new_state:
+                return
+            self.state = new_state
+
+        print(f"[PowerGovernor] {old_state} -> {new_state}")
+        for callback in self._listeners:
+            try:
+                callback(old_state, new_state)
+            except Exception as e:
+                print(f"[PowerGovernor] Listener error: {e}")
+                traceback.print_exc()
@@ -0,0 +1,262 @@
+# profiler_module.py
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+import traceback
+from collections import Counter
+from config import PROFILER_SIGNAL, PROFILER_SOCKET, PROFILER_SECONDS, PROFILER_RATE, PROFILER_DIR
+
+# Thread name prefixes of each group in the per-thread breakdown (first match wins)
+THREAD_GROUPS = (
+    ("tk", ("MainThread",)),
+    ("recognition", ("core-loop", "stage-", "match-client", "gallery-shard")),
+    ("timers", ("core-io",)),
+    ("camera", ("camera-", "replay", "frame-recorder")),
+)
+# Upper bound on the sampling rate (samples per second)
+MAX_RATE = 1000
+
+
+def thread_group(thread):
+    """:return: Group of a thread in the per-thread breakdown ("other" if none matches)"""
+    if isinstance(thread, threading.Timer):
+        return "timers"
+    for group, prefixes in THREAD_GROUPS:
+        if thread.name.startswith(prefixes):
+            return group
+    return "other"
+
+
+def _collapse(frame):
+    """Stack of a frame as "outermost;...;innermost" function labels"""
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir=PROFILER_DIR):
+        """
+        Samples the stacks of every thread on demand and writes them in the
+        collapsed format read by flamegraph.pl and speedscope.
+
+        Nothing runs between profiles: a profile starts one sampling thread
+        that stops itself after the requested time, so an idle profiler costs
+        nothing. Each sample walks sys._current_frames() once, which takes
+        microseconds with the kiosk's few dozen threads.
+
+        :param output_dir: Directory for the profile files
+        """
+        self.output_dir = output_dir
+        self._thread = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._done.set()
+        self.last_result = None
+        self._listener = None
+
+    @property
+    def active(self):
+        return not self._done.is_set()
+
+    def start(self, seconds=PROFILER_SECONDS, rate=PROFILER_RATE):
+        """
+        Start a profile in the background (returns immediately)
+
+        :param seconds: Sampling duration
+        :param rate: Samples per second
+        :return: False if a profile is already running
+        """
+        with self._lock:
+            if self.active:
+                return False
+            self._done.clear()
+            rate = max(1.0, min(float(rate), MAX_RATE))
+            self._thread = threading.Thread(target=self._run, args=(float(seconds), rate),
+                                            name="profiler", daemon=True)
+            self._thread.start()
+        print(f"[Profiler] Sampling all threads for {seconds:g}s at {rate:g}/s")
+        return True
+
+    def wait(self, timeout=None):
+        """:return: Result of the last profile once it is done, or None on timeout"""
+        if not self._done.wait(timeout):
+            return None
+        return self.last_result
+
+    def _run(self, seconds, rate):
+        try:
+            self.last_result = self._write(*self._sample(seconds, rate))
+            print(f"[Profiler] {self.last_result['samples']} samples written to {self.last_result['output']}")
+        except Exception as e:
+            print(f"[Profiler] Profile failed: {e}")
+            traceback.print_exc()
+            self.last_result = {"error": str(e)}
+        finally:
+            self._done.set()
+
+    def _sample(self, seconds, rate):
+        """
+        :return: (Counter of (group, thread name, stack), samples taken, elapsed seconds)
+        """
+        stacks = Counter()
+        own = threading.get_ident()
+        interval = 1.0 / rate
+        start = time.monotonic()
+        deadline = start + seconds
+        next_sample = start
+        samples = 0
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now < next_sample:
+                time.sleep(next_sample - now)
+                continue
+            # A late sample is not made up for: skip to the next slot
+            next_sample += interval * max(1, int((now - next_sample) / interval) + 1)
+            threads = {thread.ident: thread for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                thread = threads.get(ident)
+                if thread is None:
+                    group, name = "other", f"thread-{ident}"
+                else:
+                    group, name = thread_group(thread), thread.name
+                stacks[(group, name, _collapse(frame))] += 1
+            samples += 1
+        return stacks, samples, time.monotonic() - start
+
+    def _write(self, stacks, samples, elapsed):
+        """
+        Write the combined profile (one root frame per group and thread) and
+        one profile per thread group
+
+        :return: Summary dict with the output paths and samples per group
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, "profile-" + time.strftime("%Y%m%d-%H%M%S"))
+        groups = {}
+        with open(base + ".collapsed", "w", encoding="utf-8") as combined:
+            for (group, name, stack), count in sorted(stacks.items()):
+                combined.write(f"{group};{name};{stack} {count}\n")
+                groups.setdefault(group, []).append((name, stack, count))
+
+        breakdown = {}
+        for group, entries in groups.items():
+            with open(f"{base}-{group}.collapsed", "w", encoding="utf-8") as f:
+                for name, stack, count in entries:
+                    f.write(f"{name};{stack} {count}\n")
+            innermost = Counter()
+            for _, stack, count in entries:
+                innermost[stack.rsplit(";", 1)[-1]] += count
+            breakdown[group] = {
+                "threads": len({name for name, _, _ in entries}),
+                "samples": sum(count for _, _, count in entries),
+                "top": innermost.most_common(5),
+            }
+        return {"output": base + ".collapsed", "samples": samples, "seconds": round(elapsed, 2),
+                "groups": breakdown}
+
+    def install_signal(self, signame=PROFILER_SIGNAL):
+        """
+        Start a default-length profile whenever the process receives signame
+        (must be called from the main thread)
+
+        :param signame: Signal name such as "SIGUSR1"; None does nothing
+        """
+        if not signame:
+            return
+        signal.signal(getattr(signal, signame), lambda signum, frame: self.start())
+        print(f"[Profiler] {signame} starts a {PROFILER_SECONDS}s profile (pid {os.getpid()})")
+
+    def serve(self, path=PROFILER_SOCKET):
+        """
+        Accept profile requests on a local Unix socket.
+
+        A request is one JSON line {"seconds": s, "rate": r}; the reply is
+        the profile summary as one JSON line once sampling has finished.
+
+        :param path: Socket path; None does nothing
+        """
+        if not path:
+            return
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(path)
+            os.chmod(path, 0o600)
+            listener.listen(4)
+        except OSError as e:
+            # Profiling is a diagnostic; never keep the kiosk from starting
+            print(f"[Profiler] Control socket unavailable: {e}")
+            return
+        self._listener = listener
+        threading.Thread(target=self._accept_loop, name="profiler-control", daemon=True).start()
+        print(f"[Profiler] Control socket at {path}")
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                break
+            with conn:
+                try:
+                    request = json.loads(conn.makefile("r", encoding="utf-8").readline() or "{}")
+                    if self.start(request.get("seconds", PROFILER_SECONDS), request.get("rate", PROFILER_RATE)):
+                        reply = self.wait()
+                    else:
+                        reply = {"error": "A profile is already running"}
+                    conn.sendall((json.dumps(reply) + "\n").encode())
+                except (OSError, ValueError, AttributeError) as e:
+                    print(f"[Profiler] Bad control request: {e}")
+
+    def close(self):
+        if self._listener is not None:
+            path = self._listener.getsockname()
+            self._listener.close()
+            self._listener = None
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the running kiosk through its control socket")
+    parser.add_argument("--socket", default=PROFILER_SOCKET, help="Control socket of the kiosk")
+    parser.add_argument("--seconds", type=float, default=PROFILER_SECONDS)
+    parser.add_argument("--rate", type=float, default=PROFILER_RATE, help="Samples per second")
+    args = parser.parse_args(argv)
+
+    if not args.socket:
+        print("No control socket configured (PROFILER_SOCKET)")
+        return 1
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(args.socket)
+        sock.sendall((json.dumps({"seconds": args.seconds, "rate": args.rate}) + "\n").encode())
+        reply = json.loads(sock.makefile("r", encoding="utf-8").readline())
+    if "error" in reply:
+        print(f"Profile failed: {reply['error']}")
+        return 1
+    print(f"{reply['samples']} samples over {reply['seconds']}s -> {reply['output']}")
+    for group, info in sorted(reply["groups"].items(), key=lambda item: -item[1]["samples"]):
+        print(f"  {group}: {info['threads']} thread(s), {info['samples']} thread samples")
+        for label, count in info["top"]:
+            print(f"      {count:>6}  {label}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
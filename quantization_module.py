@@ -0,0 +1,353 @@
+# quantization_module.py
+import sys
+import argparse
+import numpy as np
+from config import ENCODINGS_FILE, THRESHOLD, PQ_SUBSPACES
+
+FULL_PRECISION = "float64"
+
+# Range always covered by the int8 codec; dlib encodings stay well inside it,
+# so later enrollments are not clipped even if the codec was fitted on a few
+INT8_DEFAULT_RANGE = 0.5
+# Product quantization needs a reasonable training set before it is used
+PQ_MIN_TRAINING = 256
+# k-means iterations when training product-quantization codebooks
+PQ_ITERATIONS = 20
+# Subvectors per block when assigning centroids; a block's distances to the
+# 256 centroids (512 KB) stay in cache
+PQ_BLOCK = 512
+
+
+class Float16Codec:
+    mode = "float16"
+
+    def __init__(self):
+        self.fitted = True
+
+    def can_fit(self, count):
+        return True
+
+    def fit(self, encodings):
+        return self
+
+    def encode(self, encodings):
+        return np.asarray(encodings, dtype=np.float16)
+
+    def decode(self, codes):
+        return codes.astype(np.float32)
+
+    def distances(self, codes, probe):
+        """Distances from a full-precision probe to every coded vector"""
+        return np.linalg.norm(codes.astype(np.float32) - probe, axis=1)
+
+    def bytes_per_vector(self, dim):
+        return dim * 2
+
+    def state(self):
+        return {"mode": self.mode}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls()
+
+
+class Int8Codec:
+    mode = "int8"
+
+    def __init__(self, low=None, scale=None):
+        """
+        Per-dimension affine quantization to one byte per value
+
+        :param low: Per-dimension minimum
+        :param scale: Per-dimension step size
+        """
+        self.low = low
+        self.scale = scale
+
+    @property
+    def fitted(self):
+        return self.low is not None
+
+    def can_fit(self, count):
+        return True
+
+    def fit(self, encodings):
+        encodings = np.asarray(encodings, dtype=np.float32)
+        low = np.minimum(encodings.min(axis=0), -INT8_DEFAULT_RANGE)
+        high = np.maximum(encodings.max(axis=0), INT8_DEFAULT_RANGE)
+        self.low = low.astype(np.float32)
+        self.scale = ((high - low) / 255.0).astype(np.float32)
+        return self
+
+    def encode(self, encodings):
+        encodings = np.asarray(encodings, dtype=np.float32)
+        codes = np.rint((encodings - self.low) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes):
+        return self.low + codes.astype(np.float32) * self.scale
+
+    def distances(self, codes, probe):
+        """Asymmetric distances: the probe stays in full precision"""
+        shifted = (np.asarray(probe, dtype=np.float32) - self.low) / self.scale
+        diff = codes.astype(np.float32) - shifted
+        return np.sqrt(np.einsum("ij,ij,j->i", diff, diff, self.scale * self.scale))
+
+    def bytes_per_vector(self, dim):
+        return dim
+
+    def state(self):
+        return {"mode": self.mode, "low": self.low, "scale": self.scale}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["low"], state["scale"])
+
+
+class ProductQuantizationCodec:
+    mode = "pq"
+
+    def __init__(self, subspaces=PQ_SUBSPACES, codebooks=None):
+        """
+        Product quantization: each vector is split into subspaces and every
+        subvector is replaced by the index of its nearest codebook centroid
+
+        :param subspaces: Number of subspaces (bytes per vector)
+        :param codebooks: Trained codebooks, shape (subspaces, centroids, subspace dim)
+        """
+        self.subspaces = subspaces
+        self.codebooks = codebooks
+
+    @property
+    def fitted(self):
+        return self.codebooks is not None
+
+    def can_fit(self, count):
+        return count >= PQ_MIN_TRAINING
+
+    def _split(self, encodings):
+        encodings = np.asarray(encodings, dtype=np.float32)
+        return encodings.reshape(len(encodings), self.subspaces, -1)
+
+    def fit(self, encodings, seed=0):
+        parts = self._split(encodings)
+        rng = np.random.default_rng(seed)
+        centroids = min(256, len(parts))
+        codebooks = []
+        for m in range(self.subspaces):
+            data = np.ascontiguousarray(parts[:, m, :])
+            book = data[rng.choice(len(data), centroids, replace=False)].copy()
+            for _ in range(PQ_ITERATIONS):
+                assignment = self._nearest(data, book)
+                # Move every centroid to the mean of its members in one pass
+                counts = np.bincount(assignment, minlength=centroids)
+                sums = np.stack([np.bincount(assignment, weights=data[:, j], minlength=centroids)
+                                 for j in range(data.shape[1])], axis=1)
+                filled = counts > 0
+                book[filled] = sums[filled] / counts[filled, None]
+            codebooks.append(book)
+        self.codebooks = np.stack(codebooks)
+        return self
+
+    @staticmethod
+    def _nearest(data, book, block_size=PQ_BLOCK):
+        """
+        Index of the closest centroid for each row, one block of rows at a time
+        (||x||^2 - 2x.c + ||c||^2 as in gallery_module._block_distances; ||x||^2
+        is the same for every centroid of a row, so the argmin leaves it out)
+        """
+        book_norms = np.einsum("ij,ij->i", book, book)
+        scaled = np.ascontiguousarray(-2.0 * book.T)
+        nearest = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), block_size):
+            distances = data[start:start + block_size] @ scaled
+            distances += book_norms
+            nearest[start:start + block_size] = distances.argmin(axis=1)
+        return nearest
+
+    def encode(self, encodings):
+        parts = self._split(encodings)
+        codes = np.empty((len(parts), self.subspaces), dtype=np.uint8)
+        for m in range(self.subspaces):
+            codes[:, m] = self._nearest(parts[:, m, :], self.codebooks[m])
+        return codes
+
+    def decode(self, codes):
+        parts = self.codebooks[np.arange(self.subspaces), codes]
+        return parts.reshape(len(codes), -1)
+
+    def distances(self, codes, probe):
+        """Asymmetric distance computation with per-subspace lookup tables"""
+        probe_parts = np.asarray(probe, dtype=np.float32).reshape(self.subspaces, 1, -1)
+        tables = ((self.codebooks - probe_parts) ** 2).sum(axis=2)
+        return np.sqrt(tables[np.arange(self.subspaces), codes].sum(axis=1))
+
+    def bytes_per_vector(self, dim):
+        return self.subspaces
+
+    def state(self):
+        return {"mode": self.mode, "subspaces": self.subspaces, "codebooks": self.codebooks}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["subspaces"], state["codebooks"])
+
+
+CODECS = {codec.mode: codec for codec in (Float16Codec, Int8Codec, ProductQuantizationCodec)}
+
+
+def create_codec(mode):
+    """
+    Create an (untrained) codec
+
+    :param mode: "float16", "int8" or "pq"; "float64" means full precision and returns None
+    """
+    if mode == FULL_PRECISION:
+        return None
+    if mode not in CODECS:
+        raise ValueError(f"Unknown gallery storage mode: {mode}")
+    return CODECS[mode]()
+
+
+def codec_from_state(state):
+    return CODECS[state["mode"]].from_state(state)
+
+
+class EncodingStore:
+    def __init__(self, codec, codes):
+        """
+        Compact, list-like container of encodings held as one code matrix.
+        Iterating or indexing returns decoded float32 vectors.
+
+        :param codec: Trained codec
+        :param codes: Code matrix, one row per encoding
+        """
+        self.codec = codec
+        self.codes = codes
+
+    @classmethod
+    def from_encodings(cls, codec, encodings):
+        """Encode a list of encodings (training the codec first if needed)"""
+        encodings = list(encodings)
+        if not codec.fitted:
+            codec.fit(encodings)
+        if not encodings:
+            return cls(codec, np.empty((0, 0), dtype=np.uint8))
+        return cls(codec, codec.encode(encodings))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __bool__(self):
+        return len(self.codes) > 0
+
+    def __getitem__(self, index):
+        return self.codec.decode(self.codes[[index]])[0]
+
+    def take(self, indices):
+        """New store with the selected rows (no decoding)"""
+        return EncodingStore(self.codec, self.codes[np.asarray(indices, dtype=np.int64)])
+
+    def extend(self, encodings):
+        """New store with extra encodings appended"""
+        encodings = list(encodings)
+        if not encodings:
+            return self
+        new_codes = self.codec.encode(encodings)
+        codes = new_codes if not len(self.codes) else np.concatenate([self.codes, new_codes])
+        return EncodingStore(self.codec, codes)
+
+    def __iter__(self):
+        for start in range(0, len(self.codes), 1024):
+            yield from self.codec.decode(self.codes[start:start + 1024])
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+def measure_accuracy_delta(encodings, names, mode, threshold=THRESHOLD, holdout=0.2, seed=0):
+    """
+    Compare nearest-neighbour matching on a quantized gallery with full precision.
+
+    The codec is trained on part of the templates and the rest are held
+    out as the quantized gallery, as for templates enrolled after training
+    (a codec scored on its own training set looks better than it is; PQ
+    with 256 or fewer templates would reproduce each one exactly). Every
+    template is used as a probe against the held-out ones, once with
+    full-precision distances and once with asymmetric distances.
+
+    :param encodings: Gallery encodings (at least two)
+    :param names: Name of each encoding
+    :param mode: Storage mode to evaluate
+    :param threshold: Match threshold
+    :param holdout: Share of the templates held out of training
+    :param seed: Seed of the training/held-out split
+    :return: Dict with compression ratio, distance error and decision agreement
+    """
+    full = np.asarray(encodings, dtype=np.float64)
+    names = np.asarray(names)
+    order = np.random.default_rng(seed).permutation(len(full))
+    held_out = np.sort(order[:min(len(full) - 1, max(1, int(round(len(full) * holdout))))])
+    training = order[len(held_out):]
+    codec = create_codec(mode).fit(full[training])
+    codes = codec.encode(full[held_out])
+    gallery = full[held_out]
+
+    errors = []
+    agree = compared = 0
+    for i, probe in enumerate(full):
+        exact = np.linalg.norm(gallery - probe, axis=1)
+        approx = codec.distances(codes, probe.astype(np.float32))
+        others = held_out != i
+        errors.append(np.abs(exact[others] - approx[others]))
+        exact[~others] = approx[~others] = np.inf  # Leave the probe itself out
+        if not others.any():
+            continue
+        compared += 1
+
+        exact_best, approx_best = int(np.argmin(exact)), int(np.argmin(approx))
+        exact_name = names[held_out[exact_best]] if exact[exact_best] <= threshold else None
+        approx_name = names[held_out[approx_best]] if approx[approx_best] <= threshold else None
+        agree += exact_name == approx_name
+
+    errors = np.concatenate(errors) if errors else np.zeros(1)
+    dim = full.shape[1]
+    return {
+        "mode": mode,
+        "templates": len(full),
+        "held_out": len(held_out),
+        "bytes_per_encoding": codec.bytes_per_vector(dim),
+        "compression": full.itemsize * dim / codec.bytes_per_vector(dim),
+        "mean_distance_error": float(errors.mean()),
+        "max_distance_error": float(errors.max()),
+        "decision_agreement": agree / max(1, compared),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the accuracy cost of compact gallery storage")
+    parser.add_argument("--file", default=ENCODINGS_FILE, help="Encodings file to evaluate")
+    parser.add_argument("--mode", choices=sorted(CODECS), action="append",
+                        help="Storage mode(s) to evaluate (default: all)")
+    args = parser.parse_args(argv)
+
+    # Imported here so the codecs above stay usable without the gallery module
+    from face_recognition_module import FaceRecognitionManager
+    manager = FaceRecognitionManager(args.file, shards=0)
+    encodings = list(manager.known_encodings)
+    if len(encodings) < 2:
+        print("Need at least two stored encodings to measure accuracy")
+        return 1
+
+    for mode in args.mode or sorted(CODECS):
+        report = measure_accuracy_delta(encodings, manager.known_names, mode)
+        print(f"{mode:<8} {report['bytes_per_encoding']:>5} B/encoding  {report['compression']:5.1f}x  "
+              f"mean err {report['mean_distance_error']:.4f}  max err {report['max_distance_error']:.4f}  "
+              f"decisions agree {report['decision_agreement']:.1%} "
+              f"({report['held_out']} held-out templates)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# recent_cache_module.py
+import threading
+from collections import OrderedDict
+import numpy as np
+from clock_module import SYSTEM_CLOCK
+from config import RECENT_CACHE_SIZE, RECENT_CACHE_TTL, RECENT_CACHE_ACCEPT, RECENT_CACHE_MARGIN
+
+
+class RecentIdentityCache:
+    def __init__(self, capacity=RECENT_CACHE_SIZE, ttl=RECENT_CACHE_TTL, accept=RECENT_CACHE_ACCEPT,
+                 margin=RECENT_CACHE_MARGIN, clock=SYSTEM_CLOCK):
+        """
+        Templates of recently confirmed identities, checked before the full search.
+
+        A lookup compares the probes against every cached template in one
+        small matrix operation. It only answers when the closest cached
+        identity is within accept and beats the next cached identity by
+        margin; everything else falls through to the full search. Entries
+        expire ttl seconds after they were last confirmed and the least
+        recently used entry is evicted beyond capacity.
+
+        :param capacity: Identities kept
+        :param ttl: Seconds an entry stays valid after its last confirmation
+        :param accept: Max distance answered from the cache (tighter than THRESHOLD,
+                       since identities outside the cache are not compared)
+        :param margin: Required gap to the second-closest cached identity
+        :param clock: Clock the expiry times are measured with
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.accept = accept
+        self.margin = margin
+        self.clock = clock
+        self._entries = OrderedDict()  # name -> (templates, expires)
+        self._matrix = None
+        self._starts = None
+        self._names = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.ambiguous = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _stacked(self, now):
+        """Cached templates as one matrix, grouped by identity (rebuilt after changes)"""
+        stale = [name for name, (_, expires) in self._entries.items() if expires <= now]
+        for name in stale:
+            del self._entries[name]
+        if stale:
+            self.expired += len(stale)
+            self._matrix = None
+        if self._matrix is None and self._entries:
+            self._names = list(self._entries)
+            templates = [templates for templates, _ in self._entries.values()]
+            self._matrix = np.concatenate(templates).astype(np.float32)
+            self._starts = np.concatenate(([0], np.cumsum([len(t) for t in templates])[:-1]))
+        return self._matrix
+
+    def lookup(self, probes):
+        """
+        :param probes: Face encodings, one per row
+        :return: List parallel to probes of (name, distance) for confident hits, None otherwise
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        with self._lock:
+            now = self.clock.monotonic()
+            matrix = self._stacked(now)
+            if matrix is None:
+                self.misses += len(probes)
+                return [None] * len(probes)
+
+            distances = np.linalg.norm(probes[:, None, :] - matrix[None, :, :], axis=2)
+            # Closest template per cached identity (templates are grouped by identity)
+            per_identity = np.minimum.reduceat(distances, self._starts, axis=1)
+
+            results = []
+            for row in per_identity:
+                best = int(np.argmin(row))
+                distance = float(row[best])
+                runner_up = float(np.partition(row, 1)[1]) if len(row) > 1 else np.inf
+                if distance > self.accept:
+                    self.misses += 1
+                    results.append(None)
+                elif runner_up - distance < self.margin:
+                    self.ambiguous += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    name = self._names[best]
+                    self._entries[name] = (self._entries[name][0], now + self.ttl)
+                    self._entries.move_to_end(name)
+                    results.append((name, distance))
+            return results
+
+    def confirm(self, name, templates):
+        """
+        Add or refresh an identity after the full search confirmed it
+
+        :param name: Identity
+        :param templates: Its gallery templates
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self._matrix = None
+                templates = np.asarray(templates, dtype=np.float32)
+            else:
+                templates = entry[0]
+            self._entries[name] = (templates, self.clock.monotonic() + self.ttl)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self._matrix = None
+
+    def invalidate(self, names=None):
+        """
+        Drop entries whose templates changed
+
+        :param names: Identities to drop (default: all)
+        """
+        with self._lock:
+            if names is None:
+                self._entries.clear()
+            else:
+                for name in names:
+                    self._entries.pop(name, None)
+            self._matrix = None
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.ambiguous
+        return {
+            "cached": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ambiguous": self.ambiguous,
+            "expired": self.expired,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,185 @@
+# recognition_module.py
+import functools
+import threading
+import numpy as np
+from clock_module import SYSTEM_CLOCK
+from pipeline_module import Pipeline, Stage, stage_settings, detect_faces, encode_faces, match_faces
+from power_module import ACTIVE
+from config import MOTION_RESIZE_FACTOR, BATCH_MIN_FACES, CAMERA_STALL_TIMEOUT
+
+
+def audit_distance(distance):
+    """Match distance as a JSON-friendly float (None when nothing was compared)"""
+    if distance is None or not np.isfinite(distance):
+        return None
+    return round(float(distance), 4)
+
+
+class RecognitionStages:
+    def __init__(self, camera_manager, face_recognizer, locker_manager, encoder, autotuner, power_governor,
+                 reopen_guard, audit_log, clock=SYSTEM_CLOCK):
+        """
+        Stage functions of the recognition pipeline, from capture to actuation.
+
+        The kiosk UI feeds them from its recognition task and the simulator
+        from a virtual clock, so both run the same decisions. Nothing here
+        touches Tk; the overlay is handed to the display through overlay().
+
+        :param camera_manager: CameraManager (or a stand-in with capture_frame, health and record_results)
+        :param face_recognizer: FaceRecognitionManager used by the match stage
+        :param locker_manager: LockerManager that opens the lockers
+        :param encoder: Encoder profile with locate/encode for the detect and encode stages
+        :param autotuner: RecognitionAutotuner providing the resolution and cycle interval
+        :param power_governor: PowerGovernor for the idle motion check and activity
+        :param reopen_guard: ReopenGuard keeping people in view from reopening their locker
+        :param audit_log: AuditLog receiving unknown faces
+        :param clock: Clock for capture times and cycle intervals
+        """
+        self.camera_manager = camera_manager
+        self.face_recognizer = face_recognizer
+        self.locker_manager = locker_manager
+        self.encoder = encoder
+        self.autotuner = autotuner
+        self.power_governor = power_governor
+        self.reopen_guard = reopen_guard
+        self.audit_log = audit_log
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.recognized_faces = []
+        # Faces in the newest decided frame; with several people in view
+        # frames are fed without the interval so the match stage batches them
+        self.faces_in_view = 0
+        self._overlay_seq = 0
+
+    def build_pipeline(self):
+        """Recognition stages with the worker counts, modes and queue sizes of PIPELINE_STAGES"""
+        record = self.autotuner.record_stage
+        clock = self.clock
+        return Pipeline([
+            Stage("capture", self.capture, timing=record, process_safe=False, clock=clock,
+                  **stage_settings("capture")),
+            Stage("detect", functools.partial(detect_faces, self.encoder), timing=record, clock=clock,
+                  **stage_settings("detect")),
+            Stage("encode", functools.partial(encode_faces, self.encoder), timing=record, clock=clock,
+                  **stage_settings("encode")),
+            Stage("match", functools.partial(match_faces, self.face_recognizer), timing=record, process_safe=False, clock=clock,
+                  **stage_settings("match")),
+            Stage("decide", self.decide, process_safe=False, clock=clock, **stage_settings("decide")),
+            Stage("actuate", self.actuate, process_safe=False, on_drop=self.unlock_dropped, clock=clock,
+                  **stage_settings("actuate")),
+        ])
+
+    def cycle_delay(self, last_cycle):
+        """
+        :param last_cycle: clock.monotonic() when the previous frame was fed
+        :return: Seconds until the next frame is due (the autotuner's interval,
+                 stretched by the power governor while idle)
+        """
+        interval = self.power_governor.check_interval(self.autotuner.process_interval)
+        return interval - (self.clock.monotonic() - last_cycle)
+
+    @property
+    def crowded(self):
+        """True while several people are in view (the next frame skips the interval)"""
+        return self.faces_in_view >= BATCH_MIN_FACES
+
+    def overlay(self):
+        """:return: List of (name, (top, right, bottom, left)) of the newest decided frame"""
+        with self.lock:
+            return self.recognized_faces
+
+    def clear_overlay(self):
+        with self.lock:
+            self.recognized_faces = []
+
+    def capture(self, job):
+        """Capture stage: motion check while idle, then the frame at detection resolution"""
+        tuner = self.autotuner
+        governor = self.power_governor
+
+        # While idle only run the cheap motion check; on motion, wake up
+        # and run full recognition on this same frame
+        if job.power_state != ACTIVE:
+            motion_frame = self.camera_manager.capture_frame(resize_factor=MOTION_RESIZE_FACTOR,
+                                                             max_age=CAMERA_STALL_TIMEOUT)
+            if motion_frame is None or not governor.detect_motion(motion_frame):
+                return None
+            governor.notify_activity()
+            tuner.restart_window()
+
+        # Capture at the autotuner's detection resolution; a stalled
+        # camera's last frame is only shown, never recognized again
+        resize_factor = tuner.resize_factor
+        job.captured_at = self.clock.monotonic()
+        frame = self.camera_manager.capture_frame(resize_factor=resize_factor,
+                                                  max_age=CAMERA_STALL_TIMEOUT)
+        if frame is None:
+            return None
+        job.set_frame(frame, resize_factor)
+        return job
+
+    def decide(self, job):
+        """
+        Decision stage: update the overlay, audit unknown faces and pass
+        recognized people on to actuation
+
+        :return: List of (name, distance, captured_at) unlocks
+        """
+        recognized = []
+        unlocks = []
+        for (name, distance), (top, right, bottom, left) in zip(job.matches, job.locations):
+            # Map detection coordinates back to the full camera frame
+            k = job.scale
+            recognized.append((name, (int(top * k), int(right * k), int(bottom * k), int(left * k))))
+            if name == "Unknown":
+                self.audit_log.log_unknown(audit_distance(distance))
+            elif self.reopen_guard.claim(name):
+                unlocks.append((name, distance, job.captured_at))
+
+        # With several workers frames can finish out of order; the overlay
+        # only moves forward
+        with self.lock:
+            if job.seq >= self._overlay_seq:
+                self._overlay_seq = job.seq
+                if recognized or self.recognized_faces:
+                    self.recognized_faces = recognized
+        if recognized:
+            # Faces in view count as activity for the power governor
+            self.power_governor.notify_activity()
+            self.camera_manager.record_results(recognized, job.resize_factor)
+        self.faces_in_view = len(recognized)
+
+        self.autotuner.end_cycle()
+        return unlocks
+
+    def actuate(self, unlock):
+        """Actuation stage: drive the lock on its own workers so GPIO never holds up recognition"""
+        name, distance, captured_at = unlock
+        if not self.open_locker_for(name, distance, captured_at):
+            # Let the next sighting try again
+            self.reopen_guard.release(name)
+
+    def unlock_dropped(self, unlock):
+        """An unlock fell out of the full actuate queue: release its claim so the next sighting opens"""
+        name = unlock[0]
+        print(f"[Recognition] Unlock for {name} dropped, actuation is backed up")
+        self.reopen_guard.release(name)
+
+    def open_locker_for(self, name, distance=None, captured_at=None):
+        """
+        Open a recognized person's locker
+
+        :param distance: Match distance, recorded in the audit log
+        :param captured_at: clock.monotonic() of the frame capture, for the recognition-to-unlock latency
+        :return: True if the locker was opened
+        """
+        latency = round(self.clock.monotonic() - captured_at, 4) if captured_at is not None else None
+        success, message = self.locker_manager.open_locker(
+            name, distance=audit_distance(distance), latency=latency,
+            camera_health=self.camera_manager.health()["state"])
+        if success:
+            print(f"[Recognition] Welcome {name}! {message}")
+        else:
+            print(f"[Recognition] {message}")
+        return success
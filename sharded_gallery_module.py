@@ -0,0 +1,465 @@
+# sharded_gallery_module.py
+import os
+import sys
+import time
+import glob
+import fcntl
+import shutil
+import argparse
+import tempfile
+import threading
+import traceback
+import multiprocessing
+import numpy as np
+from gallery_module import GalleryIndex
+from config import GALLERY_SHARDS, SHARD_DIR, SHARD_IMBALANCE, SHARD_MIN_REBALANCE, CENTROID_SHORTLIST
+
+ENCODING_SIZE = 128
+
+
+def _shard_file(directory, shard, generation):
+    return os.path.join(directory, f"shard-{shard}-{generation}.f32")
+
+
+def _shard_generation(path):
+    """Generation of a shard file name, or None for other files"""
+    parts = os.path.basename(path)[:-len(".f32")].split("-")
+    return int(parts[2]) if len(parts) == 3 and parts[2].isdigit() else None
+
+
+def _map_rows(path, rows):
+    """The first rows templates of a shard file, memory-mapped read-only"""
+    if not rows:
+        return np.empty((0, ENCODING_SIZE), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(rows, ENCODING_SIZE))
+
+
+def _shard_worker(conn, directory, shard):
+    """Worker process owning one shard; answers load/append/search/stop messages over a pipe"""
+    index = GalleryIndex([], [])
+    path = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        kind = message[0]
+        try:
+            if kind == "search":
+                _, probes, k, shortlist_size = message
+                conn.send(index.search_topk(probes, k, shortlist_size))
+            elif kind == "load":
+                _, generation, names, counts = message
+                path = _shard_file(directory, shard, generation)
+                index = GalleryIndex.from_grouped(names, counts, _map_rows(path, int(sum(counts))))
+                conn.send(len(names))
+            elif kind == "append":
+                _, name, count = message
+                index = index.appended(name, _map_rows(path, index.template_count + count))
+                conn.send(len(index))
+            elif kind == "stop":
+                break
+        except Exception as e:
+            traceback.print_exc()
+            conn.send(e)
+    conn.close()
+
+
+def read_manifest(manifest):
+    """
+    Templates of every identity in a saved sharded gallery, reading each
+    shard file once
+
+    :param manifest: ShardedGallery.manifest() with an absolute directory
+    :return: {name: float32 templates}
+    """
+    templates = {}
+    for shard, (generation, layout) in enumerate(zip(manifest["generations"], manifest["layouts"])):
+        if generation is None or not layout:
+            continue
+        rows = layout[-1][1] + layout[-1][2]
+        data = np.array(_map_rows(_shard_file(manifest["directory"], shard, generation), rows))
+        for name, start, count in layout:
+            templates[name] = data[start:start + count]
+    return templates
+
+
+def gather_templates(templates, names):
+    """Float64 templates parallel to a list of template names, each identity's in stored order"""
+    remaining = {name: iter(rows.astype(np.float64)) for name, rows in templates.items()}
+    return [next(remaining[name]) for name in names]
+
+
+class ShardedGallery:
+    def __init__(self, shards=GALLERY_SHARDS, directory=None, imbalance=SHARD_IMBALANCE,
+                 min_rebalance=SHARD_MIN_REBALANCE):
+        """
+        Gallery partitioned across worker processes.
+
+        Each worker owns a shard of whole identities, stored as an append-only
+        float32 template file that the worker memory-maps, and runs its own
+        GalleryIndex over it. A search sends the probes to every worker at
+        once and merges their top-k lists, so latency stays at that of one
+        shard while the gallery grows with the number of shards.
+
+        New identities are appended to the smallest shard's file in place.
+        Replacing or removing an identity, or a rebalance (when the largest
+        shard exceeds imbalance times the average size), rewrites only the
+        shards that lost identities, under a new generation. The previous
+        generation of each shard is kept until the next one, so a gallery file
+        saved before the rewrite still finds its shard files.
+
+        The directory belongs to this gallery alone and is locked while it is
+        open, so a second process cannot rewrite the files under the first.
+
+        :param shards: Number of worker processes
+        :param directory: Directory holding the shard files (default: a scratch
+                          directory under SHARD_DIR, removed on close)
+        :raises RuntimeError: If another process has the directory open
+        :param imbalance: Largest shard / average shard size that triggers a rebalance
+        :param min_rebalance: Galleries with fewer templates per shard are never rebalanced
+        """
+        self.shard_count = shards
+        self._scratch = directory is None
+        if self._scratch:
+            os.makedirs(SHARD_DIR, exist_ok=True)
+            directory = tempfile.mkdtemp(prefix="gallery-", dir=SHARD_DIR)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        self._dir_lock = open(os.path.join(directory, "lock"), "w")
+        try:
+            fcntl.flock(self._dir_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._dir_lock.close()
+            raise RuntimeError(f"Shard directory {directory} is in use by another process")
+        self.directory = directory
+        self.imbalance = imbalance
+        self.min_rebalance = min_rebalance
+        self.assignment = {}  # identity -> shard
+        self.sizes = [0] * shards  # templates per shard
+        self.generations = [None] * shards
+        self.previous = [None] * shards  # Generation kept for a gallery file saved before the last rewrite
+        # Per shard: identity -> (first row, template count), in file order
+        self.layouts = [{} for _ in range(shards)]
+        self._next_generation = int(time.time() * 1000)
+        self._maps = [None] * shards  # (generation, rows, memory map) of the current file
+        self._lock = threading.Lock()
+
+        context = multiprocessing.get_context("spawn")
+        self._pipes = []
+        self._workers = []
+        for shard in range(shards):
+            parent, child = context.Pipe()
+            worker = context.Process(target=_shard_worker, args=(child, directory, shard),
+                                     name=f"gallery-shard-{shard}", daemon=True)
+            worker.start()
+            child.close()
+            self._pipes.append(parent)
+            self._workers.append(worker)
+        print(f"[ShardedGallery] Started {shards} shard worker(s)")
+
+    def __len__(self):
+        return sum(self.sizes)
+
+    def build(self, names, encodings):
+        """
+        Partition a whole gallery, balancing template counts across shards
+
+        :param names: Name of each template
+        :param encodings: Encoding of each template, parallel to names
+        """
+        grouped = {}
+        for name, encoding in zip(names, encodings):
+            grouped.setdefault(name, []).append(encoding)
+        contents = [{} for _ in range(self.shard_count)]
+        self.sizes = [0] * self.shard_count
+        self.assignment = {}
+        # Largest identities first onto the currently smallest shard
+        for name, templates in sorted(grouped.items(), key=lambda item: -len(item[1])):
+            shard = int(np.argmin(self.sizes))
+            contents[shard][name] = np.asarray(templates, dtype=np.float32)
+            self.assignment[name] = shard
+            self.sizes[shard] += len(templates)
+        self._publish({shard: content for shard, content in enumerate(contents)})
+
+    def update(self, name, templates):
+        """
+        Replace one identity's templates (an empty list removes it), then
+        rebalance if the shards drifted apart
+
+        :param name: Identity
+        :param templates: Its complete list of templates
+        """
+        changed = {}
+        shard = self.assignment.pop(name, None)
+        if shard is not None:
+            changed[shard] = self._read(shard)
+            self.sizes[shard] -= len(changed[shard].pop(name, ()))
+        appended = None
+        if len(templates):
+            templates = np.asarray(templates, dtype=np.float32)
+            shard = int(np.argmin(self.sizes))
+            self.assignment[name] = shard
+            self.sizes[shard] += len(templates)
+            if shard in changed:
+                changed[shard][name] = templates
+            else:
+                appended = (shard, templates)
+        self._rebalance(changed)
+        if appended is not None and appended[0] in changed:
+            # The rebalance rewrites this shard anyway
+            changed[appended[0]][name] = appended[1]
+            appended = None
+        if changed:
+            self._publish(changed)
+        if appended is not None:
+            self._append(appended[0], name, appended[1])
+
+    def templates_of(self, name):
+        """Stored templates of one identity (empty if it has none)"""
+        shard = self.assignment.get(name)
+        if shard is None:
+            return np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        start, count = self.layouts[shard][name]
+        return np.array(self._rows(shard)[start:start + count])
+
+    def gather(self, names):
+        """
+        Templates for a list of template names, reading each shard file once
+
+        :param names: Name of each template
+        :return: List of float64 encodings, parallel to names
+        """
+        return gather_templates(read_manifest(self.manifest()), names)
+
+    def manifest(self):
+        """
+        Where the templates are stored: shard files, generations and
+        per-shard (name, first row, count) in file order
+
+        :return: Dict for a gallery file; ShardedGallery.adopt() serves it again
+        """
+        return {
+            "directory": self.directory,
+            "generations": list(self.generations),
+            "layouts": [[(name, start, count) for name, (start, count) in layout.items()]
+                        for layout in self.layouts],
+        }
+
+    def adopt(self, manifest):
+        """
+        Serve saved shard files as they are, without reading them in this process
+
+        :param manifest: manifest() of a gallery saved in this directory (absolute directory)
+        :return: False if the manifest belongs elsewhere, has another shard count
+                 or its files are missing (build() the gallery instead)
+        """
+        if (os.path.abspath(manifest["directory"]) != os.path.abspath(self.directory)
+                or len(manifest["generations"]) != self.shard_count):
+            return False
+        for shard, (generation, layout) in enumerate(zip(manifest["generations"], manifest["layouts"])):
+            rows = layout[-1][1] + layout[-1][2] if layout else 0
+            path = _shard_file(self.directory, shard, generation)
+            if generation is not None and (not os.path.exists(path)
+                                           or os.path.getsize(path) < rows * ENCODING_SIZE * 4):
+                return False
+        self.layouts = [{name: (start, count) for name, start, count in layout} for layout in manifest["layouts"]]
+        self.generations = list(manifest["generations"])
+        self.sizes = [sum(count for _, count in layout.values()) for layout in self.layouts]
+        self.assignment = {name: shard for shard, layout in enumerate(self.layouts) for name in layout}
+        self._next_generation = max([self._next_generation] + [g + 1 for g in self.generations if g is not None])
+        self._load({shard: (generation, self.layouts[shard]) for shard, generation in enumerate(self.generations)
+                    if generation is not None})
+        self.prune()
+        return True
+
+    def prune(self):
+        """Delete shard files that are neither a current nor a previous generation"""
+        keep = set(self.generations) | set(self.previous)
+        for path in glob.glob(os.path.join(self.directory, "shard-*.f32")):
+            if _shard_generation(path) not in keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _rows(self, shard):
+        """Current shard file, memory-mapped once per generation and size"""
+        generation = self.generations[shard]
+        rows = sum(count for _, count in self.layouts[shard].values())
+        cached = self._maps[shard]
+        if cached is None or cached[:2] != (generation, rows):
+            cached = self._maps[shard] = (generation, rows,
+                                          _map_rows(_shard_file(self.directory, shard, generation), rows))
+        return cached[2]
+
+    def _rebalance(self, changed):
+        """Move identities from the largest to the smallest shard (modifies changed in place)"""
+        average = sum(self.sizes) / self.shard_count
+        if average < self.min_rebalance:
+            return
+        moved = 0
+        while max(self.sizes) > average * self.imbalance:
+            source, target = int(np.argmax(self.sizes)), int(np.argmin(self.sizes))
+            for shard in (source, target):
+                if shard not in changed:
+                    changed[shard] = self._read(shard)
+            if not changed[source]:
+                break
+            name, templates = next(iter(changed[source].items()))
+            if self.sizes[target] + len(templates) >= self.sizes[source]:
+                break
+            del changed[source][name]
+            changed[target][name] = templates
+            self.assignment[name] = target
+            self.sizes[source] -= len(templates)
+            self.sizes[target] += len(templates)
+            moved += 1
+        if moved:
+            print(f"[ShardedGallery] Rebalanced {moved} identit{'y' if moved == 1 else 'ies'}; "
+                  f"shard sizes {self.sizes}")
+
+    def _read(self, shard):
+        """Current contents of a shard as {name: templates}"""
+        templates = self._rows(shard)
+        return {name: templates[start:start + count] for name, (start, count) in self.layouts[shard].items()}
+
+    def _publish(self, contents):
+        """Write new generations of the given shards and have their workers load them"""
+        written = {}
+        for shard, content in contents.items():
+            generation = self._next_generation
+            self._next_generation += 1
+            layout = {}
+            rows = 0
+            with open(_shard_file(self.directory, shard, generation), "wb") as f:
+                for name, templates in content.items():
+                    f.write(np.asarray(templates, dtype=np.float32).tobytes())
+                    layout[name] = (rows, len(templates))
+                    rows += len(templates)
+            written[shard] = (generation, layout)
+        self._load(written)
+
+        for shard, (generation, layout) in written.items():
+            # Keep one older generation for a gallery file saved before this rewrite
+            if self.previous[shard] is not None:
+                try:
+                    os.remove(_shard_file(self.directory, shard, self.previous[shard]))
+                except OSError:
+                    pass
+            self.previous[shard], self.generations[shard] = self.generations[shard], generation
+            self.layouts[shard] = layout
+
+    def _load(self, files):
+        """Have the workers of the given shards load {shard: (generation, layout)}"""
+        with self._lock:
+            for shard, (generation, layout) in files.items():
+                counts = [count for _, count in layout.values()]
+                self._pipes[shard].send(("load", generation, list(layout), counts))
+            for shard in files:
+                self._check(self._pipes[shard].recv())
+
+    def _append(self, shard, name, templates):
+        """Append one new identity to a shard's file in place and have its worker index it"""
+        if self.generations[shard] is None:
+            self._publish({shard: {name: templates}})
+            return
+        layout = self.layouts[shard]
+        rows = sum(count for _, count in layout.values())
+        # Rows past the layout are left over from an append that was never saved
+        with open(_shard_file(self.directory, shard, self.generations[shard]), "r+b") as f:
+            f.seek(rows * ENCODING_SIZE * 4)
+            f.write(np.asarray(templates, dtype=np.float32).tobytes())
+            f.truncate()
+        with self._lock:
+            self._pipes[shard].send(("append", name, len(templates)))
+            self._check(self._pipes[shard].recv())
+        layout[name] = (rows, len(templates))
+
+    @staticmethod
+    def _check(result):
+        if isinstance(result, Exception):
+            raise result
+
+    def search_topk(self, probes, k=1, shortlist_size=CENTROID_SHORTLIST):
+        """
+        Scatter probes to every shard and merge their top-k results
+
+        :return: List (parallel to probes) of up to k (name, distance), closest first
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        with self._lock:
+            for pipe in self._pipes:
+                pipe.send(("search", probes, k, shortlist_size))
+            partials = [pipe.recv() for pipe in self._pipes]
+        for partial in partials:
+            if isinstance(partial, Exception):
+                raise partial
+        return [sorted((match for partial in partials for match in partial[i]), key=lambda m: m[1])[:k]
+                for i in range(len(probes))]
+
+    def search_batch(self, probes, shortlist_size=CENTROID_SHORTLIST):
+        """Closest identity per probe; same contract as GalleryIndex.search_batch"""
+        return [matches[0] if matches else (None, float("inf"))
+                for matches in self.search_topk(probes, 1, shortlist_size)]
+
+    def search(self, probe, shortlist_size=CENTROID_SHORTLIST):
+        return self.search_batch([probe], shortlist_size)[0]
+
+    def close(self):
+        with self._lock:
+            for pipe in self._pipes:
+                try:
+                    pipe.send(("stop",))
+                except OSError:
+                    pass
+        for worker in self._workers:
+            worker.join(timeout=2.0)
+        self._maps = [None] * self.shard_count
+        self._dir_lock.close()
+        if self._scratch:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure sharded matching latency")
+    parser.add_argument("--identities", type=int, default=200000)
+    parser.add_argument("--templates", type=int, default=3, help="Templates per identity")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--probes", type=int, default=4, help="Encodings per search")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(args.identities, ENCODING_SIZE)).astype(np.float32)
+    centers *= 0.6 / np.linalg.norm(centers, axis=1, keepdims=True)
+    names = [f"user{i:07d}" for i in range(args.identities) for _ in range(args.templates)]
+    encodings = np.repeat(centers, args.templates, axis=0)
+    encodings += rng.normal(scale=0.03, size=encodings.shape).astype(np.float32)
+
+    for shards in args.shards:
+        gallery = ShardedGallery(shards)
+        gallery.build(names, encodings)
+        latencies = []
+        correct = 0
+        for _ in range(args.rounds):
+            rows = rng.integers(0, args.identities, size=args.probes)
+            probes = centers[rows] + rng.normal(scale=0.03, size=(args.probes, ENCODING_SIZE))
+            start = time.perf_counter()
+            results = gallery.search_batch(probes)
+            latencies.append(time.perf_counter() - start)
+            correct += sum(name == f"user{row:07d}" for (name, _), row in zip(results, rows))
+
+        start = time.perf_counter()
+        gallery.update(f"user{args.identities:07d}", rng.normal(scale=0.05, size=(args.templates, ENCODING_SIZE)))
+        update_time = time.perf_counter() - start
+        gallery.close()
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+        print(f"{shards} shard(s): p50 {p50:.1f} ms, p95 {p95:.1f} ms per search of {args.probes}, "
+              f"accuracy {correct / (args.rounds * args.probes):.3f}, register {update_time * 1000:.0f} ms, "
+              f"sizes {gallery.sizes}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
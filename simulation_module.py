@@ -0,0 +1,493 @@
+# simulation_module.py
+import os
+import sys
+import json
+import time
+import pickle
+import bisect
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+from clock_module import VirtualClock
+from face_recognition_module import FaceRecognitionManager
+from face_store_module import template_record
+from locker_control_module import LockerManager, ReopenGuard
+from power_module import PowerGovernor
+from autotune_module import RecognitionAutotuner
+from pipeline_module import FrameJob
+from recognition_module import RecognitionStages
+from audit_log_module import UNLOCK
+from config import RECOGNITION_INTERVAL, LOCKER_BANK, PARTITION_MATCHING
+
+ENCODING_SIZE = 128
+# Distance of identity centers from the origin (pairs of identities end up ~0.85 apart)
+CENTER_NORM = 0.6
+
+
+class SimulatedGPIO:
+    BCM = "BCM"
+    OUT = "OUT"
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, clock):
+        """
+        Stand-in for RPi.GPIO that records lock transitions in simulated time
+
+        :param clock: Clock the transitions are timestamped with
+        """
+        self.clock = clock
+        self.levels = {}
+        self.opened_at = {}
+        self.opens = 0
+        self.closes = 0
+        self.hold_times = []
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, enabled):
+        pass
+
+    def setup(self, pin, mode):
+        self.levels.setdefault(pin, self.LOW)
+
+    def output(self, pin, level):
+        previous = self.levels.get(pin, self.LOW)
+        self.levels[pin] = level
+        if level == self.HIGH and previous == self.LOW:
+            self.opens += 1
+            self.opened_at[pin] = self.clock.monotonic()
+        elif level == self.LOW and previous == self.HIGH:
+            self.closes += 1
+            self.hold_times.append(self.clock.monotonic() - self.opened_at.pop(pin))
+
+    def cleanup(self):
+        self.levels.clear()
+
+
+class Arrival:
+    def __init__(self, at, name, dwell):
+        """
+        One person stepping in front of the kiosk
+
+        :param at: Simulated seconds after the start
+        :param name: Identity (names outside the gallery are strangers)
+        :param dwell: Seconds they stay in view
+        """
+        self.at = at
+        self.name = name
+        self.dwell = dwell
+        self.unlocked_at = None
+
+    @property
+    def leaves(self):
+        return self.at + self.dwell
+
+
+def generate_arrivals(hours, rate, users, stranger_share=0.05, dwell=6.0, rng=None):
+    """
+    Poisson arrivals of random users (and some strangers)
+
+    :param hours: Simulated hours
+    :param rate: Arrivals per hour
+    :param users: Registered users to pick from ("user0000" ...)
+    :param stranger_share: Share of arrivals that are not registered
+    :param dwell: Mean seconds a person stays in view (exponential, at least 1 s)
+    :return: List of Arrival sorted by time
+    """
+    rng = rng or np.random.default_rng()
+    arrivals = []
+    t = rng.exponential(3600.0 / rate)
+    strangers = 0
+    while t < hours * 3600:
+        if rng.random() < stranger_share:
+            name = f"stranger{strangers:05d}"
+            strangers += 1
+        else:
+            name = f"user{rng.integers(users):04d}"
+        arrivals.append(Arrival(t, name, max(1.0, rng.exponential(dwell))))
+        t += rng.exponential(3600.0 / rate)
+    return arrivals
+
+
+def load_script(path):
+    """
+    Scripted arrivals from a JSON list of
+    {"at": seconds, "name": str, "dwell": seconds, "stranger": bool}
+
+    :return: (arrivals sorted by time, names of the registered people among them)
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    arrivals = sorted((Arrival(float(e["at"]), e["name"].lower(), float(e.get("dwell", 6.0))) for e in entries),
+                      key=lambda arrival: arrival.at)
+    registered = sorted({e["name"].lower() for e in entries if not e.get("stranger", False)})
+    return arrivals, registered
+
+
+class SimulatedCamera:
+    def __init__(self, arrivals, centers, clock, noise, rng, capture_cost=0.005, size=(24, 32)):
+        """
+        Stand-in for CameraManager whose frames only show who is in view.
+
+        A frame is a small blank image with a bright block per person, which
+        is enough for the real idle motion check; the encodings of the faces
+        in the last captured frame are handed to SimulatedEncoder.
+
+        :param arrivals: Arrivals sorted by time
+        :param centers: Identity -> encoding center (strangers get one on first sight)
+        :param clock: Simulated clock
+        :param noise: Per-dimension standard deviation of a capture around the center
+        :param rng: numpy Generator
+        :param capture_cost: Simulated seconds per captured frame
+        :param size: Frame height and width in pixels
+        """
+        self.arrivals = arrivals
+        self.centers = centers
+        self.clock = clock
+        self.noise = noise
+        self.rng = rng
+        self.capture_cost = capture_cost
+        self.size = size
+        self._starts = [arrival.at for arrival in arrivals]
+        self._next = 0
+        self.in_view = []
+        self.last_faces = []  # (Arrival, encoding) of the last captured frame
+
+    def faces(self):
+        """:return: List of (Arrival, encoding) for the people in view now"""
+        now = self.clock.monotonic()
+        end = bisect.bisect_right(self._starts, now)
+        self.in_view.extend(self.arrivals[self._next:end])
+        self._next = end
+        self.in_view = [arrival for arrival in self.in_view if arrival.leaves > now]
+        return [(arrival, self._capture(arrival.name)) for arrival in self.in_view]
+
+    def capture_frame(self, resize_factor=1.0, max_age=None):
+        self.clock.advance(self.capture_cost)
+        self.last_faces = self.faces()
+        height, width = self.size
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        block = height // 2
+        for i, _ in enumerate(self.last_faces):
+            left = (i * block) % (width - block + 1)
+            frame[:block, left:left + block] = 255
+        return frame
+
+    def health(self):
+        return {"state": "simulated"}
+
+    def record_results(self, faces, resize_factor=None):
+        pass
+
+    def _capture(self, name):
+        center = self.centers.get(name)
+        if center is None:
+            center = self.centers[name] = _random_centers(1, self.rng)[0]
+        return center + self.rng.normal(scale=self.noise, size=ENCODING_SIZE)
+
+
+class SimulatedEncoder:
+    def __init__(self, camera, clock, detect_cost, encode_cost):
+        """
+        Stand-in for an encoder profile: "detects" the faces of the camera's
+        last frame and returns their simulated encodings, charging fixed
+        costs to the clock
+
+        :param camera: SimulatedCamera whose last frame is being processed
+        :param clock: Simulated clock
+        :param detect_cost: Simulated seconds of detection per frame
+        :param encode_cost: Simulated seconds of encoding per face
+        """
+        self.camera = camera
+        self.clock = clock
+        self.detect_cost = detect_cost
+        self.encode_cost = encode_cost
+        self.frames_with_faces = 0
+        self.faces = 0
+
+    def locate(self, rgb):
+        self.clock.advance(self.detect_cost)
+        count = len(self.camera.last_faces)
+        if count:
+            self.frames_with_faces += 1
+            self.faces += count
+        return [(0, 1, 1, 0)] * count
+
+    def encode(self, rgb, locations):
+        self.clock.advance(self.encode_cost * len(locations))
+        return [encoding for _, encoding in self.camera.last_faces[:len(locations)]]
+
+
+class TimedMatcher:
+    def __init__(self, recognizer, clock):
+        """
+        Runs the real matching and charges its measured time to the clock
+
+        :param recognizer: FaceRecognitionManager
+        :param clock: Simulated clock
+        """
+        self.recognizer = recognizer
+        self.clock = clock
+        self.calls = 0
+        self.seconds = 0.0
+
+    def find_best_matches(self, encodings):
+        start = time.perf_counter()
+        matches = self.recognizer.find_best_matches(encodings)
+        elapsed = time.perf_counter() - start
+        self.calls += 1
+        self.seconds += elapsed
+        self.clock.advance(elapsed)
+        return matches
+
+
+class SimulatedAuditLog:
+    def __init__(self, clock):
+        """
+        Keeps audit events in memory, stamped with simulated time
+
+        :param clock: Simulated clock
+        """
+        self.clock = clock
+        self.events = []
+        self.unknown = 0
+
+    def log(self, event, **fields):
+        fields["at"] = self.clock.monotonic()
+        fields["event"] = event
+        self.events.append(fields)
+
+    def log_unknown(self, distance=None):
+        self.unknown += 1
+
+
+def _random_centers(count, rng):
+    centers = rng.normal(size=(count, ENCODING_SIZE))
+    return centers * (CENTER_NORM / np.linalg.norm(centers, axis=1, keepdims=True))
+
+
+class KioskSimulation:
+    def __init__(self, names, arrivals, workdir, interval=RECOGNITION_INTERVAL, detect_cost=0.12,
+                 encode_cost=0.04, capture_cost=0.005, templates=3, noise=0.02, autotune=False, seed=0):
+        """
+        The kiosk's recognition stages on a virtual clock.
+
+        The same RecognitionStages as the kiosk (capture with the idle motion
+        check, detect, encode, match, decide, actuate) run with the real
+        PowerGovernor, RecognitionAutotuner, FaceRecognitionManager, ReopenGuard
+        and LockerManager against a simulated camera, encoder and GPIO. Frames
+        are fed on the recognition task's schedule (RecognitionStages.cycle_delay
+        and crowded).
+
+        Unlike the kiosk, each frame passes through the stages inline
+        (Pipeline.process) as if every stage had one idle worker, so stage
+        overlap and queue drops are not modelled; neither are the camera
+        thread, the display and admin jobs. Detection, encoding and capture
+        are charged to the clock at fixed costs; matching runs for real and
+        its measured time is charged.
+
+        :param names: Registered users, each with a locker in this bank
+        :param arrivals: Arrivals sorted by time
+        :param workdir: Directory for the gallery and locker files
+        :param interval: Seconds between recognition cycles while active
+        :param detect_cost: Simulated seconds of detection per frame
+        :param encode_cost: Simulated seconds of encoding per face
+        :param capture_cost: Simulated seconds per captured frame (including the idle motion check)
+        :param templates: Templates per user
+        :param noise: Per-dimension standard deviation of templates and captures
+        :param autotune: Let the autotuner change the interval and resolution
+        :param seed: Random seed
+        """
+        self.clock = VirtualClock()
+        self.rng = np.random.default_rng(seed)
+        self.arrivals = arrivals
+
+        self.registered = set(names)
+        centers = dict(zip(names, _random_centers(len(names), self.rng)))
+        encodings_file = os.path.join(workdir, "encodings.pkl")
+        lockers_file = os.path.join(workdir, "lockers.pkl")
+        gallery = [center + self.rng.normal(scale=noise, size=ENCODING_SIZE)
+                   for center in centers.values() for _ in range(templates)]
+        with open(encodings_file, "wb") as f:
+            pickle.dump({"encodings": gallery, "names": [n for n in names for _ in range(templates)],
+                         "meta": [template_record() for _ in gallery]}, f)
+        with open(lockers_file, "wb") as f:
+            pickle.dump({name: {"locker": i + 1, "gpio": 100 + i, "bank": LOCKER_BANK}
+                         for i, name in enumerate(names)}, f)
+
+        clock = self.clock
+        self.gpio = SimulatedGPIO(clock)
+        self.audit_log = SimulatedAuditLog(clock)
+        self.recognizer = FaceRecognitionManager(encodings_file, clock=clock, match_server=None, shards=0)
+        self.lockers = LockerManager(lockers_file, clock=clock, gpio=self.gpio)
+        self.lockers.audit_log = self.audit_log
+        if PARTITION_MATCHING:
+            self.recognizer.attach_lockers(self.lockers)
+        self.governor = PowerGovernor(clock=clock)
+        self.guard = ReopenGuard(clock=clock)
+        self.autotuner = RecognitionAutotuner(enabled=autotune, clock=clock)
+        self.autotuner.process_interval = interval
+        self.camera = SimulatedCamera(arrivals, centers, clock, noise, self.rng, capture_cost=capture_cost)
+        self.encoder = SimulatedEncoder(self.camera, clock, detect_cost, encode_cost)
+        self.matcher = TimedMatcher(self.recognizer, clock)
+        self.stages = RecognitionStages(self.camera, self.matcher, self.lockers, self.encoder, self.autotuner,
+                                        self.governor, self.guard, self.audit_log, clock=clock)
+        self.pipeline = self.stages.build_pipeline()
+
+        self.cycles = 0
+        self.busy = 0.0
+        self.state_time = {}
+
+    def run(self, duration):
+        """
+        Simulate duration seconds
+
+        :return: Results dict (see results())
+        """
+        clock = self.clock
+        stages = self.stages
+        end = clock.monotonic() + duration
+        last_cycle = float("-inf")
+        last_tick = clock.monotonic()
+        while clock.monotonic() < end:
+            state = self.governor.update()
+            now = clock.monotonic()
+            self.state_time[state] = self.state_time.get(state, 0.0) + now - last_tick
+            last_tick = now
+            remaining = stages.cycle_delay(last_cycle)
+            # Rounding can leave a remainder too small to move the clock
+            if remaining > 1e-9:
+                clock.run_until(min(now + remaining, end))
+                continue
+
+            last_cycle = now
+            self.cycles += 1
+            self.pipeline.process(FrameJob(self.cycles, state))
+            if stages.crowded:
+                # Several people in view: the next frame follows without the interval
+                last_cycle = float("-inf")
+            self.busy += clock.monotonic() - now
+        clock.run_until(end)
+        return self.results(duration)
+
+    def _resolve_unlocks(self):
+        """
+        Match unlock events to the arrivals in view at the time
+
+        :return: (decision latencies, false accepts, failed unlocks)
+        """
+        by_name = {}
+        for arrival in self.arrivals:
+            by_name.setdefault(arrival.name, []).append(arrival)
+        latencies = []
+        false_accepts = 0
+        failed = 0
+        for event in self.audit_log.events:
+            if event["event"] != UNLOCK:
+                continue
+            if not event["success"]:
+                failed += 1
+                continue
+            at = event["at"]
+            latency = event.get("latency") or 0.0
+            latencies.append(latency)
+            # Whoever was in view when the frame was captured
+            seen = at - latency
+            in_view = [a for a in by_name.get(event["identity"], ()) if a.at <= seen < a.leaves]
+            if not in_view:
+                false_accepts += 1
+            for arrival in in_view:
+                if arrival.unlocked_at is None:
+                    arrival.unlocked_at = at
+        return latencies, false_accepts, failed
+
+    def results(self, duration):
+        latencies, false_accepts, failed = self._resolve_unlocks()
+        registered = [a for a in self.arrivals if a.name in self.registered and a.at < duration]
+        served = [a for a in registered if a.unlocked_at is not None]
+        time_to_unlock = [a.unlocked_at - a.at for a in served]
+        p50, p95, worst = (np.percentile(time_to_unlock, [50, 95, 100]) if time_to_unlock else (None,) * 3)
+        d50, d95 = (np.percentile(latencies, [50, 95]) if latencies else (None,) * 2)
+        match_stats = self.recognizer.match_stats()
+        encoder = self.encoder
+        return {
+            "simulated_hours": round(duration / 3600, 3),
+            "arrivals": sum(a.at < duration for a in self.arrivals),
+            "registered_arrivals": len(registered),
+            "served": len(served),
+            "missed": len(registered) - len(served),
+            "time_to_unlock_p50": _round(p50),
+            "time_to_unlock_p95": _round(p95),
+            "time_to_unlock_max": _round(worst),
+            "decision_latency_p50": _round(d50),
+            "decision_latency_p95": _round(d95),
+            "unlocks": self.gpio.opens,
+            "auto_closes": self.gpio.closes,
+            "reopens_suppressed": self.guard.suppressed,
+            "false_accepts": false_accepts,
+            "failed_unlocks": failed,
+            "unknown_faces": self.audit_log.unknown,
+            "cycles": self.cycles,
+            "cycles_with_faces": encoder.frames_with_faces,
+            "faces_per_hour": round(encoder.faces / duration * 3600, 1),
+            "busy_share": round(self.busy / duration, 4),
+            "match_ms_per_cycle": (round(self.matcher.seconds / self.matcher.calls * 1000, 3)
+                                   if self.matcher.calls else None),
+            "cache_hit_rate": round(match_stats.get("cache_hit_rate", 0.0), 3),
+            "state_share": {state: round(seconds / duration, 4) for state, seconds in self.state_time.items()},
+        }
+
+
+def _round(value):
+    return None if value is None else round(float(value), 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay kiosk traffic on a virtual clock at maximum speed")
+    parser.add_argument("--hours", type=float, default=8.0, help="Simulated hours")
+    parser.add_argument("--users", type=int, default=200, help="Registered users")
+    parser.add_argument("--rate", type=float, default=120.0, help="Arrivals per hour")
+    parser.add_argument("--strangers", type=float, default=0.05, help="Share of unregistered arrivals")
+    parser.add_argument("--dwell", type=float, default=6.0, help="Mean seconds a person stays in view")
+    parser.add_argument("--script", help="JSON list of {at, name, dwell, stranger} arrivals instead of random ones")
+    parser.add_argument("--detect-ms", type=float, default=120.0, help="Simulated detection time per frame")
+    parser.add_argument("--encode-ms", type=float, default=40.0, help="Simulated encoding time per face")
+    parser.add_argument("--interval", type=float, default=RECOGNITION_INTERVAL, help="Seconds between cycles")
+    parser.add_argument("--autotune", action="store_true", help="Let the autotuner adjust interval and resolution")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the kiosk components' own output")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    names = [f"user{i:04d}" for i in range(args.users)]
+    if args.script:
+        arrivals, scripted = load_script(args.script)
+        names = sorted(set(names) | set(scripted))
+    else:
+        arrivals = generate_arrivals(args.hours, args.rate, args.users, args.strangers, args.dwell, rng)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="kiosk-sim-") as workdir:
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            simulation = KioskSimulation(names, arrivals, workdir, interval=args.interval,
+                                         detect_cost=args.detect_ms / 1000, encode_cost=args.encode_ms / 1000,
+                                         autotune=args.autotune, seed=args.seed)
+            results = simulation.run(args.hours * 3600)
+    results["wall_seconds"] = round(time.perf_counter() - start, 2)
+    results["speedup"] = round(args.hours * 3600 / results["wall_seconds"])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:>22}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
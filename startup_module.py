@@ -0,0 +1,178 @@
+# startup_module.py
+import time
+import threading
+import traceback
+import tkinter as tk
+import numpy as np
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def warm_up_models():
+    """
+    Load the dlib detector, landmark and encoder models and run each once,
+    so the first real frame does not pay for model loading
+    """
+    import face_recognition  # Loading the models happens at import time
+
+    dummy = np.zeros((120, 120, 3), dtype=np.uint8)
+    face_recognition.face_locations(dummy)
+    # A fixed location forces the landmark and encoder networks to run
+    face_recognition.face_encodings(dummy, [(10, 110, 110, 10)])
+    return True
+
+
+class StartupPhase:
+    def __init__(self, name, target, release=None):
+        self.name = name
+        self.target = target
+        self.release = release
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def duration(self):
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+
+class StartupCoordinator:
+    def __init__(self, log=print):
+        """
+        Run independent startup phases concurrently and record their timings
+
+        :param log: Function used to report phase completion
+        """
+        self.phases = {}
+        self.log = log
+        self.started_at = None
+        self.lock = threading.Lock()
+
+    def add_phase(self, name, target, release=None):
+        """
+        Register a startup phase
+
+        :param name: Phase name shown in the progress screen
+        :param target: Callable run on its own thread; its return value is the phase result
+        :param release: Optional callable(result) that stops what the phase started,
+                        used when another phase fails
+        """
+        self.phases[name] = StartupPhase(name, target, release)
+
+    def start(self):
+        """Start all registered phases"""
+        self.started_at = time.monotonic()
+        for phase in self.phases.values():
+            thread = threading.Thread(target=self._run_phase, args=(phase,),
+                                      name=f"startup-{phase.name}", daemon=True)
+            thread.start()
+
+    def _run_phase(self, phase):
+        phase.started_at = time.monotonic()
+        phase.status = RUNNING
+        try:
+            phase.result = phase.target()
+            phase.status = DONE
+        except Exception as e:
+            phase.error = e
+            phase.status = FAILED
+            traceback.print_exc()
+        finally:
+            phase.finished_at = time.monotonic()
+            self.log(f"[Startup] {phase.name}: {phase.status} in {phase.duration:.2f}s")
+
+    def is_done(self):
+        return all(phase.status in (DONE, FAILED) for phase in self.phases.values())
+
+    def result(self, name):
+        """
+        Result of a finished phase
+
+        :raises: The phase's exception if it failed
+        """
+        phase = self.phases[name]
+        if phase.status == FAILED:
+            raise phase.error
+        return phase.result
+
+    def check(self):
+        """
+        After all phases finished: if any failed, release the phases that did
+        start (so e.g. a running camera is stopped) and raise the first error
+
+        :raises: The exception of the first failed phase
+        """
+        failed = [phase for phase in self.phases.values() if phase.status == FAILED]
+        if not failed:
+            return
+        for phase in self.phases.values():
+            if phase.status != DONE or phase.release is None or phase.result is None:
+                continue
+            try:
+                phase.release(phase.result)
+                self.log(f"[Startup] {phase.name}: released after failed startup")
+            except Exception as e:
+                self.log(f"[Startup] {phase.name}: release failed: {e}")
+        raise failed[0].error
+
+    def timings(self):
+        """Phase name -> duration in seconds, plus the total wall time"""
+        timings = {name: phase.duration for name, phase in self.phases.items()}
+        if self.started_at is not None:
+            timings["total"] = time.monotonic() - self.started_at
+        return timings
+
+    def wait(self, root, screen=None, poll_interval=0.05):
+        """
+        Block until all phases finish while keeping the Tk window responsive
+
+        :param root: Tk root window
+        :param screen: Optional StartupScreen to refresh
+        :param poll_interval: Seconds between refreshes
+        """
+        while not self.is_done():
+            if screen:
+                screen.refresh(self)
+            root.update()
+            time.sleep(poll_interval)
+        if screen:
+            screen.refresh(self)
+            root.update()
+
+
+class StartupScreen:
+    STATUS_TEXT = {PENDING: "waiting", RUNNING: "starting...", DONE: "ready", FAILED: "FAILED"}
+
+    def __init__(self, root):
+        """
+        Simple progress display shown while the system starts
+
+        :param root: Tk root window
+        """
+        self.frame = tk.Frame(root, bg="black")
+        self.frame.place(relx=0, rely=0, relwidth=1, relheight=1)
+        tk.Label(self.frame, text="Locker Access System", font=('Arial', 24),
+                 bg="black", fg="white").pack(pady=(80, 20))
+        self.status_label = tk.Label(self.frame, text="", font=('Arial', 16),
+                                     bg="black", fg="white", justify=tk.LEFT)
+        self.status_label.pack()
+
+    def refresh(self, coordinator):
+        lines = []
+        for phase in coordinator.phases.values():
+            status = self.STATUS_TEXT[phase.status]
+            if phase.status in (DONE, FAILED):
+                status += f" ({phase.duration:.1f}s)"
+            lines.append(f"{phase.name.title():<10} {status}")
+        self.status_label.config(text="\n".join(lines))
+
+    def close(self):
+        self.frame.destroy()
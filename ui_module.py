@@ -1,16 +1,30 @@
 # ui_module.py - Modified with integrated keyboard and fixed button display
 import tkinter as tk
+import asyncio
 from tkinter import messagebox
 from PIL import Image, ImageTk
-import time
 import cv2
 import threading
-import face_recognition
 import numpy as np
 import traceback
-from datetime import datetime
 import gc  # Add garbage collection
 import random  # Add random module for periodic GC
+from autotune_module import RecognitionAutotuner
+from admin_jobs_module import AdminJobExecutor, SUCCEEDED
+from enrollment_module import BurstEnroller
+from face_store_module import GalleryReencoder
+from encoder_profiles_module import live_profile
+from audit_log_module import AuditLog
+from display_module import FrameRenderer, FramePacer, WAIT_FOR_FRAME
+from event_core_module import AsyncCore, TkBridge
+from locker_control_module import ReopenGuard
+from pipeline_module import FrameJob
+from recognition_module import RecognitionStages
+from clock_module import SYSTEM_CLOCK
+from power_module import PowerGovernor, ACTIVE, CAMERA_FPS
+from config import (IDLE_DISPLAY_INTERVAL, DISPLAY_TARGET_FPS, DISPLAY_KEYBOARD_FPS,
+                    CAMERA_STALL_TIMEOUT, RECORDER_ENABLED, PARTITION_MATCHING,
+                    MATCH_STATS_INTERVAL, PIPELINE_DRAIN_TIMEOUT, RECOGNITION_PAUSE_TIMEOUT)
 
 class VirtualKeyboard:
     def __init__(self, parent, master, callback, action_type="add"):
@@ -102,8 +116,9 @@ class VirtualKeyboard:
 
 
 class LockerAccessUI:
-    def __init__(self, master, camera_manager, face_recognizer, locker_manager):
+    def __init__(self, master, camera_manager, face_recognizer, locker_manager, clock=SYSTEM_CLOCK):
         self.master = master
+        self.clock = clock
         self.camera_manager = camera_manager
         self.face_recognizer = face_recognizer
         self.locker_manager = locker_manager
@@ -141,24 +156,79 @@ class LockerAccessUI:
         self.create_buttons(self.button_area)
         
         # Initialize recognition variables
-        self.recognized_faces = []
-        self.recognition_lock = threading.Lock()
-        self.last_recognition_time = datetime.now()
         self.running = True
         self.ui_initialized = False
-        self.registration_active = False
         self.keyboard_active = False
         self.current_keyboard = None
         
-        # Create a threading event for controlling the recognition thread
-        self.recognition_paused = threading.Event()
-        self.recognition_paused.clear()  # Not paused initially
+        # Event loop driving recognition and locker timers; blocking work
+        # goes to its executors and results reach Tk through the bridge
+        self.core = AsyncCore()
+        self.core.start()
+        self.tk_bridge = TkBridge(master)
+        # Frame-available events from the camera stream
+        self.frame_signal = self.core.frame_signal()
+        # Set on power state changes to end the recognition task's interval wait
+        self.recognition_wake = self.core.flag()
+        
+        # Adjusts detection resolution and cycle interval to the hardware
+        self.autotuner = RecognitionAutotuner(clock=clock)
+        # Detector upsampling, landmark model and jitters for the live loop
+        self.live_encoder = live_profile()
+        
+        # Keeps a person standing in view from reopening their locker
+        self.reopen_guard = ReopenGuard(clock=clock)
+        
+        # Access events are written to NDJSON segments by a background thread
+        self.audit_log = AuditLog()
+        if self.locker_manager:
+            self.locker_manager.audit_log = self.audit_log
+            # Auto-close holds become cancellable timers on the core
+            self.locker_manager.scheduler = self.core
+        
+        # Only users with a locker in this bank are matched on every frame
+        if PARTITION_MATCHING and self.locker_manager:
+            self.face_recognizer.attach_lockers(self.locker_manager)
+        
+        # Drops capture and display rates when nobody is in front of the kiosk
+        self.power_governor = PowerGovernor(clock=clock)
+        self.power_governor.add_listener(self._on_power_state_change)
+        master.bind_all("<Button-1>", lambda event: self.power_governor.notify_activity(), add="+")
+        self._idle_screen_shown = False
+        
+        # Pause state: set/cleared from any thread, awaited by the recognition task
+        self.recognition_paused = self.core.flag()  # Not paused initially
+        # Set by the recognition task once it has actually stopped working
+        self.recognition_idle = threading.Event()
+        
+        # Enrollment captures a burst from the frame stream
+        self.enroller = BurstEnroller(camera_manager)
+        
+        # Enrollment and deletion run on one background worker
+        self.admin_jobs = AdminJobExecutor(master, pause_hook=self._pause_recognition_and_wait,
+                                           resume_hook=self._resume_after_job)
+        
+        # Brings templates from an older encoder configuration up to date
+        # in the background; the result is swapped in through the job queue
+        self.reencoder = GalleryReencoder(self.face_recognizer, self.admin_jobs.submit)
+        self.reencoder.start()
         
         # Status var for internal messages
         self.status_var = tk.StringVar()
         
         # Pre-render a placeholder image for the UI
         self.placeholder_frame = self.create_placeholder_frame(800, 380)
+        self._placeholder_imgtk = None
+        
+        # Reuses preallocated buffers and one PhotoImage for the live preview
+        self.frame_renderer = FrameRenderer(self.video_label)
+        
+        # Paces display ticks; label geometry is cached until it changes
+        self.frame_pacer = FramePacer(master, self.update_video)
+        self._label_size = (0, 0)
+        self._last_rendered_seq = 0
+        self._last_rendered_faces = None
+        self.video_label.bind("<Configure>", self._on_video_configure)
         
         # Create processing label
         self.processing_label = tk.Label(
@@ -181,12 +251,55 @@ class LockerAccessUI:
         # Update UI immediately
         master.update_idletasks()
         
-        # Start the recognition thread
-        self.recognition_thread = threading.Thread(target=self.run_face_recognition_loop, daemon=True)
-        self.recognition_thread.start()
+        # One capture thread feeds both the display and recognition and
+        # signals every new frame
+        if self.camera_manager:
+            self.camera_manager.add_frame_listener(self._on_frame)
+            self.camera_manager.start_stream()
+            if RECORDER_ENABLED:
+                self.camera_manager.start_recording()
+        
+        # Capture, detection, encoding, matching, decision and actuation run
+        # as separate stages connected by bounded drop-oldest queues
+        self.recognition_stages = RecognitionStages(
+            camera_manager, face_recognizer, locker_manager, self.live_encoder, self.autotuner,
+            self.power_governor, self.reopen_guard, self.audit_log, clock=clock)
+        self.pipeline = self.recognition_stages.build_pipeline()
+        self.pipeline.start()
+        
+        # Start the recognition task
+        self.recognition_task = self.core.submit(self.run_face_recognition_loop())
         
         # Start the video update
-        self.update_video()
+        self.frame_pacer.start()
+
+    def _on_video_configure(self, event):
+        """Cache the video label size (avoids winfo_* calls on every tick)"""
+        self._label_size = (event.width, event.height)
+
+    def _on_power_state_change(self, old_state, new_state):
+        """React to power state changes (may run on the recognition thread)"""
+        if self.camera_manager:
+            self.camera_manager.set_frame_rate(CAMERA_FPS[new_state])
+        self.recognition_wake.set()
+        if new_state == ACTIVE:
+            # Restart the preview on the next Tk tick instead of the idle interval
+            self.master.after(0, self.frame_pacer.wake)
+
+    def _show_idle_screen(self):
+        """Replace the preview with a static idle message"""
+        if self._idle_screen_shown:
+            return
+        self.video_label.imgtk = None
+        self.video_label.configure(image='', text="Step in front of the camera")
+        self._idle_screen_shown = True
+
+    def _show_placeholder(self):
+        """Show the pre-rendered placeholder (converted to a PhotoImage once)"""
+        if self._placeholder_imgtk is None:
+            self._placeholder_imgtk = ImageTk.PhotoImage(image=Image.fromarray(self.placeholder_frame))
+        self.video_label.imgtk = self._placeholder_imgtk
+        self.video_label.configure(image=self._placeholder_imgtk)
 
     def create_placeholder_frame(self, width, height):
         """Create a placeholder frame with welcome text"""
@@ -265,7 +378,7 @@ class LockerAccessUI:
         self.keyboard_active = False
         
         # Prevent multiple registration attempts at once
-        if self.registration_active:
+        if self.admin_jobs.pending("enroll"):
             messagebox.showerror("Error", "Registration already in progress")
             # Resume recognition if not proceeding with registration
             self.resume_recognition()
@@ -279,124 +392,78 @@ class LockerAccessUI:
             self.resume_recognition()
             return
         
-        # Set flag to prevent multiple registrations
-        self.registration_active = True
-        
-        # Pause the recognition thread (already paused from keyboard)
-        
         # Show a processing message
         self.show_processing_message("Processing registration...")
         
-        # Create a thread for the registration process
-        registration_thread = threading.Thread(
-            target=self._register_face_worker,
-            args=(name,),
-            daemon=True
-        )
-        registration_thread.start()
+        # Recognition only needs to stop while the gallery is being changed;
+        # the job pauses it around that step itself
+        self.resume_recognition()
+        self.admin_jobs.submit("enroll", self._register_face_job, name,
+                               on_done=self._finish_registration)
     
     def pause_recognition(self):
-        """Pause the face recognition thread"""
+        """Pause face recognition"""
         self.recognition_paused.set()
+        # End the interval wait so the loop parks right away
+        self.recognition_wake.set()
         print("[UI] Recognition paused")
     
     def resume_recognition(self):
-        """Resume the face recognition thread"""
+        """Resume face recognition"""
         self.recognition_paused.clear()
         print("[UI] Recognition resumed")
     
-    def _register_face_worker(self, name):
-        """Worker thread for face registration"""
-        try:
-            # Ensure recognition is paused
-            self.pause_recognition()
-            time.sleep(0.5)  # Give recognition thread time to pause
-            
-            # Explicitly clear any previous frames
-            # This helps prevent memory issues
-            gc.collect()
-            
-            # Capture frame with full resolution
-            frame = self.camera_manager.capture_frame()
-            if frame is None:
-                self.master.after(0, lambda: messagebox.showerror("Error", "Failed to capture image. Please try again."))
-                return
-
-            # Convert to RGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            # Detect faces
-            face_locations = face_recognition.face_locations(rgb_frame)
-            
-            if not face_locations:
-                self.master.after(0, lambda: messagebox.showerror("Error", "No face detected. Try again."))
-                return
-                
-            # Find largest face (closest to camera)
-            largest_area = 0
-            largest_idx = 0
-            
-            for i, (top, right, bottom, left) in enumerate(face_locations):
-                area = (bottom - top) * (right - left)
-                if area > largest_area:
-                    largest_area = area
-                    largest_idx = i
-            
-            best_location = face_locations[largest_idx]
-            
-            # Generate face encoding
-            face_encodings = face_recognition.face_encodings(rgb_frame, [best_location])
-            
-            if not face_encodings:
-                self.master.after(0, lambda: messagebox.showerror("Error", "Could not encode face. Try again with better lighting."))
-                return
+    def _pause_recognition_and_wait(self, timeout=RECOGNITION_PAUSE_TIMEOUT):
+        """
+        Pause recognition and block until the loop has finished its current cycle
 
-            # Register the face
-            if self.face_recognizer.register_face(name, face_encodings[0]):
-                # Assign locker
-                locker = self.locker_manager.assign_locker(name)
-                if locker:
-                    self.master.after(0, lambda: messagebox.showinfo("Success",
-                                     f"Registered {name} - Locker #{locker['locker']}"))
-                else:
-                    self.master.after(0, lambda: messagebox.showerror("Error", "Could not assign locker"))
-            else:
-                self.master.after(0, lambda: messagebox.showerror("Error", "Face already registered or registration failed"))
-                
-        except Exception as e:
-            self.master.after(0, lambda: messagebox.showerror("Error", f"Registration failed: {str(e)}"))
-            print(f"[UI] Registration error: {str(e)}")
-            traceback.print_exc()
-            
-        finally:
-            # Make sure to clean up and release resources
-            try:
-                del frame
-                del rgb_frame
-            except:
-                pass
-            gc.collect()
-            
-            # Schedule cleanup to run on the main thread
-            self.master.after(0, self._finish_registration)
+        :raises TimeoutError: If frames are still in the pipeline after timeout
+        """
+        self.pause_recognition()
+        if not self.recognition_idle.wait(timeout):
+            print("[UI] Recognition task did not pause in time")
+            raise TimeoutError("Recognition did not pause in time")
     
-    def _finish_registration(self):
+    def _resume_after_job(self):
+        """Resume recognition after an admin job, unless a keyboard is open again"""
+        if not self.keyboard_active:
+            self.resume_recognition()
+    
+    def _register_face_job(self, job, name):
+        """Admin job for face registration (runs on the admin worker thread)"""
+        # Score a short burst of frames and keep the best few as templates
+        # (raises EnrollmentError with a user-facing message)
+        face_encodings, scores = self.enroller.enroll()
+        
+        # Keep the compressed face crops so the gallery can be re-encoded later
+        records = [self.face_recognizer.face_store.put(s.rgb, s.location) for s in scores]
+
+        # Register the face and assign a locker with recognition paused
+        with job.exclusive():
+            if not self.face_recognizer.register_face(name, face_encodings, records):
+                raise RuntimeError("Face already registered or registration failed")
+            # Re-enrolling keeps the existing locker
+            locker = self.locker_manager.lockers.get(name) or self.locker_manager.assign_locker(name)
+        
+        if not locker:
+            raise RuntimeError("Could not assign locker")
+        return f"Registered {name} - Locker #{locker['locker']}"
+    
+    def _finish_registration(self, job):
         """Clean up after registration (runs on main thread)"""
         # Clear processing message
-        self.clear_processing_message()
-        
-        # Reset recognized faces to prevent stale data
-        with self.recognition_lock:
-            self.recognized_faces = []
+        self._clear_processing_message_ui()
         
-        # Resume recognition
-        self.resume_recognition()
+        if job.status == SUCCEEDED:
+            messagebox.showinfo("Success", job.result)
+        else:
+            messagebox.showerror("Error", str(job.error))
         
-        # Reset registration flag
-        self.registration_active = False
+        # Reset recognized faces to prevent stale data
+        self.recognition_stages.clear_overlay()
         
         # Force an update of the video display
-        self.master.after(10, self.update_video)
+        self.frame_pacer.wake()
     
     def show_processing_message(self, message):
         """Show a processing message on the UI"""
@@ -435,33 +502,44 @@ class LockerAccessUI:
             return
     
         confirm = messagebox.askyesno("Confirm Deletion", f"Delete face and locker for '{name.title()}'?")
+        if self.current_keyboard:
+            self.current_keyboard.close()
+        
+        # The job pauses recognition again only while it rewrites the stores
+        self.resume_recognition()
         if not confirm:
-            self.resume_recognition()
-            if self.current_keyboard:
-                self.current_keyboard.close()
             return
     
-        try:
+        self.show_processing_message(f"Deleting {name.title()}...")
+        self.admin_jobs.submit("delete", self._delete_face_job, name,
+                               on_done=self._finish_deletion)
+    
+    def _delete_face_job(self, job, name):
+        """Admin job that removes a face and its locker (runs on the admin worker thread)"""
+        with job.exclusive():
             self.face_recognizer.delete_face(name, locker_manager=self.locker_manager)
+        return name
     
+    def _finish_deletion(self, job):
+        """Report the result of a deletion job (runs on main thread)"""
+        self._clear_processing_message_ui()
+        name = job.args[0]
+        if job.status == SUCCEEDED:
             # 🔥 TRIGGER GLITCH EFFECT HERE
             self.trigger_deletion_glitch(name)
-    
-        except Exception as e:
-            traceback.print_exc()
+            self.recognition_stages.clear_overlay()
+        else:
             messagebox.showerror("Error", f"Failed to delete {name.title()}.")
-    
-        if self.current_keyboard:
-            self.current_keyboard.close()
-    
-        # Resume recognition *after a slight delay* to let the glitch animation finish
-        self.master.after(1500, self.resume_recognition)
 
     def exit_program(self):
         """Exit the application"""
         try:
             if messagebox.askyesno("Exit", "Are you sure you want to exit?"):
                 self.running = False
+                self.reencoder.stop()
+                self.admin_jobs.shutdown()
+                self.core.stop()
+                self.audit_log.close()
                 if self.camera_manager:
                     self.camera_manager.stop()
                 if self.locker_manager:
@@ -474,253 +552,185 @@ class LockerAccessUI:
             self.master.destroy()
 
     def update_video(self):
-        """Update the video display with the current camera frame"""
+        """
+        Update the video display with the latest camera frame (one FramePacer tick)
+        
+        :return: Minimum delay in ms before the next tick, or None for the normal pace
+        """
         if not self.running:
-            return
+            self.frame_pacer.stop()
+            return None
             
         try:
+            # Preview is paused while idle; only keep a slow tick alive
+            if self.power_governor.preview_paused and not self.keyboard_active:
+                self._show_idle_screen()
+                return IDLE_DISPLAY_INTERVAL
+            if self._idle_screen_shown:
+                self._idle_screen_shown = False
+                self._last_rendered_seq = 0
+            
             if not self.camera_manager or not self.camera_manager.picam2:
                 # Show placeholder if camera not available
-                img = Image.fromarray(self.placeholder_frame)
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.video_label.imgtk = imgtk
-                self.video_label.configure(image=imgtk)
+                self._show_placeholder()
                 print("[UI] Camera not available")
-                self.master.after(1000, self.update_video)  # Retry in 1s
-                return
+                return 1000  # Retry in 1s
 
-            # Capture frame with timeout protection
-            try:
-                frame = self.camera_manager.capture_frame()
-                if frame is None:
-                    raise ValueError("Failed to capture frame")
-            except Exception as e:
-                print(f"[UI] Frame capture error: {str(e)}")
-                img = Image.fromarray(self.placeholder_frame)
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.video_label.imgtk = imgtk
-                self.video_label.configure(image=imgtk)
-                self.master.after(500, self.update_video)
-                return
+            self.frame_pacer.set_target_fps(DISPLAY_KEYBOARD_FPS if self.keyboard_active else DISPLAY_TARGET_FPS)
+
+            # Get the latest streamed frame
+            seq, _, frame = self.camera_manager.get_latest_frame()
+            if frame is None:
+                self._show_placeholder()
+                return 500
 
-            # Get frame and label dimensions
-            frame_height, frame_width = frame.shape[:2]
-            label_width = self.video_label.winfo_width()
-            label_height = self.video_label.winfo_height()
+            label_width, label_height = self._label_size
 
-            # If UI isn't fully initialized yet (dimensions not set)
+            # If UI isn't fully initialized yet (no <Configure> event yet)
             if label_width <= 1 or label_height <= 1:
                 # Use the current window dimensions to estimate video area
                 win_width = self.master.winfo_width()
                 win_height = self.master.winfo_height() - self.BUTTON_HEIGHT
                 
                 # Placeholder with dimensions that match the window
-                placeholder = self.create_placeholder_frame(win_width, win_height)
+                placeholder = self.create_placeholder_frame(max(win_width, 1), max(win_height, 1))
                 img = Image.fromarray(placeholder)
                 imgtk = ImageTk.PhotoImage(image=img)
                 self.video_label.imgtk = imgtk
                 self.video_label.configure(image=imgtk)
                 
                 # Try again soon
-                self.master.after(100, self.update_video)
-                return
+                return 100
                 
             # UI is initialized
             if not self.ui_initialized:
                 self.ui_initialized = True
                 print("[UI] System ready")
 
-            # Copy the frame for processing to avoid reference issues
-            frame_copy = frame.copy()
-
-            # Skip frame drawing if keyboard is active
+            # Skip face overlay if keyboard is active
             if self.keyboard_active:
-                # Just show the frame without recognition data
-                frame_resized = cv2.resize(frame_copy, (label_width, label_height), interpolation=cv2.INTER_LINEAR)
-                frame_resized = cv2.flip(frame_resized, 1)  # Flip horizontally
-                img = Image.fromarray(cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB))
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.video_label.imgtk = imgtk
-                self.video_label.configure(image=imgtk)
-                self.master.after(100, self.update_video)
-                return
-
-            # Resize the frame to fill the label completely, without black bars
-            frame_resized = cv2.resize(frame_copy, (label_width, label_height), interpolation=cv2.INTER_LINEAR)
-
-            # Flip the frame horizontally (to correct for mirrored display)
-            frame_resized = cv2.flip(frame_resized, 1)
-
-            # Calculate resizing scale factors
-            scale_x = label_width / frame_width
-            scale_y = label_height / frame_height
-
-            # Overlay face recognition results on the resized frame
-            with self.recognition_lock:
-                recognized = list(self.recognized_faces)
-
-            for name, (top, right, bottom, left) in recognized:
-                # Scale the coordinates according to the resized frame
-                scaled_top = int(top * scale_y)
-                scaled_bottom = int(bottom * scale_y)
-                scaled_left = int(left * scale_x)
-                scaled_right = int(right * scale_x)
-
-                # Flip horizontal positions to match the frame flip
-                flipped_left = label_width - scaled_right
-                flipped_right = label_width - scaled_left
-
-                # Draw rectangles and put text for face recognition
-                color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-                cv2.rectangle(frame_resized, (flipped_left, scaled_top), (flipped_right, scaled_bottom), color, 2)
-                cv2.putText(frame_resized, name, (flipped_left, scaled_top - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-
-            # Convert frame to ImageTk format for display in the UI
-            img = Image.fromarray(cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB))
-            imgtk = ImageTk.PhotoImage(image=img)
-
-            # Update the video label with the new frame
-            self.video_label.imgtk = imgtk
-            self.video_label.configure(image=imgtk)
-
-            # Clean up to prevent memory issues
-            del frame
-            del frame_copy
-            del frame_resized
-            
-            # Schedule the next update (~20 FPS, slightly reduced to help with resource usage)
-            self.master.after(50, self.update_video)
+                faces = ()
+            else:
+                faces = self.recognition_stages.overlay()
+
+            # Only render when there is something new to show; otherwise
+            # the pacer waits for the next frame event instead of ticking
+            if (seq == self._last_rendered_seq and faces is self._last_rendered_faces
+                    and self.frame_renderer.size == (label_width, label_height)):
+                return WAIT_FOR_FRAME
+
+            # Overlay face recognition results (the renderer caches the
+            # overlay until the recognized faces change)
+            self.frame_renderer.render(frame, label_width, label_height, faces)
+            self._last_rendered_seq = seq
+            self._last_rendered_faces = faces
+            return None
             
         except Exception as e:
             print(f"[UI] Error in update_video: {str(e)}")
             traceback.print_exc()
+            self._last_rendered_seq = 0
             
             # Show a placeholder image to avoid complete black screen
             try:
-                img = Image.fromarray(self.placeholder_frame)
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.video_label.imgtk = imgtk
-                self.video_label.configure(image=imgtk)
+                self._show_placeholder()
             except:
                 # If even that fails, set a text message
                 self.video_label.configure(image='', text="System Error")
                 
             # Try again in 1 second
-            self.master.after(1000, self.update_video)
+            return 1000
 
-    def run_face_recognition_loop(self):
-        """Background thread for face recognition processing"""
-        print("[UI] Starting face recognition thread")
-        
-        # Keep track of recent recognitions and when they were processed
-        recent_recognitions = {}
-        # Minimum time between opening the same locker (seconds)
-        min_reopen_time = 10
+    async def run_face_recognition_loop(self):
+        """
+        Recognition task on the event core: it waits for the pause state, the
+        cycle interval and new frames as events, and feeds each frame to the
+        recognition pipeline
+        """
+        print("[UI] Starting face recognition task")
         
-        # Add throttling to prevent CPU overuse
-        last_process_time = time.time()
-        process_interval = 0.3  # Process frames at most every 300ms
+        clock = self.clock
+        stages = self.recognition_stages
+        last_process_time = float("-inf")
+        last_seq = 0
+        last_stats_time = clock.monotonic()
+        governor = self.power_governor
         
-        while self.running:
-            try:
-                # Check if recognition is paused
-                if self.recognition_paused.is_set():
-                    time.sleep(0.1)  # Sleep briefly and check again
-                    continue
+        try:
+            while self.running:
+                try:
+                    # Park while paused; the admin job waits for recognition_idle,
+                    # which is only set once frames already in the pipeline are done
+                    if self.recognition_paused.is_set():
+                        if not await self.core.io(self.pipeline.wait_idle, PIPELINE_DRAIN_TIMEOUT):
+                            print("[UI] Recognition pipeline still busy, waiting")
+                            continue
+                        self.recognition_idle.set()
+                        await self.recognition_paused.wait_clear()
+                        continue
+                    self.recognition_idle.clear()
+                    # Re-check so a pause that raced with the clear is still honoured
+                    if self.recognition_paused.is_set():
+                        continue
                     
-                # Throttle processing
-                current_time = time.time()
-                if current_time - last_process_time < process_interval:
-                    time.sleep(0.05)  # Short sleep to yield CPU
-                    continue
+                    # Throttle processing (interval is set by the autotuner, or
+                    # stretched by the power governor while idle); a power state
+                    # change ends the wait early
+                    power_state = governor.update()
+                    remaining = stages.cycle_delay(last_process_time)
+                    if remaining > 0:
+                        self.recognition_wake.clear()
+                        await self.recognition_wake.wait_set(remaining)
+                        continue
                     
-                last_process_time = current_time
+                    if not self.camera_manager or not self.camera_manager.picam2:
+                        print("[UI] Camera manager not initialized. Waiting...")
+                        await asyncio.sleep(1)
+                        continue
                     
-                if not self.camera_manager or not self.camera_manager.picam2:
-                    print("[UI] Camera manager not initialized. Waiting...")
-                    time.sleep(1)
-                    continue
-    
-                # Use a smaller resize factor to improve performance
-                frame = self.camera_manager.capture_frame(resize_factor=0.2)
-                if frame is None:
-                    time.sleep(0.1)
-                    continue
+                    # Never process the same frame twice: wait for the next one
+                    # (a pause ends the wait)
+                    seq = await self.frame_signal.wait_after(last_seq, CAMERA_STALL_TIMEOUT,
+                                                             interrupt=self.recognition_paused)
+                    if seq is None:
+                        continue
+                    last_seq = seq
+                    last_process_time = clock.monotonic()
                     
-                # Use a copy to prevent reference issues
-                frame_copy = frame.copy()
-                rgb_small = cv2.cvtColor(frame_copy, cv2.COLOR_BGR2RGB)
-        
-                face_locations = face_recognition.face_locations(rgb_small)
-                
-                # Skip encoding if no faces detected
-                if not face_locations:
-                    # Clear recognized faces when no faces are detected
-                    with self.recognition_lock:
-                        if self.recognized_faces:
-                            self.recognized_faces = []
-                    time.sleep(0.1)
-                    continue
-                
-                face_encodings = face_recognition.face_encodings(rgb_small, face_locations)
-                
-                recognized = []
-        
-                if face_encodings:
-                    for encoding, (top, right, bottom, left) in zip(face_encodings, face_locations):
-                        name = self.face_recognizer.match_face(encoding)
-                        # Apply scale factor to compensate for resized frame (5x instead of 4x due to 0.2 factor)
-                        recognized.append((name, (top * 5, right * 5, bottom * 5, left * 5)))
-                        
-                        # Check for locker action if recognized
-                        if name != "Unknown":
-                            current_time = datetime.now()
-                            
-                            # Check if we've seen this person recently
-                            if name in recent_recognitions:
-                                last_action_time = recent_recognitions[name]
-                                time_diff = (current_time - last_action_time).total_seconds()
-                                
-                                # Only open locker if sufficient time has passed since last opening
-                                if time_diff > min_reopen_time:
-                                    success, message = self.locker_manager.open_locker(name)
-                                    if success:
-                                        print(f"[UI] Welcome {name}! {message}")
-                                        # Update last action time
-                                        recent_recognitions[name] = current_time
-                                    else:
-                                        print(f"[UI] {message}")
-                            else:
-                                # First time seeing this person, open their locker
-                                success, message = self.locker_manager.open_locker(name)
-                                if success:
-                                    print(f"[UI] Welcome {name}! {message}")
-                                    # Store when we opened their locker
-                                    recent_recognitions[name] = current_time
-                                else:
-                                    print(f"[UI] {message}")
-                            
-                            self.last_recognition_time = current_time
-                            
-                with self.recognition_lock:
-                    self.recognized_faces = recognized
+                    self.pipeline.put(FrameJob(seq, power_state))
+                    if stages.crowded:
+                        # Skip the interval while several people are in view
+                        last_process_time = float("-inf")
                     
-                # Clean up to avoid memory issues
-                del frame
-                del frame_copy
-                del rgb_small
+                    # Cache hit rate, partition/global split and stage
+                    # throughput go to the audit log
+                    if clock.monotonic() - last_stats_time >= MATCH_STATS_INTERVAL:
+                        last_stats_time = clock.monotonic()
+                        self.audit_log.log("match_stats", **self.face_recognizer.match_stats())
+                        stage_stats = self.pipeline.stats()
+                        self.audit_log.log("pipeline_stats", bottleneck=self.pipeline.bottleneck(stage_stats),
+                                           stages=stage_stats)
+                        
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[UI] Error in face recognition loop: {str(e)}")
+                    traceback.print_exc()
+                    await asyncio.sleep(1)  # Wait a bit before trying again
                     
-            except Exception as e:
-                print(f"[UI] Error in face recognition loop: {str(e)}")
-                traceback.print_exc()
-                time.sleep(1)  # Wait a bit before trying again
-                
-            # Force garbage collection occasionally
-            if random.random() < 0.05:  # ~5% chance each iteration
-                gc.collect()
-                
-        print("[UI] Face recognition thread stopped")
+                # Force garbage collection occasionally
+                if random.random() < 0.05:  # ~5% chance each iteration
+                    gc.collect()
+        finally:
+            self.recognition_idle.set()
+            self.pipeline.stop()
+            print("[UI] Face recognition task stopped")
+
+    def _on_frame(self, seq):
+        """Frame-available callback (camera thread): wake the recognition task and a parked display"""
+        self.frame_signal.notify(seq)
+        if self.frame_pacer.waiting_for_frame:
+            self.tk_bridge.call(self.frame_pacer.frame_ready)
 
     def trigger_deletion_glitch(self, name):
         """Visually glitch the screen and show an ominous message"""
@@ -0,0 +1,144 @@
+# user_index_module.py
+import os
+import pickle
+import bisect
+import traceback
+from collections import Counter
+from config import ENCODINGS_FILE
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+
+def index_path(encodings_file=ENCODINGS_FILE):
+    return encodings_file + INDEX_SUFFIX
+
+
+def atomic_pickle_dump(data, path):
+    """
+    Write a pickle so that readers only ever see the old or the new file
+
+    :param data: Object to pickle
+    :param path: Destination path
+    """
+    temp_file = path + ".tmp"
+    with open(temp_file, "wb") as f:
+        pickle.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+class UserIndex:
+    def __init__(self, names, counts):
+        """
+        Sorted list of identities with their template counts.
+        Small enough to load in full even for very large galleries; the
+        encodings themselves are never touched.
+
+        :param names: Identity names, sorted
+        :param counts: Number of templates per identity, parallel to names
+        """
+        self.names = names
+        self.counts = counts
+
+    @classmethod
+    def from_names(cls, template_names):
+        """Build from the per-template name list of an encodings file"""
+        counter = Counter(name.lower() for name in template_names)
+        names = sorted(counter)
+        return cls(names, [counter[name] for name in names])
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def template_count(self):
+        return sum(self.counts)
+
+    def __contains__(self, name):
+        i = bisect.bisect_left(self.names, name)
+        return i < len(self.names) and self.names[i] == name
+
+    def rows(self, start=0, stop=None):
+        """Yield (name, template count) in name order"""
+        stop = len(self.names) if stop is None else min(stop, len(self.names))
+        for i in range(start, stop):
+            yield self.names[i], self.counts[i]
+
+    def prefix_range(self, prefix):
+        """(start, stop) positions of the names starting with prefix"""
+        start = bisect.bisect_left(self.names, prefix)
+        stop = bisect.bisect_left(self.names, prefix + "\uffff")
+        return start, stop
+
+    def search(self, term, contains=False):
+        """
+        Yield (name, template count) for matching identities
+
+        :param term: Text to look for (case-insensitive)
+        :param contains: Match anywhere in the name instead of only as a prefix
+        """
+        term = term.lower()
+        if not contains:
+            yield from self.rows(*self.prefix_range(term))
+            return
+        for row in self.rows():
+            if term in row[0]:
+                yield row
+
+    def state(self):
+        return {"version": INDEX_VERSION, "names": self.names, "counts": self.counts}
+
+
+def write_user_index(template_names, encodings_file=ENCODINGS_FILE):
+    """Write the index next to the encodings file (called whenever it is saved)"""
+    try:
+        atomic_pickle_dump(UserIndex.from_names(template_names).state(), index_path(encodings_file))
+    except Exception as e:
+        print(f"Error writing user index: {e}")
+
+
+def load_user_index(encodings_file=ENCODINGS_FILE):
+    """
+    Load the user index, rebuilding it if it is missing or older than the encodings
+
+    :param encodings_file: Path to the encodings file
+    :return: UserIndex (empty if there is no gallery)
+    """
+    path = index_path(encodings_file)
+    if not os.path.exists(encodings_file):
+        return UserIndex([], [])
+
+    try:
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(encodings_file):
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("version") == INDEX_VERSION:
+                return UserIndex(state["names"], state["counts"])
+    except Exception as e:
+        print(f"Error reading user index, rebuilding: {e}")
+
+    # Fall back to the full encodings file once and cache the result
+    try:
+        with open(encodings_file, "rb") as f:
+            data = pickle.load(f)
+    except Exception as e:
+        print(f"Error loading {encodings_file}: {e}")
+        traceback.print_exc()
+        return UserIndex([], [])
+
+    if isinstance(data, tuple) and len(data) == 2:
+        template_names = data[1]
+    elif isinstance(data, dict):
+        template_names = data.get("names", [])
+    else:
+        template_names = []
+    del data
+
+    index = UserIndex.from_names(template_names)
+    try:
+        atomic_pickle_dump(index.state(), path)
+    except OSError as e:
+        print(f"Could not cache user index: {e}")
+    return index
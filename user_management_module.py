@@ -1,66 +1,264 @@
+import os
+import sys
+import csv
+import json
 import pickle
+import argparse
 import traceback
-from config import ENCODINGS_FILE, LOCKERS_FILE
+from collections import Counter
+from config import ENCODINGS_FILE, LOCKERS_FILE, TOTAL_LOCKERS
+from user_index_module import load_user_index, atomic_pickle_dump
+
+# Rows printed per page by list/search unless --limit is given
+PAGE_SIZE = 50
 
 def load_data(file_path):
     """Safely load a pickled file"""
     try:
         with open(file_path, "rb") as f:
             return pickle.load(f)
+    except FileNotFoundError:
+        return {}
     except Exception as e:
         print(f"Error loading {file_path}: {e}")
         traceback.print_exc()
         return {}
 
-def display_users():
-    print("=== User Management (CLI) ===\n")
+def load_lockers(lockers_file=LOCKERS_FILE):
+    """Locker assignments keyed by lowercase name"""
+    lockers = load_data(lockers_file)
+    if not isinstance(lockers, dict):
+        return {}
+    return {name.lower(): data for name, data in lockers.items()}
+
+def user_rows(rows, lockers):
+    """Yield one dict per identity, joined with its locker assignment"""
+    for name, templates in rows:
+        locker_info = lockers.get(name)
+        yield {
+            "name": name,
+            "templates": templates,
+            "locker": locker_info.get("locker") if locker_info else None,
+            "gpio": locker_info.get("gpio") if locker_info else None,
+        }
 
-    # Load face recognition data
-    face_data = load_data(ENCODINGS_FILE)
-    known_names = face_data.get("names", []) if isinstance(face_data, dict) else []
+def find_orphans(index, lockers):
+    """Locker assignments whose user no longer has a face entry"""
+    return sorted(name for name in lockers if name not in index)
 
-    # Load locker assignments
-    lockers = load_data(LOCKERS_FILE)
+def format_row(row, status=None):
+    locker_num = str(row["locker"]) if row["locker"] is not None else "Not Assigned"
+    if status is None:
+        status = "Available" if row["locker"] is not None else "No Locker"
+    return (f"Name: {row['name'].title():<20} | Templates: {row['templates']:<3} | "
+            f"Locker #: {locker_num:<12} | Status: {status}")
 
-    all_usernames = set(name.lower() for name in known_names)
-    all_locker_users = set(lockers.keys())
+def print_page(rows, offset, limit, total):
+    """Print one page of rows and a hint for the next page"""
+    shown = 0
+    for row in rows:
+        print(format_row(row))
+        shown += 1
+    if shown == 0:
+        print("No users found.")
+    elif limit and offset + shown < total:
+        print(f"\n-- {offset + 1}-{offset + shown} of {total}; next page: --offset {offset + shown} --")
 
-    # Display users with known faces
-    for name in sorted(all_usernames):
-        locker_info = lockers.get(name)
-        locker_num = str(locker_info.get("locker")) if locker_info else "Not Assigned"
-        status = "Available" if locker_info else "No Locker"
-        print(f"Name: {name.title():<20} | Locker #: {locker_num:<10} | Status: {status}")
-
-    # Display orphaned lockers (users who no longer have a face entry)
-    orphans = all_locker_users - all_usernames
-    if orphans:
-        print("\n--- Orphaned Locker Assignments (No Face Found) ---")
-        for name in sorted(orphans):
-            locker_info = lockers[name]
-            locker_num = str(locker_info.get("locker", "???"))
-            print(f"Name: {name.title():<20} | Locker #: {locker_num:<10} | Status: Orphaned")
+def display_users(offset=0, limit=PAGE_SIZE):
+    """List users with their lockers, one page at a time"""
+    index = load_user_index(ENCODINGS_FILE)
+    lockers = load_lockers()
+    stop = offset + limit if limit else None
+    print_page(user_rows(index.rows(offset, stop), lockers), offset, limit, len(index))
+
+def search_users(term, contains=False, offset=0, limit=PAGE_SIZE):
+    """List users whose name starts with (or contains) term"""
+    index = load_user_index(ENCODINGS_FILE)
+    lockers = load_lockers()
+    if contains:
+        matches = list(index.search(term, contains=True))
+        total = len(matches)
+        rows = matches[offset:offset + limit if limit else None]
+    else:
+        start, stop = index.prefix_range(term.lower())
+        total = stop - start
+        rows = index.rows(start + offset, min(stop, start + offset + limit) if limit else stop)
+    print_page(user_rows(rows, lockers), offset, limit, total)
+
+def display_stats():
+    index = load_user_index(ENCODINGS_FILE)
+    lockers = load_lockers()
+    orphans = find_orphans(index, lockers)
+    assigned = len(lockers) - len(orphans)
+
+    print("=== User Management Stats ===")
+    print(f"Identities:        {len(index)}")
+    print(f"Templates:         {index.template_count}")
+    if len(index):
+        print(f"Templates/person:  {index.template_count / len(index):.2f} average")
+        for templates, people in sorted(Counter(index.counts).items()):
+            print(f"  {templates} template(s): {people}")
+    print(f"Lockers assigned:  {assigned} of {TOTAL_LOCKERS}")
+    print(f"Users w/o locker:  {len(index) - assigned}")
+    print(f"Orphaned lockers:  {len(orphans)}")
+    for path in (ENCODINGS_FILE, LOCKERS_FILE):
+        if os.path.exists(path):
+            print(f"{path + ':':<19}{os.path.getsize(path)} bytes")
+
+def display_orphans():
+    index = load_user_index(ENCODINGS_FILE)
+    lockers = load_lockers()
+    orphans = find_orphans(index, lockers)
+    if not orphans:
+        print("No orphaned locker assignments.")
+        return
+    print("--- Orphaned Locker Assignments (No Face Found) ---")
+    for name in orphans:
+        locker_num = str(lockers[name].get("locker", "???"))
+        print(f"Name: {name.title():<20} | Locker #: {locker_num:<10} | Status: Orphaned")
 
 def remove_orphaned_lockers():
-    face_data = load_data(ENCODINGS_FILE)
-    known_names = set(name.lower() for name in face_data.get("names", []))
+    """
+    Drop locker assignments without a face entry.
 
-    lockers = load_data(LOCKERS_FILE)
+    The lockers file is re-read right before writing and replaced
+    atomically, so a concurrent reader never sees a partial file.
+    """
+    index = load_user_index(ENCODINGS_FILE)
+    lockers = load_lockers()
 
     # Only keep lockers for users still present in face data (normalized)
-    updated_lockers = {
-        name: data for name, data in lockers.items()
-        if name.lower() in known_names
-    }
+    updated_lockers = {name: data for name, data in lockers.items() if name in index}
+    removed = len(lockers) - len(updated_lockers)
+    if not removed:
+        print("No orphaned lockers to remove.")
+        return 0
+
+    atomic_pickle_dump(updated_lockers, LOCKERS_FILE)
+    print(f"✅ {removed} orphaned locker(s) removed.")
+    return removed
+
+def export_users(output, fmt="csv"):
+    """
+    Stream every user to a CSV or JSON file (or stdout) row by row
+
+    :param output: Open text file
+    :param fmt: "csv" or "json"
+    """
+    index = load_user_index(ENCODINGS_FILE)
+    rows = user_rows(index.rows(), load_lockers())
+    fields = ["name", "templates", "locker", "gpio"]
+
+    if fmt == "csv":
+        writer = csv.DictWriter(output, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+        return
+
+    # A JSON array written element by element, never built in memory
+    output.write("[")
+    for i, row in enumerate(rows):
+        output.write(",\n " if i else "\n ")
+        json.dump(row, output)
+    output.write("\n]\n")
 
-    with open(LOCKERS_FILE, "wb") as f:
-        pickle.dump(updated_lockers, f)
+def display_collision_report(limit=20):
+    """Scan the whole gallery for identities that are close to each other"""
+    # Imported here so the other commands work without the gallery stack
+    from face_recognition_module import FaceRecognitionManager
+    from gallery_module import scan_collisions
 
-    print("✅ Orphaned lockers removed.")
+    print("=== Gallery Collision Report ===\n")
+    manager = FaceRecognitionManager(ENCODINGS_FILE, shards=0)
+    if len(manager.index.names) < 2:
+        print("Need at least two identities to compare.")
+        return
+
+    report = scan_collisions(manager.index)
+    dangerous = report.dangerous_pairs()
+    print(f"{len(report.names)} identities, {manager.index.template_count} templates")
+    print(f"Near-collisions (closer than {report.threshold / report.margin:.3f}): {len(report.pairs)}, "
+          f"within the match threshold ({report.threshold}): {len(dangerous)}")
+
+    if report.pairs:
+        print("\n--- Closest Pairs ---")
+        for name_a, name_b, distance in report.pairs[:limit]:
+            flag = "CONFUSABLE" if distance < report.threshold else "close"
+            print(f"{name_a.title():<20} | {name_b.title():<20} | {distance:.3f} | {flag}")
+
+    recommended = report.recommended_thresholds()
+    crowded = sorted((name for name in report.names if recommended[name] < report.threshold),
+                     key=recommended.get)
+    if crowded:
+        print("\n--- Recommended Per-Identity Thresholds ---")
+        for name in crowded[:limit]:
+            i = report.names.index(name)
+            print(f"Name: {name.title():<20} | Threshold: {recommended[name]:.3f} | "
+                  f"Nearest: {report.nearest_names[i].title()} ({report.nearest[i]:.3f})")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Locker system user management")
+    commands = parser.add_subparsers(dest="command")
+
+    def add_paging(command):
+        command.add_argument("--offset", type=int, default=0, help="Skip this many users")
+        command.add_argument("--limit", type=int, default=PAGE_SIZE,
+                             help=f"Users per page, 0 for all (default {PAGE_SIZE})")
+
+    add_paging(commands.add_parser("list", help="List users and their lockers"))
+
+    search = commands.add_parser("search", help="Find users by name")
+    search.add_argument("term", help="Name prefix to look for")
+    search.add_argument("--contains", action="store_true", help="Match anywhere in the name")
+    add_paging(search)
+
+    commands.add_parser("stats", help="Gallery and locker totals")
+
+    orphans = commands.add_parser("orphans", help="Locker assignments without a face entry")
+    orphans.add_argument("--remove", action="store_true", help="Remove them (atomic rewrite)")
+
+    export = commands.add_parser("export", help="Export all users")
+    export.add_argument("--format", choices=["csv", "json"], default="csv")
+    export.add_argument("--output", "-o", help="Output file (default: stdout)")
+
+    collisions = commands.add_parser("collisions", help="Report identities that are close to each other")
+    collisions.add_argument("--limit", type=int, default=20, help="Rows per section")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    command = args.command or "list"
+
+    if command == "list":
+        display_users(getattr(args, "offset", 0), getattr(args, "limit", PAGE_SIZE))
+    elif command == "search":
+        search_users(args.term, args.contains, args.offset, args.limit)
+    elif command == "stats":
+        display_stats()
+    elif command == "orphans":
+        if args.remove:
+            remove_orphaned_lockers()
+        else:
+            display_orphans()
+    elif command == "export":
+        if args.output:
+            temp_file = args.output + ".tmp"
+            with open(temp_file, "w", newline="") as f:
+                export_users(f, args.format)
+            os.replace(temp_file, args.output)
+            print(f"Exported users to {args.output}")
+        else:
+            export_users(sys.stdout, args.format)
+    elif command == "collisions":
+        display_collision_report(args.limit)
+    return 0
 
 
 if __name__ == "__main__":
-    display_users()
-    answer = input("Remove orphan lockers? y/n: ")
-    if answer == "y":
-        remove_orphaned_lockers()
+    try:
+        sys.exit(main())
+    except BrokenPipeError:
+        # Output piped into head/less that exited early
+        sys.stderr.close()
+        sys.exit(0)